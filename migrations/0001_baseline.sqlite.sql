@@ -0,0 +1,112 @@
+-- =================================================================
+-- 0001 BASELINE - Schema Natalia v2.0 (SQLite, fallback local)
+-- Equivale al antiguo init_tables() + bucle de ALTER por arranque.
+-- Los ADD COLUMN que ya existan se ignoran (bases locales antiguas).
+-- =================================================================
+
+CREATE TABLE IF NOT EXISTS business_knowledge (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    slug TEXT UNIQUE NOT NULL,
+    category TEXT NOT NULL, -- 'pricing', 'bio', 'location', 'policy'
+    content TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_slug ON business_knowledge(slug);
+
+CREATE TABLE IF NOT EXISTS visitors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    external_id TEXT,
+    fbclid TEXT,
+    ip_address TEXT,
+    user_agent TEXT,
+    source TEXT,
+    utm_source TEXT,
+    utm_medium TEXT,
+    utm_campaign TEXT,
+    utm_term TEXT,
+    utm_content TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_visitors_external_id ON visitors(external_id);
+
+CREATE TABLE IF NOT EXISTS contacts (
+    id TEXT PRIMARY KEY,
+    whatsapp_number TEXT UNIQUE NOT NULL,
+    full_name TEXT,
+
+    fb_click_id TEXT,
+    utm_source TEXT,
+    utm_medium TEXT,
+    utm_campaign TEXT,
+    web_visit_count INTEGER DEFAULT 1,
+    conversion_sent_to_meta BOOLEAN DEFAULT FALSE,
+
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_interaction TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE contacts ADD COLUMN profile_pic_url TEXT;
+ALTER TABLE contacts ADD COLUMN fb_browser_id TEXT;
+ALTER TABLE contacts ADD COLUMN utm_term TEXT;
+ALTER TABLE contacts ADD COLUMN utm_content TEXT;
+ALTER TABLE contacts ADD COLUMN status TEXT DEFAULT 'new';
+ALTER TABLE contacts ADD COLUMN lead_score INTEGER DEFAULT 50;
+ALTER TABLE contacts ADD COLUMN pain_point TEXT;
+ALTER TABLE contacts ADD COLUMN service_interest TEXT;
+ALTER TABLE contacts ADD COLUMN service_booked_date TIMESTAMP;
+ALTER TABLE contacts ADD COLUMN appointment_count INTEGER DEFAULT 0;
+ALTER TABLE contacts ADD COLUMN updated_at TIMESTAMP;
+ALTER TABLE contacts ADD COLUMN onboarding_step TEXT;
+ALTER TABLE contacts ADD COLUMN is_admin BOOLEAN DEFAULT FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_contacts_whatsapp ON contacts(whatsapp_number);
+CREATE INDEX IF NOT EXISTS idx_contacts_status ON contacts(status);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    contact_id TEXT,
+    role TEXT CHECK (role IN ('user', 'assistant', 'system', 'tool')),
+    content TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (contact_id) REFERENCES contacts(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_messages_contact_id ON messages(contact_id);
+
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    contact_id TEXT,
+    appointment_date TIMESTAMP NOT NULL,
+    service_type TEXT,
+    status TEXT DEFAULT 'pending',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (contact_id) REFERENCES contacts(id)
+);
+
+CREATE TABLE IF NOT EXISTS leads (
+    id TEXT PRIMARY KEY,
+    whatsapp_phone TEXT UNIQUE NOT NULL,
+    meta_lead_id TEXT,
+    click_id TEXT, -- fbclid
+    email TEXT,
+    name TEXT,
+    conversion_status TEXT DEFAULT 'NEW',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_interaction TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_leads_phone ON leads(whatsapp_phone);
+CREATE INDEX IF NOT EXISTS idx_leads_meta_id ON leads(meta_lead_id);
+
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    lead_id TEXT,
+    role TEXT NOT NULL, -- 'user', 'system', 'assistant'
+    content TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (lead_id) REFERENCES leads(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_interactions_lead_id ON interactions(lead_id);
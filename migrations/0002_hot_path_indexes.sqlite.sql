@@ -0,0 +1,20 @@
+-- =================================================================
+-- 0002 HOT PATH INDEXES (SQLite)
+-- Mismo set que la variante PostgreSQL. SQLite no tiene INCLUDE:
+-- las columnas cubiertas van al final de la clave.
+-- =================================================================
+
+-- SELECT_FBCLID_BY_EXTERNAL_ID
+CREATE INDEX IF NOT EXISTS idx_visitors_external_fbclid
+    ON visitors (external_id, timestamp DESC, fbclid)
+    WHERE fbclid IS NOT NULL;
+
+-- SELECT_RECENT_VISITORS (id es el rowid: ya está en el índice)
+CREATE INDEX IF NOT EXISTS idx_visitors_timestamp
+    ON visitors (timestamp DESC, external_id, source, ip_address);
+
+-- SELECT_CHAT_HISTORY / COUNT_USER_MESSAGES
+CREATE INDEX IF NOT EXISTS idx_messages_contact_created
+    ON messages (contact_id, created_at DESC, role);
+
+DROP INDEX IF EXISTS idx_messages_contact_id;
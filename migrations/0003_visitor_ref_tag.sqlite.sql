@@ -0,0 +1,9 @@
+-- =================================================================
+-- 0003 VISITOR REF TAG (SQLite)
+-- Ver variante PostgreSQL.
+-- =================================================================
+
+ALTER TABLE visitors ADD COLUMN ref_tag TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_visitors_ref_tag
+    ON visitors (ref_tag, timestamp DESC);
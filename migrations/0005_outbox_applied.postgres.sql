@@ -0,0 +1,14 @@
+-- =================================================================
+-- 0005 OUTBOX APPLIED (PostgreSQL)
+-- Claves de idempotencia de las escrituras reaplicadas desde la outbox
+-- local (app/outbox.py). Se insertan en la misma transacción que la
+-- escritura: un replay repetido no duplica filas.
+-- La retención purga las claves viejas (OUTBOX_APPLIED_RETENTION_DAYS).
+-- =================================================================
+
+CREATE TABLE IF NOT EXISTS outbox_applied (
+    idempotency_key TEXT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_applied_at ON outbox_applied (applied_at);
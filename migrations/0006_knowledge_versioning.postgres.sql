@@ -0,0 +1,50 @@
+-- =================================================================
+-- 0006 KNOWLEDGE VERSIONING (PostgreSQL)
+-- agent_prompts entra al schema versionado (antes se creaba a mano) y
+-- ambas tablas del conocimiento de Natalia avisan sus cambios:
+-- - updated_at se mantiene por trigger (watermark para el poll)
+-- - NOTIFY knowledge_changed invalida los cachés de los demás workers
+-- =================================================================
+
+CREATE TABLE IF NOT EXISTS agent_prompts (
+    role_id TEXT PRIMARY KEY,
+    system_prompt TEXT NOT NULL,
+    is_active BOOLEAN DEFAULT TRUE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE agent_prompts ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_knowledge_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('knowledge_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_agent_prompts_touch ON agent_prompts;
+CREATE TRIGGER trg_agent_prompts_touch
+    BEFORE UPDATE ON agent_prompts
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_business_knowledge_touch ON business_knowledge;
+CREATE TRIGGER trg_business_knowledge_touch
+    BEFORE UPDATE ON business_knowledge
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_agent_prompts_notify ON agent_prompts;
+CREATE TRIGGER trg_agent_prompts_notify
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON agent_prompts
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_knowledge_changed();
+
+DROP TRIGGER IF EXISTS trg_business_knowledge_notify ON business_knowledge;
+CREATE TRIGGER trg_business_knowledge_notify
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON business_knowledge
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_knowledge_changed();
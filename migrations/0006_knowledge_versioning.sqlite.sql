@@ -0,0 +1,26 @@
+-- =================================================================
+-- 0006 KNOWLEDGE VERSIONING (SQLite)
+-- agent_prompts en el schema local + updated_at mantenido por trigger
+-- (watermark que usan los cachés de conocimiento para invalidarse).
+-- =================================================================
+
+CREATE TABLE IF NOT EXISTS agent_prompts (
+    role_id TEXT PRIMARY KEY,
+    system_prompt TEXT NOT NULL,
+    is_active BOOLEAN DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_business_knowledge_touch
+AFTER UPDATE OF slug, category, content ON business_knowledge
+FOR EACH ROW
+BEGIN
+    UPDATE business_knowledge SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_agent_prompts_touch
+AFTER UPDATE OF system_prompt, is_active ON agent_prompts
+FOR EACH ROW
+BEGIN
+    UPDATE agent_prompts SET updated_at = CURRENT_TIMESTAMP WHERE role_id = NEW.role_id;
+END;
@@ -0,0 +1,121 @@
+-- =================================================================
+-- 0008 CONVERSATION EVENTS (SQLite)
+-- Ver variante PostgreSQL.
+-- =================================================================
+
+ALTER TABLE contacts ADD COLUMN last_event_seq INTEGER NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS conversation_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    contact_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT,
+    external_message_id TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (contact_id) REFERENCES contacts(id) ON DELETE CASCADE
+);
+
+-- 0. Contactos antiguos creados con id NULL
+UPDATE contacts SET id = lower(hex(randomblob(16))) WHERE id IS NULL;
+
+-- 1. Contactos para los leads que solo tenían interactions
+INSERT INTO contacts (id, whatsapp_number, status)
+SELECT lower(hex(randomblob(16))), l.whatsapp_phone, 'new'
+FROM (
+    SELECT DISTINCT l.whatsapp_phone
+    FROM interactions i
+    JOIN leads l ON l.id = i.lead_id
+) l
+WHERE true
+ON CONFLICT (whatsapp_number) DO NOTHING;
+
+-- 2. Historial: messages completo + interactions que no estaban duplicadas en messages
+--    (mismo rol y contenido escritos en el mismo turno: ±10 s; un "ok" repetido
+--    más tarde es otro turno y se conserva)
+INSERT INTO conversation_events (contact_id, seq, role, content, created_at)
+SELECT
+    contact_id,
+    ROW_NUMBER() OVER (PARTITION BY contact_id ORDER BY created_at, source, source_id),
+    role,
+    content,
+    created_at
+FROM (
+    SELECT m.contact_id, m.role, m.content, m.created_at, 0 AS source, m.rowid AS source_id
+    FROM messages m
+    WHERE m.contact_id IS NOT NULL
+    UNION ALL
+    SELECT c.id, i.role, i.content, i.timestamp, 1, i.id
+    FROM interactions i
+    JOIN leads l ON l.id = i.lead_id
+    JOIN contacts c ON c.whatsapp_number = l.whatsapp_phone
+    WHERE NOT EXISTS (
+        SELECT 1 FROM messages m
+        WHERE m.contact_id = c.id AND m.role = i.role AND m.content IS i.content
+          AND ABS(julianday(m.created_at) - julianday(i.timestamp)) * 86400 <= 10
+    )
+) legacy;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_conversation_events_contact_seq
+    ON conversation_events (contact_id, seq);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_conversation_events_external_id
+    ON conversation_events (external_message_id)
+    WHERE external_message_id IS NOT NULL;
+
+-- 3. Secuencia y contadores (0007) recalculados desde el log unificado
+UPDATE contacts SET
+    last_event_seq = (
+        SELECT COALESCE(MAX(seq), 0) FROM conversation_events e WHERE e.contact_id = contacts.id
+    ),
+    user_message_count = (
+        SELECT COUNT(*) FROM conversation_events e WHERE e.contact_id = contacts.id AND e.role = 'user'
+    ),
+    assistant_message_count = (
+        SELECT COUNT(*) FROM conversation_events e WHERE e.contact_id = contacts.id AND e.role = 'assistant'
+    ),
+    last_user_message_at = (
+        SELECT MAX(created_at) FROM conversation_events e WHERE e.contact_id = contacts.id AND e.role = 'user'
+    );
+
+-- 4. Tablas viejas apartadas (sin los triggers de 0007) -> vistas de solo lectura
+DROP TRIGGER IF EXISTS trg_messages_count_insert;
+DROP TRIGGER IF EXISTS trg_messages_count_delete;
+ALTER TABLE messages RENAME TO messages_legacy;
+ALTER TABLE interactions RENAME TO interactions_legacy;
+
+CREATE VIEW messages AS
+SELECT id, contact_id, role, content, created_at
+FROM conversation_events;
+
+CREATE VIEW interactions AS
+SELECT e.id, l.id AS lead_id, e.role, e.content, e.created_at AS timestamp
+FROM conversation_events e
+JOIN contacts c ON c.id = e.contact_id
+JOIN leads l ON l.whatsapp_phone = c.whatsapp_number;
+
+-- 5. Contadores de 0007 ahora sobre el log
+CREATE TRIGGER IF NOT EXISTS trg_conversation_events_count_insert
+AFTER INSERT ON conversation_events
+FOR EACH ROW WHEN NEW.role IN ('user', 'assistant')
+BEGIN
+    UPDATE contacts SET
+        user_message_count = user_message_count + (NEW.role = 'user'),
+        assistant_message_count = assistant_message_count + (NEW.role = 'assistant'),
+        last_user_message_at = CASE
+            WHEN NEW.role = 'user' AND (last_user_message_at IS NULL OR NEW.created_at > last_user_message_at)
+            THEN NEW.created_at
+            ELSE last_user_message_at
+        END
+    WHERE id = NEW.contact_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_conversation_events_count_delete
+AFTER DELETE ON conversation_events
+FOR EACH ROW WHEN OLD.role IN ('user', 'assistant')
+BEGIN
+    UPDATE contacts SET
+        user_message_count = MAX(user_message_count - (OLD.role = 'user'), 0),
+        assistant_message_count = MAX(assistant_message_count - (OLD.role = 'assistant'), 0)
+    WHERE id = OLD.contact_id;
+END;
@@ -51,11 +51,11 @@ class SalesAgent(BaseAgent):
         Executes the Segmentation Engine from .agent/skills
         Doctoral Level: Queries the database for actual metrics.
         """
-        from app.database import get_cursor
+        from app.database import get_read_cursor
         import app.sql_queries as queries
         
         try:
-            with get_cursor() as cur:
+            with get_read_cursor(self.phone) as cur:
                 cur.execute(queries.GET_SALES_FORECAST, (self.phone,))
                 row = cur.fetchone()
                 if row:
@@ -0,0 +1,591 @@
+# =================================================================
+# ASYNC_DATABASE.PY - Capa de Datos Nativa asyncio (Natalia Brain)
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# Contraparte async de app.database para el camino caliente del chat:
+# - PostgreSQL: asyncpg con pool propio (sin saltos a hilos)
+# - Local: aiosqlite sobre el mismo archivo que app.database
+#
+# Reutiliza las queries de app.sql_queries (placeholders %s), que se
+# traducen una sola vez por sentencia al dialecto del driver.
+# =================================================================
+import asyncio
+import logging
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Optional, List, Dict, Any
+
+from app.config import settings
+from app import metrics, database
+import app.sql_queries as queries
+from app.sqlite_backend import PRAGMAS, translate_sql
+from app.circuit_breaker import db_breaker, backoff_delay, CircuitOpenError
+from app.cache import (
+    contact_ids, invalidate_contact_id,
+    knowledge, knowledge_version, invalidate_knowledge, chat_histories,
+)
+
+try:
+    import asyncpg
+    HAS_ASYNCPG = True
+except ImportError:
+    HAS_ASYNCPG = False
+
+try:
+    import aiosqlite
+    HAS_AIOSQLITE = True
+except ImportError:
+    HAS_AIOSQLITE = False
+
+logger = logging.getLogger(__name__)
+
+# Pool Global (asyncpg)
+_pool: Optional[Any] = None
+
+# Conexión local persistente (aiosqlite) + lock: una transacción a la vez
+_sqlite_conn: Optional[Any] = None
+_sqlite_lock: Optional[asyncio.Lock] = None
+
+# Tipo de Backend Activo
+BACKEND = "sqlite"  # 'postgres' o 'sqlite'
+
+_PLACEHOLDER = re.compile(r"%s")
+
+
+@lru_cache(maxsize=256)
+def _to_asyncpg(sql: str) -> str:
+    """%s -> $1, $2, ... (asyncpg usa placeholders numerados)"""
+    counter = iter(range(1, 10_000))
+    return _PLACEHOLDER.sub(lambda _: f"${next(counter)}", sql)
+
+
+def _postgres_dsn() -> str:
+    dsn = settings.DATABASE_URL
+    if "sslmode=" not in dsn:
+        dsn += ("&" if "?" in dsn else "?") + "sslmode=require"
+    return dsn
+
+
+async def init_async_pool() -> bool:
+    """Inicializa el pool async (Nube o Local)"""
+    global _pool, BACKEND
+
+    # 1. Intentar PostgreSQL (asyncpg)
+    if settings.DATABASE_URL and HAS_ASYNCPG:
+        try:
+            dsn = _postgres_dsn()
+            _pool = await asyncpg.create_pool(
+                dsn=dsn,
+                min_size=settings.ASYNC_DB_POOL_MIN_SIZE,
+                max_size=settings.ASYNC_DB_POOL_MAX_SIZE,
+                # Supabase Pooler (pgbouncer, puerto 6543) no soporta prepared statements
+                statement_cache_size=0 if ":6543" in dsn else 100,
+                max_inactive_connection_lifetime=300.0
+            )
+            BACKEND = "postgres"
+            logger.info("✅ Pool async PostgreSQL (asyncpg) ESTABLECIDO")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Falló pool async PostgreSQL: {e}")
+
+    # 2. Fallback a SQLite (aiosqlite)
+    BACKEND = "sqlite"
+    if not HAS_AIOSQLITE:
+        logger.error("❌ aiosqlite no instalado: capa async sin backend local")
+        return False
+    logger.info("⚠️ Capa async usando SQLite (Local Fallback)")
+    return True
+
+
+async def close_async_pool():
+    """Cierra el pool async (shutdown)"""
+    global _pool, _sqlite_conn
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+    if _sqlite_conn is not None:
+        await _sqlite_conn.close()
+        _sqlite_conn = None
+
+
+def _collect_gauges():
+    """Gauges del pool asyncpg para GET /metrics"""
+    if _pool is None:
+        return {}
+    return {"async_db_pool_size": _pool.get_size(), "async_db_pool_idle": _pool.get_idle_size()}
+
+metrics.register_gauges(_collect_gauges)
+
+
+async def _get_sqlite_conn():
+    """Conexión aiosqlite de larga vida (WAL, mismos pragmas que app.database)"""
+    global _sqlite_conn, _sqlite_lock
+    if _sqlite_lock is None:
+        _sqlite_lock = asyncio.Lock()
+    if _sqlite_conn is None:
+        from app.database import get_sqlite_path
+        conn = await aiosqlite.connect(get_sqlite_path())
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        _sqlite_conn = conn
+    return _sqlite_conn
+
+
+class AsyncCursor:
+    """
+    Cursor mínimo con la misma forma que el de app.database:
+    execute / fetchone / fetchall, pero awaitables.
+    """
+
+    def __init__(self, conn, dialect: str):
+        self._conn = conn
+        self._dialect = dialect
+        self._rows: List[Any] = []
+        self._cursor = None
+        self.rowcount = -1
+
+    async def execute(self, sql: str, params=None):
+        params = tuple(params or ())
+        label = metrics.query_label(sql)
+        with metrics.time_query(label, self._dialect):
+            if self._dialect == "postgres":
+                self._rows = await self._conn.fetch(_to_asyncpg(sql), *params)
+                rows = len(self._rows)
+            else:
+                self._cursor = await self._conn.execute(translate_sql(sql) if params else sql, params)
+                rows = self._cursor.rowcount
+        self.rowcount = rows
+        if rows >= 0:
+            metrics.DB_QUERY_ROWS.observe(rows, query=label)
+
+    async def fetchone(self):
+        if self._dialect == "postgres":
+            return self._rows[0] if self._rows else None
+        return await self._cursor.fetchone()
+
+    async def fetchall(self):
+        if self._dialect == "postgres":
+            return list(self._rows)
+        return await self._cursor.fetchall()
+
+
+def _is_connection_error(error: Exception) -> bool:
+    """Fallo de red/servidor (cuenta para el breaker) vs error de la query"""
+    if isinstance(error, (OSError, asyncio.TimeoutError)):
+        return True
+    return HAS_ASYNCPG and isinstance(
+        error, (asyncpg.PostgresConnectionError, asyncpg.InterfaceError)
+    )
+
+
+async def _outbox_write(operation: str, payload: Any, error: Exception) -> bool:
+    """Caída de PostgreSQL: la escritura va a la outbox local compartida con la capa sync"""
+    if BACKEND != "postgres" or not (isinstance(error, CircuitOpenError) or _is_connection_error(error)):
+        return False
+    if not await asyncio.to_thread(database.enqueue_outbox, operation, payload):
+        return False
+    logger.warning(f"📮 PostgreSQL no disponible: '{operation}' guardado en outbox local ({error})")
+    return True
+
+
+async def _acquire_async_connection():
+    """
+    Checkout del pool asyncpg con el mismo breaker que la capa sync.
+    Los reintentos esperan con asyncio.sleep (backoff + jitter): el loop sigue libre.
+    """
+    db_breaker.before_call()
+    max_retries = 3
+    last_error = None
+
+    for attempt in range(max_retries):
+        try:
+            return await _pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Pool saturado: reintentar solo alarga la cola
+            logger.error("❌ Pool async agotado")
+            raise
+        except Exception as e:
+            last_error = e
+            logger.error(f"❌ Error DB async (Attempt {attempt+1}/{max_retries}): {e}")
+            if attempt < max_retries - 1:
+                metrics.DB_CHECKOUT_RETRIES.inc()
+                await asyncio.sleep(backoff_delay(attempt))
+
+    db_breaker.record_failure()
+    raise last_error
+
+
+@asynccontextmanager
+async def get_async_cursor():
+    """
+    Cursor transaccional async: Commit al salir, Rollback si el bloque falla.
+    Nunca bloquea el event loop; con el breaker abierto falla al instante.
+    """
+    outcome = "commit"
+    if BACKEND == "postgres":
+        if _pool is None:
+            raise Exception("Async Postgres Pool not initialized")
+        requested = time.perf_counter()
+        conn = await _acquire_async_connection()
+        started = time.perf_counter()
+        metrics.DB_POOL_WAIT_SECONDS.observe(started - requested, backend="postgres")
+        try:
+            async with conn.transaction():
+                yield AsyncCursor(conn, "postgres")
+            db_breaker.record_success()
+        except Exception as e:
+            outcome = "rollback"
+            if _is_connection_error(e):
+                db_breaker.record_failure()
+            else:
+                db_breaker.record_success()  # La BD respondió (error de la query)
+            raise
+        finally:
+            await _pool.release(conn)
+            metrics.DB_TRANSACTION_SECONDS.observe(
+                time.perf_counter() - started, backend="postgres", outcome=outcome
+            )
+        return
+
+    conn = await _get_sqlite_conn()
+    async with _sqlite_lock:
+        started = time.perf_counter()
+        try:
+            yield AsyncCursor(conn, "sqlite")
+            await conn.commit()
+        except Exception:
+            outcome = "rollback"
+            await conn.rollback()
+            raise
+        finally:
+            metrics.DB_TRANSACTION_SECONDS.observe(
+                time.perf_counter() - started, backend="sqlite", outcome=outcome
+            )
+
+
+# =================================================================
+# OPERATIONS (Camino caliente de Natalia)
+# =================================================================
+
+@metrics.timed_operation
+async def get_or_create_lead(whatsapp_phone: str, meta_data: Optional[dict] = None) -> tuple[Optional[str], bool]:
+    """
+    Obtiene o crea un Lead basado en el teléfono.
+    Retorna tupla: (lead_id, is_new) donde is_new=True si fue recién creado.
+    """
+    if meta_data is None:
+        meta_data = {}
+
+    try:
+        async with get_async_cursor() as cur:
+            # 1. Buscar Lead existente
+            await cur.execute(queries.SELECT_LEAD_ID_BY_PHONE, (whatsapp_phone,))
+            row = await cur.fetchone()
+
+            if row:
+                lead_id = row[0]
+                if meta_data:
+                    await cur.execute(queries.UPDATE_LEAD_METADATA, (
+                        meta_data.get('meta_lead_id'),
+                        meta_data.get('click_id'),
+                        meta_data.get('email'),
+                        meta_data.get('name'),
+                        lead_id
+                    ))
+                return (str(lead_id), False)
+
+            # 2. Crear Nuevo Lead
+            logger.info(f"✨ Creando Nuevo Lead: {whatsapp_phone}")
+            if BACKEND == "postgres":
+                await cur.execute(queries.INSERT_LEAD_RETURNING_ID, (
+                    whatsapp_phone,
+                    meta_data.get('meta_lead_id'),
+                    meta_data.get('click_id'),
+                    meta_data.get('email'),
+                    meta_data.get('name')
+                ))
+                lead_id = (await cur.fetchone())[0]
+                return (str(lead_id), True)
+
+            new_id = str(uuid.uuid4())
+            await cur.execute(queries.INSERT_LEAD_SQLITE, (
+                new_id,
+                whatsapp_phone,
+                meta_data.get('meta_lead_id'),
+                meta_data.get('click_id'),
+                meta_data.get('email'),
+                meta_data.get('name')
+            ))
+            return (new_id, True)
+
+    except Exception as e:
+        logger.error(f"❌ Error en get_or_create_lead (async): {e}")
+        return (None, False)
+
+
+@metrics.timed_operation
+async def log_interaction(lead_id: str, role: str, content: str) -> bool:
+    """Registra un turno para el Lead en el log de conversación de su teléfono"""
+    try:
+        async with get_async_cursor() as cur:
+            if BACKEND == "postgres":
+                await cur.execute(queries.APPEND_EVENT_BY_LEAD_POSTGRES, (lead_id, role, content))
+                row = await cur.fetchone()
+            else:
+                await cur.execute(queries.SELECT_LEAD_PHONE, (lead_id,))
+                row = await cur.fetchone()
+                if row:
+                    await _append_event_sqlite(cur, row[0], role, content)
+        if not row:
+            logger.warning(f"⚠️ log_interaction: lead {lead_id} no existe (async)")
+            return False
+        # El teléfono se conoce recién ahora: la conversación en memoria se recarga
+        chat_histories.begin_write(row[0])
+        chat_histories.invalidate(row[0])
+        return True
+    except Exception as e:
+        if await _outbox_write("log_interaction", {"lead_id": lead_id, "role": role, "content": content}, e):
+            return True
+        logger.error(f"❌ Error en log_interaction (async): {e}")
+        return False
+
+
+@metrics.timed_operation
+async def ingest_inbound_message(whatsapp_phone: str, text: str, meta_data: Optional[dict] = None) -> tuple[Optional[str], bool]:
+    """
+    Upsert del Lead + turno 'user' en un solo viaje a la BD.
+    Un reintento con el mismo id de mensaje de Evolution no duplica el turno.
+    Retorna tupla: (lead_id, is_new) como get_or_create_lead.
+    """
+    # Mismos helpers que la capa sync: ambas capas deduplican por el mismo id externo
+    meta = database.lead_meta_columns(meta_data)
+    external_id = database.external_message_id(meta_data)
+    token = chat_histories.begin_write(whatsapp_phone)
+
+    try:
+        async with get_async_cursor() as cur:
+            if BACKEND == "postgres":
+                await cur.execute(queries.INGEST_INBOUND_POSTGRES, (whatsapp_phone, *meta, "user", text, external_id))
+                lead_id, is_new, appended = await cur.fetchone()
+            else:
+                new_id = str(uuid.uuid4())
+                await cur.execute(queries.UPSERT_LEAD_RETURNING_SQLITE, (new_id, whatsapp_phone, *meta))
+                lead_id = (await cur.fetchone())[0]
+                is_new = lead_id == new_id
+                _, appended = await _append_event_sqlite(cur, whatsapp_phone, "user", text, external_id)
+
+        if appended:
+            chat_histories.append(whatsapp_phone, "user", text, token)
+        if is_new:
+            logger.info(f"✨ Creando Nuevo Lead: {whatsapp_phone}")
+        return (str(lead_id), bool(is_new))
+
+    except Exception as e:
+        payload = {"whatsapp_phone": whatsapp_phone, "text": text, "meta_data": meta_data}
+        if not await _outbox_write("ingest_inbound_message", payload, e):
+            logger.error(f"❌ Error en ingest_inbound_message (async): {e}")
+        return (None, False)
+
+
+async def _append_event_sqlite(cur, whatsapp_number: str, role: str, content: str, external_id: Optional[str] = None) -> tuple:
+    """SQLite: reserva el siguiente seq del contacto e inserta el turno. Retorna (contact_id, appended)."""
+    await cur.execute(queries.UPSERT_CONTACT_SEQ_SQLITE, (str(uuid.uuid4()), whatsapp_number))
+    contact_id, seq = await cur.fetchone()
+    await cur.execute(queries.INSERT_CONVERSATION_EVENT, (contact_id, seq, role, content, external_id))
+    return (contact_id, cur.rowcount > 0)
+
+
+async def _append_event_by_contact(cur, contact_id: str, role: str, content: str) -> bool:
+    """Turno para un contact_id conocido. False si el contacto ya no existe."""
+    if BACKEND == "postgres":
+        await cur.execute(queries.APPEND_EVENT_BY_CONTACT_POSTGRES, (contact_id, role, content))
+        return await cur.fetchone() is not None
+    await cur.execute(queries.NEXT_EVENT_SEQ_SQLITE, (contact_id,))
+    row = await cur.fetchone()
+    if row is None:
+        return False
+    await cur.execute(queries.INSERT_CONVERSATION_EVENT, (contact_id, row[1], role, content, None))
+    return True
+
+
+@metrics.timed_operation
+async def save_message(whatsapp_number: str, role: str, content: str):
+    """
+    Agrega un turno al log de conversación (memoria de Natalia).
+    Con el contact_id en caché (compartido con app.database) es una sola sentencia.
+    Tras el COMMIT el turno se agrega al historial en memoria del contacto.
+    """
+    token = chat_histories.begin_write(whatsapp_number)
+    try:
+        contact_id = contact_ids.get(whatsapp_number)
+        if contact_id is not None:
+            async with get_async_cursor() as cur:
+                appended = await _append_event_by_contact(cur, contact_id, role, content)
+            if appended:
+                chat_histories.append(whatsapp_number, role, content, token)
+                return
+            # El contacto fue borrado: el id y la conversación en caché ya no sirven
+            invalidate_contact_id(whatsapp_number)
+            chat_histories.invalidate(whatsapp_number)
+
+        async with get_async_cursor() as cur:
+            if BACKEND == "postgres":
+                await cur.execute(queries.APPEND_EVENT_BY_PHONE_POSTGRES, (whatsapp_number, role, content))
+                contact_id = (await cur.fetchone())[0]
+            else:
+                contact_id, _ = await _append_event_sqlite(cur, whatsapp_number, role, content)
+
+        chat_histories.append(whatsapp_number, role, content, token)
+        if contact_id is not None:
+            # str: psycopg2 (capa sync) no adapta uuid.UUID de asyncpg
+            contact_ids.set(whatsapp_number, str(contact_id))
+    except Exception as e:
+        payload = {"whatsapp_number": whatsapp_number, "role": role, "content": content}
+        if await _outbox_write("save_message", payload, e):
+            return
+        logger.error(f"❌ Error guardando mensaje (async): {e}")
+
+
+@metrics.timed_operation
+async def get_chat_history(whatsapp_number: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Obtiene los últimos N mensajes para contexto de la IA.
+    Conversación activa: ring buffer en memoria (compartido con app.database).
+    """
+    cached = chat_histories.get(whatsapp_number, limit)
+    if cached is not None:
+        return cached
+
+    history = []
+    token = chat_histories.load_token()
+    try:
+        async with get_async_cursor() as cur:
+            await cur.execute(queries.SELECT_CHAT_HISTORY, (whatsapp_number, max(limit, chat_histories.turns)))
+            rows = await cur.fetchall()
+            # Invertir para que sea cronológico
+            for row in reversed(rows):
+                history.append({"role": row[0], "content": row[1]})
+    except Exception as e:
+        logger.error(f"❌ Error obteniendo historial (async): {e}")
+        return history
+
+    chat_histories.hydrate(whatsapp_number, history, token)
+    return history[-limit:] if limit > 0 else []
+
+
+# =================================================================
+# CONOCIMIENTO DE NATALIA (cacheado; caché compartido con app.database)
+# =================================================================
+
+async def _refresh_knowledge_version():
+    """Poll del watermark como mucho cada KNOWLEDGE_VERSION_CHECK_SECONDS"""
+    if not knowledge_version.due():
+        return
+    try:
+        async with get_async_cursor() as cur:
+            await cur.execute(queries.SELECT_KNOWLEDGE_VERSION)
+            version = tuple(await cur.fetchone())
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer la versión del conocimiento (async): {e}")
+        return
+    if knowledge_version.observe(version):
+        knowledge.clear()
+        logger.info("🧠 Conocimiento modificado en BD: caché invalidado")
+
+
+@metrics.timed_operation
+async def get_knowledge_base(category: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Obtiene el conocimiento del negocio, opcionalmente por categoría (cacheado)"""
+    await _refresh_knowledge_version()
+    key = ("facts", category or None)
+    cached = knowledge.get(key)
+    if cached is not None:
+        return list(cached)
+
+    facts = []
+    try:
+        async with get_async_cursor() as cur:
+            if category:
+                await cur.execute(queries.SELECT_KNOWLEDGE_BY_CATEGORY, (category,))
+            else:
+                await cur.execute(queries.SELECT_KNOWLEDGE_BASE)
+            for row in await cur.fetchall():
+                facts.append({
+                    "slug": row[0],
+                    "category": row[1],
+                    "content": row[2]
+                })
+    except Exception as e:
+        logger.error(f"❌ Error obteniendo knowledge base (async): {e}")
+        return facts
+
+    knowledge.set(key, tuple(facts))
+    return facts
+
+
+@metrics.timed_operation
+async def get_agent_prompt(role_id: str) -> Optional[str]:
+    """Recupera el System Prompt desde la BD para un rol específico (cacheado)"""
+    await _refresh_knowledge_version()
+    key = ("prompt", role_id)
+    cached = knowledge.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        async with get_async_cursor() as cur:
+            await cur.execute(queries.SELECT_AGENT_PROMPT, (role_id,))
+            row = await cur.fetchone()
+
+            if row:
+                knowledge.set(key, row[0])
+                return row[0]
+
+            logger.warning(f"⚠️ Prompt not found for role: {role_id}")
+            return None
+
+    except Exception as e:
+        logger.error(f"❌ Error fetching agent prompt ({role_id}): {e}")
+        return None
+
+
+async def start_knowledge_listener():
+    """
+    LISTEN knowledge_changed (triggers de la migración 0006): el caché se
+    invalida apenas otro worker o el panel cambian el conocimiento.
+    El poll del watermark queda como red de seguridad.
+    """
+    if BACKEND != "postgres":
+        return
+    dsn = _postgres_dsn()
+    if ":6543" in dsn:
+        # El pooler en modo transacción no entrega notificaciones
+        logger.info("🧠 LISTEN no disponible vía pgbouncer: solo poll del watermark")
+        return
+
+    def _on_change(connection, pid, channel, payload):
+        invalidate_knowledge()
+        logger.info(f"🧠 NOTIFY {channel} ({payload}): caché de conocimiento invalidado")
+
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(dsn=dsn)
+            await conn.add_listener("knowledge_changed", _on_change)
+            invalidate_knowledge()  # Cambios ocurridos mientras no escuchábamos
+            logger.info("🧠 Escuchando cambios de conocimiento (LISTEN knowledge_changed)")
+            while True:
+                await asyncio.sleep(settings.KNOWLEDGE_VERSION_CHECK_SECONDS)
+                await conn.execute("SELECT 1")  # Detecta conexiones caídas en silencio
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Listener de conocimiento caído: {e}")
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(settings.KNOWLEDGE_VERSION_CHECK_SECONDS)
@@ -0,0 +1,303 @@
+# =================================================================
+# CAPI_DISPATCHER.PY - Envío por Lotes a Meta Conversions API
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# La Conversions API acepta hasta 1000 eventos en un solo `data`.
+# submit() encola el evento y retorna un Future con su resultado (SENT,
+# QUEUED o FAILED); un loop asyncio en un hilo daemon junta la cola y hace
+# un POST por lote:
+# - cuando se juntan `max_events` eventos, o
+# - cuando el evento más antiguo lleva `max_latency` segundos esperando.
+# Resultado por evento:
+# - 200: todo el lote aceptado (SENT)
+# - 400 "invalid parameter" (code 100): Meta rechaza el lote entero, se
+#   parte en mitades hasta aislar los eventos inválidos
+# - Red caída / 5xx / rate limit: el lote pasa a `on_retry` (cola durable
+#   de reintentos, ver app/delivery_queue.py; retorna True si lo anotó) y
+#   queda QUEUED: la entrega ya es del worker, el llamador no lo reenvía.
+#   Tras un rate limit nada sale hacia Meta hasta que termine la pausa
+# - Otro 4xx, cola llena o sin cola de reintentos: FAILED
+# Un solo hilo por proceso (arranque perezoso: seguro tras el fork de Celery);
+# close() envía lo pendiente (lifespan shutdown). `prepare_fn` transforma el
+# lote completo antes del POST (hashing de user_data, ver app/hashing.py).
+# =================================================================
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from app import metrics
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Graph API: error.code del parámetro inválido (el lote se rechaza entero)
+INVALID_PARAMETER = 100
+# Throttling (app / usuario / página / llamadas por hora / cuenta publicitaria)
+RATE_LIMIT_CODES = {4, 17, 32, 613, 80004}
+# Token vencido o rotado: se reintenta, el token nuevo llega con el próximo deploy
+EXPIRED_TOKEN = 190
+RATE_LIMIT_PAUSE = 60.0  # Sin Retry-After
+STARTUP_TIMEOUT = 5.0  # Espera máxima al arranque del hilo (se hace con el lock tomado)
+
+# Resultado de cada evento (Future de submit)
+SENT = "sent"
+QUEUED = "queued"  # En la cola durable de reintentos (lo entrega el DeliveryWorker)
+FAILED = "failed"  # Rechazado por Meta o descartado
+
+CAPI_EVENTS = metrics.Counter(
+    "meta_capi_events_total", "Eventos CAPI resueltos por el dispatcher", ["outcome"]
+)
+CAPI_REQUESTS = metrics.Counter(
+    "meta_capi_requests_total", "POST a la Graph API por código de estado", ["status"]
+)
+CAPI_BATCH_SIZE = metrics.Histogram(
+    "meta_capi_batch_events", "Eventos por POST a la Graph API", buckets=(1, 10, 50, 100, 250, 500, 1000)
+)
+
+_Item = Tuple[Dict[str, Any], Future]
+
+
+class CapiDispatcher:
+    """Cola de eventos CAPI con flush por tamaño o por latencia"""
+
+    def __init__(
+        self,
+        wrap_fn: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+        max_events: int = 1000,
+        max_latency: float = 0.5,
+        max_pending: int = 10000,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        on_retry: Optional[Callable[[List[Dict[str, Any]], str, Optional[float]], bool]] = None,
+        prepare_fn: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None,
+    ):
+        self._wrap_fn = wrap_fn
+        self._prepare_fn = prepare_fn
+        self.max_events = max(1, min(max_events, 1000))
+        self.max_latency = max_latency
+        self.max_pending = max_pending
+        self._transport = transport
+        self._on_retry = on_retry
+        self._paused_until = 0.0
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._pending = 0
+
+    def submit(self, event: Dict[str, Any]) -> Future:
+        """Encola un evento (no bloquea por I/O). El Future se resuelve con SENT/QUEUED/FAILED."""
+        future: Future = Future()
+        with self._lock:
+            full = self._pending >= self.max_pending
+            started = not full and self._ensure_started()
+            if started:
+                self._pending += 1
+                self._loop.call_soon_threadsafe(self._queue.put_nowait, (event, future))
+
+        if full:
+            CAPI_EVENTS.inc(outcome="dropped")
+            logger.warning(f"[META CAPI] ⚠️ Cola llena ({self.max_pending}): {event.get('event_name')} descartado")
+            future.set_result(FAILED)
+        elif not started:
+            CAPI_EVENTS.inc(outcome="dropped")
+            future.set_result(FAILED)
+        return future
+
+    def close(self, timeout: float = 15.0):
+        """Envía lo pendiente y detiene el hilo (un submit posterior lo vuelve a arrancar)"""
+        with self._lock:
+            thread, loop, queue = self._thread, self._loop, self._queue
+            self._thread = self._loop = self._queue = None
+            if thread is not None and self._pid == os.getpid():
+                # Centinela detrás de todo lo encolado: el flusher vacía y termina
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+            else:
+                thread = None
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"pending": self._pending, "running": self._thread is not None}
+
+    # --- Hilo del loop ---
+
+    def _ensure_started(self) -> bool:
+        """Arranca el hilo si hace falta. False si no arrancó (el evento se da por fallido)."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return True
+        ready = threading.Event()
+        self._pid = os.getpid()
+        self._pending = 0
+        self._queue = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run, args=(self._loop, ready), name="capi-dispatcher", daemon=True
+        )
+        self._thread.start()
+        # Con timeout: un arranque colgado no puede bloquear submit()/stats() (ni el event loop)
+        if ready.wait(STARTUP_TIMEOUT) and self._queue is not None and self._thread.is_alive():
+            return True
+        logger.error("[META CAPI] ❌ El dispatcher no pudo arrancar: evento descartado")
+        self._thread = self._loop = self._queue = None
+        return False
+
+    def _run(self, loop: asyncio.AbstractEventLoop, ready: threading.Event):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._main(ready))
+        except Exception as e:
+            logger.error(f"[META CAPI] ❌ Dispatcher detenido: {e}")
+        finally:
+            ready.set()  # Si falló antes de arrancar, submit() no queda esperando
+            loop.close()
+
+    async def _main(self, ready: threading.Event):
+        # Cliente propio del loop (un AsyncClient no se comparte entre loops); HTTP/2 persistente
+        timeout = httpx.Timeout(10.0, connect=5.0)
+        async with httpx.AsyncClient(timeout=timeout, http2=True, transport=self._transport) as client:
+            queue: asyncio.Queue = asyncio.Queue()
+            self._queue = queue  # Recién aquí el hilo puede recibir eventos
+            ready.set()
+            while True:
+                batch, closing = await self._collect(queue)
+                if batch:
+                    await self._dispatch(client, batch)
+                if closing:
+                    return
+
+    async def _collect(self, queue: asyncio.Queue) -> Tuple[List[_Item], bool]:
+        """Espera el primer evento y junta hasta max_events o hasta su deadline"""
+        item = await queue.get()
+        if item is None:
+            return [], True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_latency
+        batch = [item]
+        while len(batch) < self.max_events:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _dispatch(self, client: httpx.AsyncClient, batch: List[_Item]):
+        events = [event for event, _ in batch]
+        paused = self._paused_until - time.monotonic()
+        try:
+            if self._prepare_fn is not None:
+                # Una pasada por lote (ej. hashing de user_data), fuera del request
+                events = self._prepare_fn(events)
+            if paused > 0 and self._on_retry is not None:
+                # Rate limit vigente: directo a la cola de reintentos, sin tocar la Graph API
+                results = self._handoff(events, "rate limit (pausa local)", paused)
+            else:
+                results = await self._post(client, events)
+        except Exception as e:
+            logger.error(f"[META CAPI] ❌ Dispatcher error: {e}")
+            results = [FAILED] * len(events)
+
+        with self._lock:
+            self._pending = max(0, self._pending - len(batch))
+        ok, queued = results.count(SENT), results.count(QUEUED)
+        CAPI_EVENTS.inc(ok, outcome="sent")
+        CAPI_EVENTS.inc(len(results) - ok - queued, outcome="failed")
+        icon = "✅" if ok == len(results) else "⚠️"
+        retrying = f", {queued} a reintentos" if queued else ""
+        logger.info(f"[META CAPI] {icon} {ok}/{len(results)} eventos enviados en lote (HTTP/2){retrying}")
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _post(self, client: httpx.AsyncClient, events: List[Dict[str, Any]]) -> List[str]:
+        """Un POST por lote; bisección si Meta rechaza el lote por un evento inválido"""
+        CAPI_BATCH_SIZE.observe(len(events))
+        try:
+            response = await client.post(settings.meta_api_url, json=self._wrap_fn(events))
+        except Exception as e:
+            CAPI_REQUESTS.inc(status="error")
+            logger.error(f"[META CAPI] ❌ Error: {e}")
+            return self._handoff(events, f"{type(e).__name__}: {e}")
+
+        CAPI_REQUESTS.inc(status=str(response.status_code))
+        verdict = classify_response(response)
+        if verdict == "ok":
+            return [SENT] * len(events)
+        if verdict == "rate_limited":
+            delay = retry_after(response) or RATE_LIMIT_PAUSE
+            self._paused_until = time.monotonic() + delay
+            logger.warning(f"[META CAPI] ⏳ Rate limit: envíos en pausa {delay:.0f}s")
+            return self._handoff(events, response.text, delay)
+        if verdict == "retry":
+            return self._handoff(events, f"HTTP {response.status_code}: {response.text}")
+        if len(events) > 1 and is_batch_rejection(response):
+            middle = len(events) // 2
+            return await self._post(client, events[:middle]) + await self._post(client, events[middle:])
+
+        names = ", ".join(sorted({str(e.get("event_name")) for e in events}))
+        logger.warning(f"[META CAPI] ⚠️ {len(events)} evento(s) rechazados ({names}): {response.text[:500]}")
+        return [FAILED] * len(events)
+
+    def _handoff(self, events: List[Dict[str, Any]], error: str, delay: Optional[float] = None) -> List[str]:
+        """Falla transitoria: QUEUED si los eventos quedaron en la cola durable de reintentos"""
+        if self._on_retry is None:
+            return [FAILED] * len(events)
+        try:
+            queued = self._on_retry(events, error, delay)
+        except Exception as e:
+            queued = False
+            logger.error(f"[META CAPI] ❌ Cola de reintentos no disponible: {e}")
+        if not queued:
+            logger.error(f"[META CAPI] ❌ {len(events)} eventos perdidos ({error[:200]})")
+            return [FAILED] * len(events)
+        CAPI_EVENTS.inc(len(events), outcome="retry_queued")
+        return [QUEUED] * len(events)
+
+
+def classify_response(response: httpx.Response) -> str:
+    """ok | rate_limited | retry (transitorio) | invalid (reintentar no sirve)"""
+    if response.status_code == 200:
+        return "ok"
+    code = _error_code(response)
+    if response.status_code == 429 or code in RATE_LIMIT_CODES:
+        return "rate_limited"
+    if response.status_code >= 500 or response.status_code == 408 or code == EXPIRED_TOKEN:
+        return "retry"
+    return "invalid"
+
+
+def is_batch_rejection(response: httpx.Response) -> bool:
+    """Meta rechazó el lote entero por un evento inválido (vale la pena partirlo)"""
+    return _error_code(response) == INVALID_PARAMETER
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _error_code(response: httpx.Response):
+    try:
+        return response.json().get("error", {}).get("code")
+    except Exception:
+        return None
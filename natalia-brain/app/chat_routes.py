@@ -40,7 +40,8 @@ class EvolutionAdapter:
                 "name": msg.name,
                 "source": msg.source,
                 "timestamp": msg.timestamp,
-                "type": msg.type
+                "type": msg.type,
+                "message_id": msg.id
             }
             
             await inbox_manager.add_message(
@@ -0,0 +1,241 @@
+# =================================================================
+# DB_POOL.PY - Pool de Conexiones Thread-Safe (PostgreSQL)
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# Reemplaza psycopg2.pool.SimpleConnectionPool (NO thread-safe) por un
+# pool compartido entre BackgroundTasks y asyncio.to_thread:
+# - Tamaño min/max configurable y conexiones pre-calentadas
+# - Validación perezosa: solo hace ping si la conexión estuvo ociosa
+#   más de `validate_after` segundos (evita el SELECT 1 por checkout)
+# - Espera acotada cuando el pool está lleno + estadísticas de espera
+# =================================================================
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """No se liberó ninguna conexión dentro del tiempo de espera"""
+
+
+class ThreadedPool:
+    """
+    Pool LIFO thread-safe. Las conexiones más recientes se reutilizan primero,
+    así las ociosas envejecen y solo esas pagan la validación.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        minconn: int = 1,
+        maxconn: int = 10,
+        validate_after: float = 30.0,
+        acquire_timeout: float = 5.0,
+    ):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool bounds: min={minconn} max={maxconn}")
+
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.validate_after = validate_after
+        self.acquire_timeout = acquire_timeout
+
+        self._cond = threading.Condition()
+        self._idle: deque = deque()  # (conn, last_used_monotonic)
+        self._size = 0  # Conexiones abiertas (ociosas + prestadas)
+        self._closed = False
+
+        # Estadísticas
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._created = 0
+        self._validations = 0
+        self._discarded = 0
+
+    # -----------------------------------------------------------------
+    # Ciclo de vida
+    # -----------------------------------------------------------------
+
+    def prewarm(self) -> int:
+        """Abre conexiones hasta alcanzar `minconn`. Retorna cuántas abrió."""
+        opened = 0
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.minconn:
+                    break
+                self._size += 1
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+            opened += 1
+        return opened
+
+    def closeall(self):
+        """Cierra las conexiones ociosas; las prestadas se cierran al devolverse."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+    # -----------------------------------------------------------------
+    # Checkout / Checkin
+    # -----------------------------------------------------------------
+
+    def getconn(self, timeout: Optional[float] = None):
+        """
+        Presta una conexión sana.
+        Lanza PoolTimeoutError si el pool está lleno más de `timeout` segundos.
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        while True:
+            conn, last_used, create = None, 0.0, False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError("Pool is closed")
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"No DB connection available after {timeout:.1f}s (max={self.maxconn})"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if create:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_usable(conn, last_used):
+                self._discard(conn)
+                continue  # Pedir otra (o crear una nueva)
+
+            self._record_checkout(time.monotonic() - started, waited)
+            return conn
+
+    def putconn(self, conn, close: bool = False):
+        """Devuelve la conexión al pool (o la descarta si `close` o está rota)."""
+        if close or getattr(conn, "closed", 0) != 0:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._cond.notify()
+                closing = True
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                closing = False
+        if closing:
+            self._close(conn)
+
+    # -----------------------------------------------------------------
+    # Observabilidad
+    # -----------------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "min": self.minconn,
+                "max": self.maxconn,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "avg_wait_ms": round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+                "created": self._created,
+                "validations": self._validations,
+                "discarded": self._discarded,
+            }
+
+    # -----------------------------------------------------------------
+    # Internos
+    # -----------------------------------------------------------------
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _is_usable(self, conn, last_used: float) -> bool:
+        if getattr(conn, "closed", 0) != 0:
+            return False
+        if time.monotonic() - last_used < self.validate_after:
+            return True
+
+        # Conexión ociosa demasiado tiempo: ping antes de entregarla
+        with self._cond:
+            self._validations += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ DB Connection stale after idle, discarding: {e}")
+            return False
+
+    def _discard(self, conn):
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+        self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _record_checkout(self, wait: float, waited: bool):
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += wait
+            if wait > self._wait_max:
+                self._wait_max = wait
+            if waited:
+                self._waits += 1
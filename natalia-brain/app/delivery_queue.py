@@ -0,0 +1,270 @@
+# =================================================================
+# DELIVERY_QUEUE.PY - Reintentos Durables de Entregas Salientes
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# Eventos de Meta CAPI y webhooks de n8n que fallaron por un problema
+# transitorio (red, 5xx, rate limit) no se pierden:
+# 1. Se anotan en un SQLite local (deliveries.db, WAL) con su próxima hora
+#    de intento; el request que falló no espera ningún reintento
+# 2. Un hilo worker los reenvía por lotes según `next_attempt_at`, con
+#    backoff exponencial + jitter (base * 2^intentos, tope max_delay)
+# 3. Un destino que responde "rate limit" queda en pausa (Retry-After o
+#    backoff) sin consumir intentos
+# Tras max_attempts (o un error permanente) la entrega queda como "dead"
+# para revisión manual, igual que la outbox.
+# Sin Celery ni Redis: funciona en el tier gratuito de Render.
+# =================================================================
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from app.sqlite_backend import SQLiteBackend
+
+logger = logging.getLogger(__name__)
+
+CREATE_DELIVERIES = """
+    CREATE TABLE IF NOT EXISTS deliveries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        target TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        dead INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+CREATE_DELIVERIES_DUE_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_deliveries_due ON deliveries (target, next_attempt_at) WHERE dead = 0
+"""
+
+
+class DeliveryEntry(NamedTuple):
+    id: int
+    target: str
+    payload: Any
+    attempts: int
+
+
+class Outcome(NamedTuple):
+    """Resultado de reenviar una entrega"""
+    delivered: bool
+    error: str = ""
+    permanent: bool = False  # Reintentar no sirve (ej. payload inválido): dead de inmediato
+
+
+class RateLimited(Exception):
+    """
+    El destino pidió bajar el ritmo: se pausa sin gastar intentos.
+    `outcomes`: resultados de las entregas ya intentadas en el lote antes del
+    rate limit (prefijo, mismo orden) para no reenviar lo ya entregado.
+    """
+
+    def __init__(
+        self,
+        retry_after: Optional[float] = None,
+        message: str = "rate limited",
+        outcomes: Optional[List[Outcome]] = None,
+    ):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.outcomes = outcomes or []
+
+
+class DeliveryQueue:
+    """Cola durable de entregas pendientes en un archivo SQLite propio"""
+
+    def __init__(
+        self,
+        path: str,
+        max_attempts: int = 8,
+        base_delay: float = 30.0,
+        max_delay: float = 3600.0,
+    ):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._backend = SQLiteBackend(path)
+        conn = self._backend.connection()
+        conn.execute(CREATE_DELIVERIES)
+        conn.execute(CREATE_DELIVERIES_DUE_INDEX)
+
+    def backoff(self, attempts: int) -> float:
+        """Exponencial con jitter ("equal jitter"): entre d/2 y d"""
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, attempts - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def append(self, target: str, payloads: List[Any], error: str = "", delay: Optional[float] = None):
+        """Encola entregas que ya fallaron una vez (cuenta como primer intento)"""
+        if not payloads:
+            return
+        next_at = time.time() + (self.backoff(1) if delay is None else delay)
+        conn = self._backend.connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO deliveries (target, payload, attempts, next_attempt_at, last_error) "
+                "VALUES (?, ?, 1, ?, ?)",
+                [(target, json.dumps(p, default=str), next_at, error[:500]) for p in payloads]
+            )
+
+    def due(self, target: str, limit: int, now: Optional[float] = None) -> List[DeliveryEntry]:
+        rows = self._backend.connection().execute(
+            "SELECT id, target, payload, attempts FROM deliveries "
+            "WHERE target = ? AND dead = 0 AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+            (target, time.time() if now is None else now, limit)
+        ).fetchall()
+        return [DeliveryEntry(r[0], r[1], json.loads(r[2]), r[3]) for r in rows]
+
+    def remove(self, ids: List[int]):
+        if not ids:
+            return
+        conn = self._backend.connection()
+        with conn:
+            conn.executemany("DELETE FROM deliveries WHERE id = ?", [(i,) for i in ids])
+
+    def record_failure(self, entry: DeliveryEntry, error: str, permanent: bool = False):
+        """Un intento más; agotados (o permanente) -> dead"""
+        attempts = entry.attempts + 1
+        dead = permanent or attempts >= self.max_attempts
+        conn = self._backend.connection()
+        with conn:
+            conn.execute(
+                "UPDATE deliveries SET attempts = ?, next_attempt_at = ?, dead = ?, last_error = ? WHERE id = ?",
+                (attempts, time.time() + self.backoff(attempts), int(dead), error[:500], entry.id)
+            )
+        return dead
+
+    def counts(self) -> Dict[str, int]:
+        depth, dead = self._backend.connection().execute(
+            "SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead = 1), 0) FROM deliveries"
+        ).fetchone()
+        return {"depth": depth, "dead": dead}
+
+    def close(self):
+        self._backend.close_all()
+
+
+class DeliveryWorker:
+    """
+    Hilo daemon que reenvía las entregas vencidas.
+    handlers: destino -> fn(payloads) -> List[Outcome] (uno por payload, mismo orden);
+    puede lanzar RateLimited (con los outcomes ya obtenidos) para pausar ese destino.
+    """
+
+    def __init__(
+        self,
+        queue: DeliveryQueue,
+        handlers: Dict[str, Callable[[List[Any]], List[Outcome]]],
+        batch_size: int = 500,
+        interval: float = 5.0,
+    ):
+        self.queue = queue
+        self._handlers = handlers
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self._paused_until: Dict[str, float] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Estadísticas
+        self._delivered = 0
+        self._retried = 0
+        self._dead = 0
+        self._rate_limited = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="delivery-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stop.set()
+        self._wake.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def pause(self, target: str, seconds: float):
+        """Rate limit: nada sale hacia `target` hasta que pase la pausa"""
+        with self._lock:
+            self._paused_until[target] = max(self._paused_until.get(target, 0.0), time.time() + seconds)
+            self._rate_limited += 1
+
+    def paused_for(self, target: str) -> float:
+        with self._lock:
+            return max(0.0, self._paused_until.get(target, 0.0) - time.time())
+
+    def _run(self):
+        while not self._stop.is_set():
+            for target in self._handlers:
+                try:
+                    while self.drain_once(target) == self.batch_size:
+                        if self._stop.is_set():
+                            return
+                except Exception as e:
+                    logger.warning(f"⚠️ Reintentos '{target}' pausados: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def drain_once(self, target: str) -> int:
+        """Reenvía un lote vencido de `target`. Retorna cuántas entradas se procesaron."""
+        if self.paused_for(target) > 0:
+            return 0
+        entries = self.queue.due(target, self.batch_size)
+        if not entries:
+            return 0
+
+        try:
+            outcomes = self._handlers[target]([e.payload for e in entries])
+        except RateLimited as e:
+            # No cuenta como intento: el destino está sano, solo pide esperar.
+            # Lo ya intentado antes del rate limit se registra; el resto queda igual.
+            self.pause(target, e.retry_after or self.queue.backoff(1))
+            logger.warning(f"⏳ {target}: rate limit, reintentos en pausa {self.paused_for(target):.0f}s")
+            outcomes = e.outcomes[:len(entries)]
+            if not outcomes:
+                return 0
+        except Exception as e:
+            outcomes = [Outcome(False, f"{type(e).__name__}: {e}")] * len(entries)
+
+        delivered, retried, dead = [], 0, 0
+        for entry, outcome in zip(entries, outcomes):
+            if outcome.delivered:
+                delivered.append(entry.id)
+            elif self.queue.record_failure(entry, outcome.error, outcome.permanent):
+                dead += 1
+                logger.error(f"☠️ {target}: entrega {entry.id} descartada tras {entry.attempts + 1} intentos ({outcome.error})")
+            else:
+                retried += 1
+        self.queue.remove(delivered)
+
+        with self._lock:
+            self._delivered += len(delivered)
+            self._retried += retried
+            self._dead += dead
+        if delivered:
+            logger.info(f"📮 {target}: {len(delivered)} entregas reintentadas con éxito")
+        return len(outcomes)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "delivered": self._delivered,
+                "retried": self._retried,
+                "dead_lettered": self._dead,
+                "rate_limited": self._rate_limited,
+            }
+        stats.update(self.queue.counts())
+        return stats
@@ -0,0 +1,119 @@
+# =================================================================
+# HASHING.PY - Normalización + SHA-256 de user_data (Meta CAPI)
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# Meta exige identificadores normalizados y hasheados (SHA-256 hex):
+# - em: sin espacios, minúsculas
+# - ph: E.164 solo dígitos, con código de país, sin "+" ni ceros iniciales
+#   (números locales asumen CAPI_DEFAULT_PHONE_REGION, ej. BO -> 591)
+# - external_id: sin espacios, minúsculas
+# Un mismo visitante dispara muchos eventos por sesión: hash_value() y
+# generate_external_id() usan un LRU acotado (CAPI_HASH_CACHE_SIZE).
+# hash_events() hashea un lote completo del dispatcher en una pasada: los
+# eventos viajan con sus identificadores crudos en "_pii" y se hashean en
+# el hilo del dispatcher, fuera del request.
+# =================================================================
+import hashlib
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+
+try:
+    import phonenumbers
+    HAS_PHONENUMBERS = True
+except ImportError:
+    HAS_PHONENUMBERS = False
+
+logger = logging.getLogger(__name__)
+
+PII_KEY = "_pii"
+_phone_fallback_warned = False
+
+
+def normalize_email(value: str) -> str:
+    return value.strip().lower()
+
+
+def normalize_text(value: str) -> str:
+    return value.strip().lower()
+
+
+def normalize_phone(value: str) -> str:
+    """E.164 sin "+" (ej. '+591 700-00050' y '70000050' -> '59170000050')"""
+    if HAS_PHONENUMBERS:
+        try:
+            parsed = phonenumbers.parse(value, settings.CAPI_DEFAULT_PHONE_REGION)
+            if phonenumbers.is_possible_number(parsed):
+                return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164).lstrip("+")
+        except phonenumbers.NumberParseException:
+            pass
+    else:
+        _warn_phone_fallback()
+    digits = "".join(filter(str.isdigit, value))
+    # Prefijo internacional "00" (Europa / Latinoamérica) -> solo el código de país
+    return digits[2:] if digits.startswith("00") else digits
+
+
+def _warn_phone_fallback():
+    global _phone_fallback_warned
+    if not _phone_fallback_warned:
+        _phone_fallback_warned = True
+        logger.warning(
+            "⚠️ phonenumbers no instalado: teléfonos hasheados solo como dígitos "
+            "(los números locales sin código de país no coinciden en Meta)"
+        )
+
+
+NORMALIZERS = {
+    "em": normalize_email,
+    "ph": normalize_phone,
+    "external_id": normalize_text,
+}
+
+
+@lru_cache(maxsize=settings.CAPI_HASH_CACHE_SIZE)
+def hash_value(value: str, kind: str = "external_id") -> Optional[str]:
+    """Normaliza según `kind` (em / ph / external_id) y retorna el SHA-256 hex"""
+    if not value:
+        return None
+    normalized = NORMALIZERS[kind](value)
+    if not normalized:
+        return None
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=settings.CAPI_HASH_CACHE_SIZE)
+def generate_external_id(ip: str, user_agent: str) -> str:
+    """ID determinístico por IP + UA (cada carga de página del mismo visitante)"""
+    return hashlib.sha256(f"{ip}_{user_agent}".encode("utf-8")).hexdigest()[:32]
+
+
+def hash_events(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Hashea los identificadores crudos ("_pii") de un lote y los pasa a user_data.
+    Idempotente: un evento ya hasheado (ej. reintento) no tiene "_pii".
+    """
+    for event in events:
+        raw = event.pop(PII_KEY, None)
+        if not raw:
+            continue
+        user_data = event.setdefault("user_data", {})
+        for kind, value in raw.items():
+            hashed = hash_value(value, kind) if value else None
+            if hashed:
+                user_data[kind] = hashed
+    return events
+
+
+def cache_stats() -> Dict[str, Any]:
+    info = hash_value.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "size": info.currsize,
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": round(info.hits / lookups, 3) if lookups else 0.0,
+    }
@@ -5,7 +5,6 @@ import time
 import re
 from app.natalia import natalia
 from app.evolution import evolution_service
-from app.database import log_interaction
 
 logger = logging.getLogger("InboxManager")
 
@@ -20,7 +19,7 @@ class MessageManager:
     Implementa Smart Debouncing, Throttling y Seguridad Anti-Inyección.
     """
     def __init__(self):
-        # Buffer: { phone: { "messages": [txt1, txt2], "task": asyncio.Task, "meta": {} } }
+        # Buffer: { phone: { "messages": [txt1, txt2], "message_ids": [id1, id2], "task": asyncio.Task, "meta": {} } }
         self.buffers: Dict[str, Dict] = {}
         self.active_users_count = 0  # Para la carga dinámica
 
@@ -35,18 +34,29 @@ class MessageManager:
             # o devolvemos una respuesta neutra si se prefiere.
             return
 
+        meta_data = dict(meta_data or {})
+        message_id = meta_data.pop("message_id", None)
+
         # 2. Inicializar Buffer
         if phone not in self.buffers:
             self.buffers[phone] = {
                 "messages": [],
+                "message_ids": [],
                 "task": None,
-                "meta": meta_data or {},
+                "meta": {},
                 "last_activity": time.time()
             }
             self.active_users_count += 1
+
+        # Reintento del webhook con un mensaje ya acumulado: se ignora
+        if message_id and message_id in self.buffers[phone]["message_ids"]:
+            logger.info(f"♻️ [BUFFER] {phone}: Mensaje {message_id} duplicado. Ignorado.")
+            return
         
         # 3. Agregar mensaje a la pila
         self.buffers[phone]["messages"].append(text)
+        if message_id:
+            self.buffers[phone]["message_ids"].append(message_id)
         self.buffers[phone]["last_activity"] = time.time()
         
         if meta_data:
@@ -82,6 +92,8 @@ class MessageManager:
             
             full_text = " ".join(buffer_data["messages"]) # Unimos con espacio para contexto fluido
             meta = buffer_data["meta"]
+            # Ids de Evolution del bloque: el turno se deduplica por el primero
+            meta["message_ids"] = buffer_data["message_ids"]
             
             logger.info(f"🧠 [THINKING] {phone}: Procesando bloque consolidado de {len(buffer_data['messages'])} mensajes.")
             
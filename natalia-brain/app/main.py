@@ -20,12 +20,21 @@ app = FastAPI(
 async def health_check():
     """Endpoint for Render keep-alive and institutional monitoring"""
     from app.config import settings
+    from app.database import get_pool_stats
     return {
         "status": "online",
         "version": "3.1.0",
         "instance": settings.EVOLUTION_INSTANCE,
-        "engine": "Dual-Core V3"
+        "engine": "Dual-Core V3",
+        "pool": get_pool_stats()
     }
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Latencias por query / operación en formato texto Prometheus"""
+    from fastapi.responses import PlainTextResponse
+    from app import database, async_database, metrics  # noqa: F401 (registran sus gauges)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 # ------------------------------
 
 # Configuración de CORS
@@ -134,6 +143,11 @@ async def keep_evolution_alive():
 
 @app.on_event("startup")
 async def startup_event():
+    # 0. Database: Pool thread-safe con conexiones pre-calentadas
+    from app import database, async_database
+    await asyncio.to_thread(database.initialize)
+    await async_database.init_async_pool()
+
     # 1. Start Triple-Node Heartbeat (Keep-Alive)
     from app.heartbeat import start_heartbeat_hub
     asyncio.create_task(start_heartbeat_hub())
@@ -141,8 +155,19 @@ async def startup_event():
     # 2. Start Auto-Healing Watchdog (Antigravity SRE)
     from app.watchdog import start_watchdog
     asyncio.create_task(start_watchdog())
+
+    # 3. Retención de visitantes (rollup diario + particiones)
+    from app.retention import start_retention_loop
+    asyncio.create_task(start_retention_loop())
+
+    # 3b. Invalidación del caché de conocimiento entre workers
+    asyncio.create_task(async_database.start_knowledge_listener())
+
+    # 3c. Reintentos CAPI / n8n pendientes (deliveries.db)
+    from app.tracking import start_delivery_retries
+    start_delivery_retries()
     
-    # 3. Senior Protocol: Admin initialization message (SILENCED to avoid restart spam)
+    # 4. Senior Protocol: Admin initialization message (SILENCED to avoid restart spam)
     # from app.evolution import evolution_service
     # from app.natalia import ADMIN_PHONE
     
@@ -157,6 +182,16 @@ async def startup_event():
     # Send via background task to not block startup
     # asyncio.create_task(evolution_service.send_text(ADMIN_PHONE, startup_msg))
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    from app import database, async_database
+    from app import tracking
+    await asyncio.to_thread(tracking.capi_dispatcher.close)
+    await asyncio.to_thread(tracking.close_delivery_queue)
+    await tracking.async_client.aclose()
+    await async_database.close_async_pool()
+    await asyncio.to_thread(database.shutdown)
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 10000))
@@ -0,0 +1,256 @@
+# =================================================================
+# METRICS.PY - Métricas en Proceso (formato texto Prometheus)
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# Histogramas y contadores en memoria, sin dependencias externas.
+# - Cada sentencia se etiqueta con el nombre de su constante en
+#   app.sql_queries (ej. SELECT_CHAT_HISTORY); el resto es "adhoc"
+# - get_cursor() mide espera del pool, reintentos y duración de la transacción
+# - @timed_operation mide cada operación pública de la capa de datos
+# render() produce el texto que sirve GET /metrics.
+# =================================================================
+import bisect
+import functools
+import inspect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+import app.sql_queries as queries
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+_registry: List[Any] = []
+_gauge_callbacks: List[Callable[[], Dict[str, float]]] = []
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Iterable[Tuple[str, Any]]) -> str:
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}" if body else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador monótono con etiquetas"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Histograma acumulativo con etiquetas (buckets fijos)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple, List] = {}  # key -> [counts por bucket, suma, total]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, **labels) -> Dict[str, float]:
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                return {"count": 0, "sum": 0.0}
+            return {"count": series[2], "sum": series[1]}
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, [list(s[0]), s[1], s[2]]) for k, s in self._series.items())
+        for key, (counts, total, count) in items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = _format_labels(pairs + [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(pairs)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(pairs)} {count}")
+        return lines
+
+
+def register_gauges(callback: Callable[[], Dict[str, float]]):
+    """Registra un callback que retorna {nombre_métrica: valor} al renderizar"""
+    _gauge_callbacks.append(callback)
+
+
+def render() -> str:
+    """Todas las métricas en formato texto Prometheus (v0.0.4)"""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    for callback in _gauge_callbacks:
+        try:
+            gauges = callback()
+        except Exception:
+            continue
+        for name, value in sorted(gauges.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# =================================================================
+# MÉTRICAS DE LA CAPA DE DATOS
+# =================================================================
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Duración de cada sentencia SQL", ["query", "backend"]
+)
+DB_QUERY_ROWS = Histogram(
+    "db_query_rows", "Filas afectadas/retornadas por sentencia", ["query"], buckets=ROW_BUCKETS
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total", "Sentencias que fallaron", ["query", "backend"]
+)
+DB_TRANSACTION_SECONDS = Histogram(
+    "db_transaction_duration_seconds", "Duración de un bloque get_cursor()", ["backend", "outcome"]
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds", "Espera para obtener una conexión del pool", ["backend"]
+)
+DB_CHECKOUT_RETRIES = Counter(
+    "db_checkout_retries_total", "Reintentos al obtener conexión de PostgreSQL"
+)
+DB_OPERATION_SECONDS = Histogram(
+    "db_operation_duration_seconds", "Duración de cada operación de la capa de datos", ["operation"]
+)
+
+
+@lru_cache(maxsize=1)
+def _query_names() -> Dict[str, str]:
+    """Mapa inverso: texto SQL -> nombre de la constante en app.sql_queries"""
+    return {
+        value: name for name, value in vars(queries).items()
+        if name.isupper() and isinstance(value, str)
+    }
+
+
+def query_label(sql: Any) -> str:
+    if isinstance(sql, str):
+        return _query_names().get(sql, "adhoc")
+    return "adhoc"
+
+
+@contextmanager
+def time_query(label: str, backend: str, rows: int = -1):
+    """Mide una sentencia que no pasa por InstrumentedCursor.execute (ej. execute_values)"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DB_QUERY_ERRORS.inc(query=label, backend=backend)
+        raise
+    finally:
+        DB_QUERY_SECONDS.observe(time.perf_counter() - start, query=label, backend=backend)
+    if rows >= 0:
+        DB_QUERY_ROWS.observe(rows, query=label)
+
+
+class InstrumentedCursor:
+    """Proxy de cursor: mide execute/executemany y delega el resto"""
+
+    def __init__(self, cursor, backend: str):
+        self.raw = cursor
+        self._backend = backend
+
+    def execute(self, sql, params=None):
+        with time_query(query_label(sql), self._backend):
+            result = self.raw.execute(sql, params)
+        self._observe_rows(sql)
+        return result
+
+    def executemany(self, sql, seq_of_params):
+        with time_query(query_label(sql), self._backend):
+            result = self.raw.executemany(sql, seq_of_params)
+        self._observe_rows(sql)
+        return result
+
+    def _observe_rows(self, sql):
+        rowcount = getattr(self.raw, "rowcount", -1)
+        if rowcount is not None and rowcount >= 0:
+            DB_QUERY_ROWS.observe(rowcount, query=query_label(sql))
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def __iter__(self):
+        return iter(self.raw)
+
+
+def timed_operation(fn):
+    """Decorador: histograma db_operation_duration_seconds{operation=fn.__name__}"""
+    name = fn.__name__
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                DB_OPERATION_SECONDS.observe(time.perf_counter() - start, operation=name)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            DB_OPERATION_SECONDS.observe(time.perf_counter() - start, operation=name)
+    return wrapper
@@ -4,7 +4,7 @@ import google.generativeai as genai
 from typing import Optional, Dict, Any, List
 import asyncio
 import time
-from app.database import get_or_create_lead, log_interaction, get_chat_history, get_knowledge_base, get_agent_prompt
+from app.async_database import ingest_inbound_message, save_message, get_chat_history, get_knowledge_base, get_agent_prompt
 from app.config import settings
 from app.roles import Role
 
@@ -64,11 +64,11 @@ class NataliaBrain:
         """Dynamic Persona Injection based on sender role and DB config."""
         
         # 1. Fetch Knowledge for RAG (Retrieval-Augmented Generation)
-        knowledge = await asyncio.to_thread(get_knowledge_base)
+        knowledge = await get_knowledge_base()
         knowledge_str = "\n".join([f"- {k['category'].upper()}: {k['content']}" for k in knowledge])
 
         # 2. Fetch Prompt from DB (Unified Architecture)
-        raw_prompt = await asyncio.to_thread(get_agent_prompt, role)
+        raw_prompt = await get_agent_prompt(role)
         
         if not raw_prompt:
             logger.warning(f"⚠️ Falling back to Hardcoded Prompt for {role}")
@@ -102,12 +102,11 @@ class NataliaBrain:
             }
 
 
-        # 1. Lead Identification & Persistence
-        lead_id, is_new_lead = await asyncio.to_thread(get_or_create_lead, phone, meta_data)
-        await asyncio.to_thread(log_interaction, lead_id, "user", text)
+        # 1. Context Retrieval (Memory): turnos previos, antes de registrar el actual
+        history_rows = await get_chat_history(phone, limit=15)
 
-        # 2. Context Retrieval (Memory)
-        history_rows = await asyncio.to_thread(get_chat_history, phone, limit=15)
+        # 2. Lead Identification & Persistence (turno 'user' en conversation_events)
+        lead_id, is_new_lead = await ingest_inbound_message(phone, text, meta_data)
 
         # 3. Determine Role & Instantiate Agent
         # POLYMORPHIC ARCHITECTURE (Protocol Phase 3)
@@ -197,8 +196,12 @@ class NataliaBrain:
             from app.utils.error_handler import CognitiveShield
             final_reply = await CognitiveShield.handle_error(e, clean_phone, agent.role_name)
 
-        # 4. Log Output
-        await asyncio.to_thread(log_interaction, lead_id, "assistant", final_reply)
+        # 4. Turno 'assistant' con la misma clave `phone` que el inbound y el historial
+        #    (se registra aunque el envío por Evolution falle después)
+        try:
+            await save_message(phone, "assistant", final_reply)
+        except Exception as e:
+            logger.error(f"⚠️ Error registrando la respuesta de {clean_phone}: {e}")
 
         return {
             "lead_id": lead_id,
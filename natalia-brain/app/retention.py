@@ -0,0 +1,268 @@
+# =================================================================
+# RETENTION.PY - Retención y Rollup Diario de Visitantes
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# visitors es append-only y crece con cada visita. Este job:
+# 1. Resume en visitor_daily_stats los días completos fuera de la ventana
+#    VISITOR_RETENTION_DAYS (día / source / utm_campaign)
+# 2. PostgreSQL: elimina con DROP las particiones mensuales ya vencidas
+#    y borra el resto (mes parcial); SQLite: DELETE directo
+# 3. PostgreSQL: asegura particiones para los próximos meses
+# 4. PostgreSQL: purga claves viejas de outbox_applied (ver app/outbox.py)
+# Todo en una transacción; un advisory lock evita corridas simultáneas.
+#
+# Migración a particiones (PostgreSQL, paso explícito fuera del arranque):
+# 0004 solo crea visitors_partitioned vacía. partition-visitors copia el
+# histórico por lotes de ids (transacciones cortas, la web sigue escribiendo)
+# y termina con un cambio de nombre bajo un lock breve; la tabla vieja queda
+# como visitors_legacy hasta drop-legacy-visitors (que verifica la copia).
+#
+# backfill-ref-tags completa visitors.ref_tag de las visitas anteriores a la
+# migración 0003, también por lotes de ids (idempotente: se puede repetir).
+#
+# Uso: python -m app.retention [run | partition-visitors | drop-legacy-visitors | backfill-ref-tags]
+#      (o el scheduler de cada app)
+# =================================================================
+import argparse
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app import database
+import app.sql_queries as queries
+
+logger = logging.getLogger(__name__)
+
+RETENTION_LOCK_ID = 0x4A414632  # "JAF2"
+BACKFILL_BATCH_ROWS = 50000
+
+_PARTITION = re.compile(r"^visitors_p(\d{4})(\d{2})$")
+
+
+def retention_cutoff(retention_days: int, today: Optional[date] = None) -> datetime:
+    """Medianoche del primer día que se conserva (solo días completos expiran)"""
+    today = today or date.today()
+    return datetime.combine(today - timedelta(days=retention_days), datetime.min.time())
+
+
+def _partition_end(relname: str) -> Optional[date]:
+    """visitors_p202401 -> 2024-02-01 (límite superior exclusivo)"""
+    match = _PARTITION.match(relname)
+    if not match:
+        return None
+    year, month = int(match.group(1)), int(match.group(2))
+    return date(year + month // 12, month % 12 + 1, 1)
+
+
+def run_retention(retention_days: Optional[int] = None) -> Dict[str, Any]:
+    """Ejecuta un ciclo de retención. Retorna un resumen para logs/monitoreo."""
+    if retention_days is None:
+        retention_days = settings.VISITOR_RETENTION_DAYS
+
+    report: Dict[str, Any] = {
+        "backend": database.BACKEND,
+        "cutoff": None,
+        "rolled_up_groups": 0,
+        "deleted_rows": 0,
+        "dropped_partitions": [],
+        "created_partitions": 0,
+        "pruned_outbox_keys": 0,
+    }
+
+    with database.get_cursor() as cur:
+        if not cur: return report
+        is_postgres = database.BACKEND == "postgres"
+
+        if is_postgres:
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (RETENTION_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                logger.info("⏭️ Retención ya en curso en otro proceso")
+                return report
+
+        if is_postgres and retention_days > 0:
+            cur.execute(queries.SELECT_VISITOR_MIGRATION_STATE)
+            if cur.fetchone()[0]:
+                # Borrar de visitors mientras se copia dejaría filas expiradas en la copia
+                logger.info("⏭️ visitors en migración a particiones: retención pospuesta")
+                retention_days = 0
+
+        if retention_days > 0:
+            cutoff = retention_cutoff(retention_days)
+            cutoff_sql = cutoff.strftime("%Y-%m-%d %H:%M:%S")
+            report["cutoff"] = cutoff_sql
+
+            # 1. Rollup antes de borrar nada
+            cur.execute(queries.ROLLUP_VISITORS_DAILY, (cutoff_sql,))
+            report["rolled_up_groups"] = max(cur.rowcount, 0)
+
+            # 2. Particiones completas: DROP (instantáneo, sin bloat)
+            if is_postgres:
+                cur.execute(queries.SELECT_VISITOR_PARTITIONS)
+                for (relname,) in cur.fetchall():
+                    end = _partition_end(relname)
+                    if end is not None and end <= cutoff.date():
+                        cur.execute(f'DROP TABLE IF EXISTS "{relname}"')
+                        report["dropped_partitions"].append(relname)
+
+            # 3. Remanente (mes parcial / partición default / SQLite)
+            cur.execute(queries.DELETE_VISITORS_BEFORE, (cutoff_sql,))
+            report["deleted_rows"] = max(cur.rowcount, 0)
+
+        # 4. Meses por venir (si no, las visitas caerían en visitors_default)
+        if is_postgres:
+            cur.execute(queries.ENSURE_VISITOR_PARTITIONS, (settings.VISITOR_PARTITION_MONTHS_AHEAD,))
+            report["created_partitions"] = cur.fetchone()[0]
+
+        # 5. Claves de idempotencia de la outbox ya sin riesgo de replay
+        if is_postgres and settings.OUTBOX_APPLIED_RETENTION_DAYS > 0:
+            keys_cutoff = retention_cutoff(settings.OUTBOX_APPLIED_RETENTION_DAYS)
+            cur.execute(queries.PRUNE_OUTBOX_APPLIED, (keys_cutoff.strftime("%Y-%m-%d %H:%M:%S"),))
+            report["pruned_outbox_keys"] = max(cur.rowcount, 0)
+
+    logger.info(
+        f"🧹 Retención visitantes: {report['deleted_rows']} filas borradas, "
+        f"{len(report['dropped_partitions'])} particiones eliminadas, "
+        f"{report['rolled_up_groups']} grupos en visitor_daily_stats"
+    )
+    return report
+
+
+def partition_visitors(batch_size: int = BACKFILL_BATCH_ROWS) -> Dict[str, Any]:
+    """
+    Copia visitors -> visitors_partitioned por lotes y hace el cambio de nombre.
+    Reanudable: cada lote es su propia transacción y continúa desde el último id copiado.
+    """
+    report: Dict[str, Any] = {"copied_rows": 0, "swapped": False}
+    if database.BACKEND != "postgres":
+        return report
+
+    with database.get_cursor() as cur:
+        if not cur: return report
+        cur.execute(queries.SELECT_VISITOR_MIGRATION_STATE)
+        if not cur.fetchone()[0]:
+            logger.info("⏭️ visitors ya está particionada")
+            return report
+        cur.execute(queries.SELECT_VISITORS_BACKFILL_START)
+        first_seen, last_id = cur.fetchone()
+        if first_seen is not None:
+            cur.execute(queries.ENSURE_VISITOR_PARTITIONS_SINCE, (first_seen.date(),))
+
+    # 1. Histórico: lotes cortos, sin bloquear las inserciones
+    while True:
+        with database.get_cursor() as cur:
+            cur.execute(queries.BACKFILL_VISITORS_CHUNK, (last_id, batch_size))
+            copied, max_id = cur.fetchone()
+        if not copied:
+            break
+        report["copied_rows"] += copied
+        last_id = max_id
+        logger.info(f"📦 visitors -> particiones: {report['copied_rows']} filas copiadas (id <= {last_id})")
+
+    # 2. Cola de visitas recientes + cambio de nombre, con visitors bloqueada
+    with database.get_cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = '5s'")
+        cur.execute("LOCK TABLE visitors IN ACCESS EXCLUSIVE MODE")
+        while True:
+            cur.execute(queries.BACKFILL_VISITORS_CHUNK, (last_id, batch_size))
+            copied, max_id = cur.fetchone()
+            if not copied:
+                break
+            report["copied_rows"] += copied
+            last_id = max_id
+        cur.execute(queries.SWAP_VISITORS_PARTITIONED)
+    report["swapped"] = True
+
+    logger.info(f"✅ visitors particionada ({report['copied_rows']} filas); la tabla vieja queda como visitors_legacy")
+    return report
+
+
+def drop_legacy_visitors() -> Dict[str, Any]:
+    """Borra visitors_legacy si todas sus filas (dentro de la retención) están en visitors"""
+    report: Dict[str, Any] = {"missing_rows": None, "dropped": False}
+    if database.BACKEND != "postgres":
+        return report
+
+    with database.get_cursor() as cur:
+        if not cur: return report
+        cur.execute(queries.SELECT_VISITOR_MIGRATION_STATE)
+        pending, legacy = cur.fetchone()
+        if pending or not legacy:
+            logger.info("⏭️ Sin visitors_legacy para borrar (o la migración no terminó)")
+            return report
+
+        cutoff = None
+        if settings.VISITOR_RETENTION_DAYS > 0:
+            cutoff = retention_cutoff(settings.VISITOR_RETENTION_DAYS).strftime("%Y-%m-%d %H:%M:%S")
+        cur.execute(queries.COUNT_VISITORS_NOT_MIGRATED, (cutoff, cutoff))
+        report["missing_rows"] = cur.fetchone()[0]
+        if report["missing_rows"]:
+            logger.error(f"❌ {report['missing_rows']} filas de visitors_legacy no están en visitors: no se borra")
+            return report
+
+        cur.execute("DROP TABLE visitors_legacy")
+        report["dropped"] = True
+
+    logger.info("🗑️ visitors_legacy eliminada")
+    return report
+
+
+def backfill_ref_tags(batch_size: int = BACKFILL_BATCH_ROWS) -> Dict[str, Any]:
+    """
+    Completa ref_tag en las visitas anteriores a 0003 (una transacción corta por lote).
+    Al terminar se puede apagar REF_TAG_PREFIX_FALLBACK.
+    """
+    report: Dict[str, Any] = {"scanned_rows": 0, "updated_rows": 0}
+    last_id = 0
+    while True:
+        with database.get_cursor() as cur:
+            if not cur: return report
+            cur.execute(queries.SELECT_VISITOR_ID_CHUNK, (last_id, batch_size))
+            scanned, max_id = cur.fetchone()
+            if not scanned:
+                break
+            cur.execute(queries.BACKFILL_REF_TAGS, (last_id, max_id))
+            report["updated_rows"] += max(cur.rowcount, 0)
+        report["scanned_rows"] += scanned
+        last_id = max_id
+        logger.info(f"🏷️ ref_tag: {report['updated_rows']} filas completadas (id <= {last_id})")
+
+    logger.info("✅ Backfill de ref_tag terminado: REF_TAG_PREFIX_FALLBACK=false ya es seguro")
+    return report
+
+
+async def start_retention_loop():
+    """Scheduler en proceso (servicios de larga vida como natalia-brain)"""
+    interval = settings.VISITOR_RETENTION_INTERVAL_HOURS * 3600
+    logger.info(f"🧹 Retención de visitantes activa. Cada {settings.VISITOR_RETENTION_INTERVAL_HOURS:g}h")
+
+    while True:
+        try:
+            await asyncio.to_thread(run_retention)
+        except Exception as e:
+            logger.error(f"❌ Error en retención de visitantes: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retención y particiones de visitors")
+    parser.add_argument("action", nargs="?", default="run", choices=["run", "partition-visitors", "drop-legacy-visitors", "backfill-ref-tags"])
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_ROWS, help="Filas por lote al copiar")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    database.initialize()
+    try:
+        if args.action == "partition-visitors":
+            print(partition_visitors(args.batch_size))
+        elif args.action == "drop-legacy-visitors":
+            print(drop_legacy_visitors())
+        elif args.action == "backfill-ref-tags":
+            print(backfill_ref_tags(args.batch_size))
+        else:
+            print(run_retention())
+    finally:
+        database.shutdown()
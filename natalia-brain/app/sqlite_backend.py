@@ -0,0 +1,100 @@
+# =================================================================
+# SQLITE_BACKEND.PY - Backend Local Persistente (WAL)
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# Fallback local (dev / Render sin DB):
+# - Una conexión de larga vida por hilo (sin sqlite3.connect por query)
+# - Modo WAL + pragmas de escritura rápida
+# - Traducción %s -> ? cacheada por sentencia
+# =================================================================
+import logging
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# Pragmas aplicados a cada conexión nueva
+# - WAL: lectores no bloquean al escritor
+# - synchronous=NORMAL: seguro en WAL, evita fsync por commit
+# - cache_size negativo = KiB (~20 MB de page cache)
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+@lru_cache(maxsize=512)
+def translate_sql(sql: str) -> str:
+    """Adapta placeholders Postgres (%s) a SQLite (?) una vez por sentencia"""
+    return sql.replace("%s", "?")
+
+
+class SQLiteBackend:
+    """Conexiones SQLite persistentes, una por hilo"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+
+class SQLiteCursorWrapper:
+    """Adapta sintaxis Postgres (%s) a SQLite (?)"""
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, sql, params=None):
+        if params:
+            return self.cursor.execute(translate_sql(sql), params)
+        return self.cursor.execute(sql)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor.executemany(translate_sql(sql), seq_of_params)
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self.cursor.fetchmany(size) if size else self.cursor.fetchmany()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def close(self):
+        self.cursor.close()
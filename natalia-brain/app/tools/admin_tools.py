@@ -1,7 +1,8 @@
-
-from typing import Dict, Any
+from typing import Any, List, Sequence
 import logging
-from app.database import get_cursor
+from app import database
+from app.config import settings
+from app.database import get_read_cursor
 
 logger = logging.getLogger("SQLTool")
 
@@ -9,27 +10,70 @@ def run_readonly_sql(query: str) -> str:
     """
     Executes a raw SQL SELECT query in the database.
     RESTRICTED: Only for RootAgent.
+    Runs on the read pool (replica if configured): never takes write connections.
+    Bounded: read-only transaction, server-side statement_timeout, LIMIT pushed
+    down to the server and a byte cap on the rendered table (no full-table fetch).
     """
-    if not query.strip().lower().startswith("select"):
+    sql = query.strip().rstrip(";").strip()
+    if not sql.lower().startswith(("select", "with")):
         return "Error: Only SELECT queries are allowed for safety."
-        
+    if ";" in sql:
+        return "Error: Only a single SELECT statement is allowed."
+
+    max_rows = settings.SQL_TOOL_MAX_ROWS
     try:
-        with get_cursor() as cur:
-            cur.execute(query)
-            # Fetch column names
-            colnames = [desc[0] for desc in cur.description]
-            rows = cur.fetchall()
-            
-            if not rows:
-                return "Query executed successfully. Result: No rows found."
-                
-            # Format as a simple table string
-            result = [f"| {' | '.join(colnames)} |"]
-            result.append(f"| {' | '.join(['---'] * len(colnames))} |")
-            for row in rows[:10]: # Limit to 10 rows for context window
-                result.append(f"| {' | '.join(map(str, row))} |")
-                
-            return "\n".join(result)
+        with get_read_cursor() as cur:
+            _begin_readonly(cur)
+            try:
+                # La consulta del modelo queda como subconsulta: el servidor corta en max_rows + 1
+                cur.execute(f"SELECT * FROM ({sql}) AS tool_query LIMIT {max_rows + 1}")
+                colnames = [desc[0] for desc in cur.description]
+                rows = cur.fetchmany(max_rows + 1)
+            finally:
+                _end_readonly(cur)
+
+        if not rows:
+            return "Query executed successfully. Result: No rows found."
+        return _render_table(colnames, rows[:max_rows], truncated=len(rows) > max_rows)
     except Exception as e:
         logger.error(f"❌ SQL Execution Failed: {e}")
         return f"Error: {str(e)}"
+
+def _begin_readonly(cur):
+    """Transacción de solo lectura con tiempo máximo (SQLite: query_only)"""
+    if database.BACKEND == "postgres":
+        cur.execute("SET TRANSACTION READ ONLY")
+        cur.execute("SET LOCAL statement_timeout = %s", (settings.SQL_TOOL_TIMEOUT_MS,))
+    else:
+        cur.execute("PRAGMA query_only = ON")
+
+def _end_readonly(cur):
+    # SQLite: la conexión del hilo es persistente, el pragma no muere con la transacción
+    if database.BACKEND != "postgres":
+        cur.execute("PRAGMA query_only = OFF")
+
+def _cell(value: Any) -> str:
+    text = str(value).replace("\n", " ").replace("|", "\\|")
+    limit = settings.SQL_TOOL_MAX_CELL_CHARS
+    return text if len(text) <= limit else text[:limit] + "…"
+
+def _render_table(colnames: List[str], rows: Sequence[Sequence[Any]], truncated: bool) -> str:
+    """Tabla markdown de a lo sumo SQL_TOOL_MAX_BYTES (UTF-8)"""
+    lines = [
+        f"| {' | '.join(map(_cell, colnames))} |",
+        f"| {' | '.join(['---'] * len(colnames))} |",
+    ]
+    size = sum(len(line.encode()) + 1 for line in lines)
+    shown = 0
+    for row in rows:
+        line = f"| {' | '.join(map(_cell, row))} |"
+        size += len(line.encode()) + 1
+        if size > settings.SQL_TOOL_MAX_BYTES:
+            truncated = True
+            break
+        lines.append(line)
+        shown += 1
+
+    if truncated:
+        lines.append(f"(Result truncated: showing {shown} rows. Add filters or aggregate.)")
+    return "\n".join(lines)
@@ -24,13 +24,14 @@ def update_loyalty_tier(phone: str, increment: int) -> str:
         phone: WhatsApp number.
         increment: Positive or negative score change.
     """
-    from app.database import get_cursor
+    from app.database import get_cursor, mark_written
     import app.sql_queries as queries
     
     logger.info(f"📈 Updating CRM Score for {phone} by {increment}")
     try:
         with get_cursor() as cur:
             cur.execute(queries.UPDATE_LEAD_SCORE, (increment, increment, increment, phone))
+            mark_written(phone)
             return f"CRM Score updated for {phone}. Loyalty recalculated."
     except Exception as e:
         logger.error(f"❌ CRM Update Failed: {e}")
@@ -40,12 +41,13 @@ def get_sales_forecast(phone: str) -> str:
     """
     Doctoral Sales: Predicts next booking based on appointment history.
     """
-    from app.database import get_cursor
+    from app.database import get_read_cursor
     import app.sql_queries as queries
     
     logger.info(f"🔮 Generating Sales Forecast for {phone}")
     try:
-        with get_cursor() as cur:
+        # Read pool, salvo que el score de este contacto se acabe de actualizar
+        with get_read_cursor(phone) as cur:
             cur.execute(queries.GET_SALES_FORECAST, (phone,))
             row = cur.fetchone()
             if row:
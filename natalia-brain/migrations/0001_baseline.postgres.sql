@@ -0,0 +1,133 @@
+-- =================================================================
+-- 0001 BASELINE - Schema Natalia v2.0 (PostgreSQL)
+-- Equivale al antiguo init_tables() + bucle de ALTER por arranque.
+-- Idempotente: en bases existentes (Supabase) solo completa lo que falte.
+-- =================================================================
+
+DO $$ BEGIN
+    CREATE TYPE lead_status AS ENUM (
+        'new', 'interested', 'nurturing', 'ghost', 'booked',
+        'client_active', 'client_loyal', 'archived'
+    );
+EXCEPTION WHEN duplicate_object THEN null; END $$;
+
+CREATE TABLE IF NOT EXISTS business_knowledge (
+    id SERIAL PRIMARY KEY,
+    slug TEXT UNIQUE NOT NULL,
+    category TEXT NOT NULL, -- 'pricing', 'bio', 'location', 'policy'
+    content TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_slug ON business_knowledge(slug);
+
+CREATE TABLE IF NOT EXISTS visitors (
+    id SERIAL PRIMARY KEY,
+    external_id TEXT,
+    fbclid TEXT,
+    ip_address TEXT,
+    user_agent TEXT,
+    source TEXT,
+    utm_source TEXT,
+    utm_medium TEXT,
+    utm_campaign TEXT,
+    utm_term TEXT,
+    utm_content TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_visitors_external_id ON visitors(external_id);
+
+CREATE TABLE IF NOT EXISTS contacts (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    whatsapp_number TEXT UNIQUE NOT NULL,
+    full_name TEXT,
+    profile_pic_url TEXT,
+
+    fb_click_id TEXT,
+    fb_browser_id TEXT,
+    utm_source TEXT,
+    utm_medium TEXT,
+    utm_campaign TEXT,
+    utm_term TEXT,
+    utm_content TEXT,
+    web_visit_count INTEGER DEFAULT 1,
+    conversion_sent_to_meta BOOLEAN DEFAULT FALSE,
+
+    status lead_status DEFAULT 'new',
+    lead_score INTEGER DEFAULT 50,
+    pain_point TEXT,
+    service_interest TEXT,
+    service_booked_date TIMESTAMP,
+    appointment_count INTEGER DEFAULT 0,
+
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP,
+    last_interaction TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Columnas añadidas después de la v1 (bases creadas con el schema antiguo)
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS profile_pic_url TEXT;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS fb_browser_id TEXT;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS utm_term TEXT;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS utm_content TEXT;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS status lead_status DEFAULT 'new';
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS lead_score INTEGER DEFAULT 50;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS pain_point TEXT;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS service_interest TEXT;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS service_booked_date TIMESTAMP;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS appointment_count INTEGER DEFAULT 0;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS onboarding_step TEXT;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_contacts_whatsapp ON contacts(whatsapp_number);
+CREATE INDEX IF NOT EXISTS idx_contacts_status ON contacts(status);
+
+-- contact_id sigue el tipo de contacts.id (UUID)
+CREATE TABLE IF NOT EXISTS messages (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    contact_id UUID,
+    role TEXT CHECK (role IN ('user', 'assistant', 'system', 'tool')),
+    content TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (contact_id) REFERENCES contacts(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_messages_contact_id ON messages(contact_id);
+
+CREATE TABLE IF NOT EXISTS appointments (
+    id SERIAL PRIMARY KEY,
+    contact_id UUID,
+    appointment_date TIMESTAMP NOT NULL,
+    service_type TEXT,
+    status TEXT DEFAULT 'pending',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (contact_id) REFERENCES contacts(id)
+);
+
+CREATE TABLE IF NOT EXISTS leads (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    whatsapp_phone TEXT UNIQUE NOT NULL,
+    meta_lead_id TEXT,
+    click_id TEXT, -- fbclid
+    email TEXT,
+    name TEXT,
+    conversion_status TEXT DEFAULT 'NEW',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_interaction TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_leads_phone ON leads(whatsapp_phone);
+CREATE INDEX IF NOT EXISTS idx_leads_meta_id ON leads(meta_lead_id);
+
+CREATE TABLE IF NOT EXISTS interactions (
+    id SERIAL PRIMARY KEY,
+    lead_id UUID,
+    role TEXT NOT NULL, -- 'user', 'system', 'assistant'
+    content TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (lead_id) REFERENCES leads(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_interactions_lead_id ON interactions(lead_id);
@@ -0,0 +1,28 @@
+-- =================================================================
+-- 0002 HOT PATH INDEXES (PostgreSQL)
+-- Índices compuestos/parciales para las consultas calientes de sql_queries.
+-- Nota: CREATE INDEX CONCURRENTLY no puede ir dentro de la transacción
+-- de la migración; en tablas grandes créelos a mano antes del deploy
+-- (IF NOT EXISTS hace que aquí sean no-op).
+-- =================================================================
+
+-- SELECT_FBCLID_BY_EXTERNAL_ID (cada visita al home): index-only scan, sin sort
+CREATE INDEX IF NOT EXISTS idx_visitors_external_fbclid
+    ON visitors (external_id, timestamp DESC)
+    INCLUDE (fbclid)
+    WHERE fbclid IS NOT NULL;
+
+-- SELECT_RECENT_VISITORS (dashboard admin): lee el top-N del índice
+CREATE INDEX IF NOT EXISTS idx_visitors_timestamp
+    ON visitors (timestamp DESC)
+    INCLUDE (id, external_id, source, ip_address);
+
+-- SELECT_CHAT_HISTORY / COUNT_USER_MESSAGES: por contacto, ya ordenado.
+-- content queda fuera a propósito: textos largos superan el límite de
+-- tamaño de fila del btree; el LIMIT acota las visitas al heap.
+CREATE INDEX IF NOT EXISTS idx_messages_contact_created
+    ON messages (contact_id, created_at DESC)
+    INCLUDE (role);
+
+-- Prefijo del índice anterior: redundante
+DROP INDEX IF EXISTS idx_messages_contact_id;
@@ -0,0 +1,14 @@
+-- =================================================================
+-- 0003 VISITOR REF TAG (PostgreSQL)
+-- Columna corta escrita al registrar la visita: el [Ref Tag] que el
+-- frontend agrega al mensaje de WhatsApp (primeros 8 chars del external_id).
+-- Reemplaza el LIKE 'ref%' (escaneo completo) por búsqueda exacta.
+-- Las filas existentes se completan fuera del arranque, por lotes:
+--   python -m app.retention backfill-ref-tags
+-- (mientras tanto la búsqueda cae al prefijo de external_id, ver REF_TAG_PREFIX_FALLBACK)
+-- =================================================================
+
+ALTER TABLE visitors ADD COLUMN IF NOT EXISTS ref_tag TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_visitors_ref_tag
+    ON visitors (ref_tag, timestamp DESC);
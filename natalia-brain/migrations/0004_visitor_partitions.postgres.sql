@@ -0,0 +1,87 @@
+-- =================================================================
+-- 0004 VISITOR PARTITIONS + DAILY ROLLUP (PostgreSQL)
+-- Solo DDL barato: no toca ni bloquea la tabla visitors actual.
+-- - visitors_partitioned: destino particionado por mes (RANGE sobre timestamp)
+-- - Particiones visitors_pYYYYMM; visitors_default atrapa lo que caiga fuera
+-- - ensure_visitor_partitions() crea meses por adelantado (app/retention.py)
+-- - visitor_daily_stats guarda el resumen de las filas que expira la retención
+-- El histórico se copia por lotes y el cambio de nombre es un paso explícito,
+-- fuera del arranque:  python -m app.retention partition-visitors
+-- Los ids continúan la misma secuencia (visitors_id_seq).
+-- =================================================================
+
+CREATE TABLE IF NOT EXISTS visitor_daily_stats (
+    day DATE NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    utm_campaign TEXT NOT NULL DEFAULT '',
+    visits INTEGER NOT NULL DEFAULT 0,
+    unique_visitors INTEGER NOT NULL DEFAULT 0,
+    fbclid_visits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, source, utm_campaign)
+);
+
+-- 1. Tabla padre particionada, vacía (la PK debe incluir la clave de partición)
+CREATE TABLE visitors_partitioned (
+    id INTEGER NOT NULL DEFAULT nextval('visitors_id_seq'),
+    external_id TEXT,
+    fbclid TEXT,
+    ip_address TEXT,
+    user_agent TEXT,
+    source TEXT,
+    utm_source TEXT,
+    utm_medium TEXT,
+    utm_campaign TEXT,
+    utm_term TEXT,
+    utm_content TEXT,
+    ref_tag TEXT,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE visitors_default PARTITION OF visitors_partitioned DEFAULT;
+
+-- 2. Particiones mensuales [from_month, to_month] de la tabla particionada
+--    (visitors_partitioned hasta el cambio de nombre, visitors después)
+CREATE OR REPLACE FUNCTION ensure_visitor_partitions(from_month DATE, to_month DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    parent TEXT := CASE WHEN to_regclass('visitors_partitioned') IS NULL
+                        THEN 'visitors' ELSE 'visitors_partitioned' END;
+    month DATE := date_trunc('month', from_month)::DATE;
+    part TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month <= to_month LOOP
+        part := 'visitors_p' || to_char(month, 'YYYYMM');
+        IF to_regclass(part) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                part, parent, month, (month + INTERVAL '1 month')::DATE
+            );
+            created := created + 1;
+        END IF;
+        month := (month + INTERVAL '1 month')::DATE;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_visitor_partitions(
+    CAST(date_trunc('month', CURRENT_TIMESTAMP) AS DATE),
+    CAST(date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '3 months' AS DATE)
+);
+
+-- 3. Índices (0001-0003) sobre la tabla padre: se propagan a cada partición.
+--    Nombres provisorios; toman los definitivos en el cambio de nombre.
+CREATE INDEX idx_visitors_part_external_id ON visitors_partitioned (external_id);
+
+CREATE INDEX idx_visitors_part_external_fbclid
+    ON visitors_partitioned (external_id, timestamp DESC)
+    INCLUDE (fbclid)
+    WHERE fbclid IS NOT NULL;
+
+CREATE INDEX idx_visitors_part_timestamp
+    ON visitors_partitioned (timestamp DESC)
+    INCLUDE (id, external_id, source, ip_address);
+
+CREATE INDEX idx_visitors_part_ref_tag ON visitors_partitioned (ref_tag, timestamp DESC);
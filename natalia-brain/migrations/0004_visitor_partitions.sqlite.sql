@@ -0,0 +1,14 @@
+-- =================================================================
+-- 0004 VISITOR DAILY ROLLUP (SQLite)
+-- Sin particiones en SQLite: la retención hace rollup + DELETE.
+-- =================================================================
+
+CREATE TABLE IF NOT EXISTS visitor_daily_stats (
+    day DATE NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    utm_campaign TEXT NOT NULL DEFAULT '',
+    visits INTEGER NOT NULL DEFAULT 0,
+    unique_visitors INTEGER NOT NULL DEFAULT 0,
+    fbclid_visits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, source, utm_campaign)
+);
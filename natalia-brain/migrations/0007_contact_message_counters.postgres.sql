@@ -0,0 +1,61 @@
+-- =================================================================
+-- 0007 CONTACT MESSAGE COUNTERS (PostgreSQL)
+-- Contadores desnormalizados en contacts: el filtro de calidad
+-- (get_user_message_count) lee una fila en vez de JOIN + COUNT(*).
+-- Un trigger los mantiene en la misma transacción que cada INSERT/DELETE
+-- en messages; el UPDATE final es el backfill único de lo ya existente.
+-- =================================================================
+
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS user_message_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS assistant_message_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS last_user_message_at TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION count_contact_messages() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE contacts SET
+            user_message_count = user_message_count + (NEW.role = 'user')::int,
+            assistant_message_count = assistant_message_count + (NEW.role = 'assistant')::int,
+            last_user_message_at = CASE
+                WHEN NEW.role = 'user' THEN GREATEST(last_user_message_at, NEW.created_at)
+                ELSE last_user_message_at
+            END
+        WHERE id = NEW.contact_id;
+        RETURN NULL;
+    END IF;
+
+    UPDATE contacts SET
+        user_message_count = GREATEST(user_message_count - (OLD.role = 'user')::int, 0),
+        assistant_message_count = GREATEST(assistant_message_count - (OLD.role = 'assistant')::int, 0)
+    WHERE id = OLD.contact_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_messages_count_insert ON messages;
+CREATE TRIGGER trg_messages_count_insert
+    AFTER INSERT ON messages
+    FOR EACH ROW WHEN (NEW.role IN ('user', 'assistant'))
+    EXECUTE FUNCTION count_contact_messages();
+
+DROP TRIGGER IF EXISTS trg_messages_count_delete ON messages;
+CREATE TRIGGER trg_messages_count_delete
+    AFTER DELETE ON messages
+    FOR EACH ROW WHEN (OLD.role IN ('user', 'assistant'))
+    EXECUTE FUNCTION count_contact_messages();
+
+-- Backfill
+UPDATE contacts c SET
+    user_message_count = m.user_count,
+    assistant_message_count = m.assistant_count,
+    last_user_message_at = m.last_user_at
+FROM (
+    SELECT
+        contact_id,
+        COUNT(*) FILTER (WHERE role = 'user') AS user_count,
+        COUNT(*) FILTER (WHERE role = 'assistant') AS assistant_count,
+        MAX(created_at) FILTER (WHERE role = 'user') AS last_user_at
+    FROM messages
+    GROUP BY contact_id
+) m
+WHERE c.id = m.contact_id;
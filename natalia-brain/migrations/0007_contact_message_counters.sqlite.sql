@@ -0,0 +1,45 @@
+-- =================================================================
+-- 0007 CONTACT MESSAGE COUNTERS (SQLite)
+-- Ver variante PostgreSQL.
+-- =================================================================
+
+ALTER TABLE contacts ADD COLUMN user_message_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE contacts ADD COLUMN assistant_message_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE contacts ADD COLUMN last_user_message_at TIMESTAMP;
+
+CREATE TRIGGER IF NOT EXISTS trg_messages_count_insert
+AFTER INSERT ON messages
+FOR EACH ROW WHEN NEW.role IN ('user', 'assistant')
+BEGIN
+    UPDATE contacts SET
+        user_message_count = user_message_count + (NEW.role = 'user'),
+        assistant_message_count = assistant_message_count + (NEW.role = 'assistant'),
+        last_user_message_at = CASE
+            WHEN NEW.role = 'user' AND (last_user_message_at IS NULL OR NEW.created_at > last_user_message_at)
+            THEN NEW.created_at
+            ELSE last_user_message_at
+        END
+    WHERE id = NEW.contact_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_messages_count_delete
+AFTER DELETE ON messages
+FOR EACH ROW WHEN OLD.role IN ('user', 'assistant')
+BEGIN
+    UPDATE contacts SET
+        user_message_count = MAX(user_message_count - (OLD.role = 'user'), 0),
+        assistant_message_count = MAX(assistant_message_count - (OLD.role = 'assistant'), 0)
+    WHERE id = OLD.contact_id;
+END;
+
+-- Backfill
+UPDATE contacts SET
+    user_message_count = (
+        SELECT COUNT(*) FROM messages m WHERE m.contact_id = contacts.id AND m.role = 'user'
+    ),
+    assistant_message_count = (
+        SELECT COUNT(*) FROM messages m WHERE m.contact_id = contacts.id AND m.role = 'assistant'
+    ),
+    last_user_message_at = (
+        SELECT MAX(created_at) FROM messages m WHERE m.contact_id = contacts.id AND m.role = 'user'
+    );
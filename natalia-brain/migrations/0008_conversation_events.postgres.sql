@@ -0,0 +1,111 @@
+-- =================================================================
+-- 0008 CONVERSATION EVENTS (PostgreSQL)
+-- Un solo log append-only de la conversación: una fila por turno.
+-- Antes cada turno se escribía dos veces (interactions por leads.id y
+-- messages por contacts.id) y el historial solo leía messages.
+-- - seq: secuencia monótona por contacto (contacts.last_event_seq; el
+--   lock de fila del contacto serializa los turnos de una conversación)
+-- - external_message_id: id del mensaje de Evolution (deduplica reintentos)
+-- - messages / interactions quedan como vistas de compatibilidad; las tablas
+--   originales se conservan como messages_legacy / interactions_legacy y se
+--   borran en una migración posterior, una vez verificado el backfill
+-- =================================================================
+
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS last_event_seq INTEGER NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS conversation_events (
+    id BIGSERIAL PRIMARY KEY,
+    contact_id UUID NOT NULL REFERENCES contacts(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT,
+    external_message_id TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 1. Contactos para los leads que solo tenían interactions
+INSERT INTO contacts (whatsapp_number, status)
+SELECT l.whatsapp_phone, 'new'
+FROM leads l
+WHERE EXISTS (SELECT 1 FROM interactions i WHERE i.lead_id = l.id)
+ON CONFLICT (whatsapp_number) DO NOTHING;
+
+-- 2. Historial: messages completo + interactions que no estaban duplicadas en messages
+--    (mismo rol y contenido escritos en el mismo turno: ±10 s; un "ok" repetido
+--    más tarde es otro turno y se conserva)
+INSERT INTO conversation_events (contact_id, seq, role, content, created_at)
+SELECT
+    contact_id,
+    ROW_NUMBER() OVER (PARTITION BY contact_id ORDER BY created_at, source, source_id),
+    role,
+    content,
+    created_at
+FROM (
+    SELECT m.contact_id, m.role, m.content, m.created_at, 0 AS source, m.id::text AS source_id
+    FROM messages m
+    WHERE m.contact_id IS NOT NULL
+    UNION ALL
+    SELECT c.id, i.role, i.content, i.timestamp, 1, lpad(i.id::text, 20, '0')
+    FROM interactions i
+    JOIN leads l ON l.id = i.lead_id
+    JOIN contacts c ON c.whatsapp_number = l.whatsapp_phone
+    WHERE NOT EXISTS (
+        SELECT 1 FROM messages m
+        WHERE m.contact_id = c.id AND m.role = i.role AND m.content IS NOT DISTINCT FROM i.content
+          AND m.created_at BETWEEN i.timestamp - INTERVAL '10 seconds' AND i.timestamp + INTERVAL '10 seconds'
+    )
+) legacy;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_conversation_events_contact_seq
+    ON conversation_events (contact_id, seq);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_conversation_events_external_id
+    ON conversation_events (external_message_id)
+    WHERE external_message_id IS NOT NULL;
+
+-- 3. Secuencia y contadores (0007) recalculados desde el log unificado
+UPDATE contacts c SET
+    last_event_seq = e.max_seq,
+    user_message_count = e.user_count,
+    assistant_message_count = e.assistant_count,
+    last_user_message_at = e.last_user_at
+FROM (
+    SELECT
+        contact_id,
+        MAX(seq) AS max_seq,
+        COUNT(*) FILTER (WHERE role = 'user') AS user_count,
+        COUNT(*) FILTER (WHERE role = 'assistant') AS assistant_count,
+        MAX(created_at) FILTER (WHERE role = 'user') AS last_user_at
+    FROM conversation_events
+    GROUP BY contact_id
+) e
+WHERE c.id = e.contact_id;
+
+-- 4. Tablas viejas apartadas (sin los triggers de 0007) -> vistas de solo lectura
+DROP TRIGGER IF EXISTS trg_messages_count_insert ON messages;
+DROP TRIGGER IF EXISTS trg_messages_count_delete ON messages;
+ALTER TABLE messages RENAME TO messages_legacy;
+ALTER TABLE interactions RENAME TO interactions_legacy;
+
+CREATE VIEW messages AS
+SELECT id, contact_id, role, content, created_at
+FROM conversation_events;
+
+CREATE VIEW interactions AS
+SELECT e.id, l.id AS lead_id, e.role, e.content, e.created_at AS timestamp
+FROM conversation_events e
+JOIN contacts c ON c.id = e.contact_id
+JOIN leads l ON l.whatsapp_phone = c.whatsapp_number;
+
+-- 5. Contadores de 0007 ahora sobre el log
+DROP TRIGGER IF EXISTS trg_conversation_events_count_insert ON conversation_events;
+CREATE TRIGGER trg_conversation_events_count_insert
+    AFTER INSERT ON conversation_events
+    FOR EACH ROW WHEN (NEW.role IN ('user', 'assistant'))
+    EXECUTE FUNCTION count_contact_messages();
+
+DROP TRIGGER IF EXISTS trg_conversation_events_count_delete ON conversation_events;
+CREATE TRIGGER trg_conversation_events_count_delete
+    AFTER DELETE ON conversation_events
+    FOR EACH ROW WHEN (OLD.role IN ('user', 'assistant'))
+    EXECUTE FUNCTION count_contact_messages();
@@ -0,0 +1,38 @@
+import pytest
+
+from app import database, migrator
+from app.sqlite_backend import SQLiteBackend
+from app.tools.admin_tools import run_readonly_sql
+
+
+@pytest.fixture
+def local_db(tmp_path, monkeypatch):
+    backend = SQLiteBackend(str(tmp_path / "test.db"))
+    monkeypatch.setattr(database, "BACKEND", "sqlite")
+    monkeypatch.setattr(database, "_sqlite", backend)
+    migrator.migrate(database.get_cursor, "sqlite")
+    with database.get_cursor() as cur:
+        for i in range(50):
+            cur.execute("INSERT INTO business_knowledge (slug, category, content) VALUES (%s, 'faq', %s)",
+                        (f"fact_{i:02d}", "x" * 500))
+    yield database
+    backend.close_all()
+
+
+def test_result_is_row_and_byte_bounded(local_db, monkeypatch):
+    monkeypatch.setattr(database.settings, "SQL_TOOL_MAX_BYTES", 1000)
+    result = run_readonly_sql("SELECT slug, content FROM business_knowledge ORDER BY slug;")
+
+    assert len(result.encode()) < 1200
+    assert "| fact_00 |" in result
+    assert "fact_09" not in result  # Cortado por bytes antes del límite de filas
+    assert "truncated" in result
+
+
+def test_writes_and_multiple_statements_are_rejected(local_db):
+    assert run_readonly_sql("DELETE FROM business_knowledge").startswith("Error")
+    assert run_readonly_sql("SELECT 1; DELETE FROM business_knowledge").startswith("Error")
+    cte_write = "WITH gone AS (DELETE FROM business_knowledge RETURNING slug) SELECT * FROM gone"
+    assert run_readonly_sql(cte_write).startswith("Error")
+
+    assert "| 50 |" in run_readonly_sql("SELECT COUNT(*) AS n FROM business_knowledge")
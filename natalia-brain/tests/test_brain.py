@@ -9,8 +9,7 @@ def brain():
 @pytest.mark.asyncio
 async def test_role_detection_root(brain):
     # ADMIN_PHONE = "59178113055"
-    with patch("app.natalia.get_or_create_lead", return_value=(1, False)), \
-         patch("app.natalia.log_interaction"), \
+    with patch("app.natalia.ingest_inbound_message", return_value=(1, False)), \
          patch("app.natalia.get_chat_history", return_value=[]), \
          patch.object(NataliaBrain, "_generate_thought", new_callable=AsyncMock) as mock_thought:
         
@@ -22,8 +21,7 @@ async def test_role_detection_root(brain):
 
 @pytest.mark.asyncio
 async def test_role_detection_client(brain):
-    with patch("app.natalia.get_or_create_lead", return_value=(2, True)), \
-         patch("app.natalia.log_interaction"), \
+    with patch("app.natalia.ingest_inbound_message", return_value=(2, True)), \
          patch("app.natalia.get_chat_history", return_value=[]), \
          patch.object(NataliaBrain, "_generate_thought", new_callable=AsyncMock) as mock_thought:
         
@@ -35,8 +33,7 @@ async def test_role_detection_client(brain):
 
 @pytest.mark.asyncio
 async def test_intent_classification_microblading(brain):
-    with patch("app.natalia.get_or_create_lead", return_value=(3, False)), \
-         patch("app.natalia.log_interaction"), \
+    with patch("app.natalia.ingest_inbound_message", return_value=(3, False)), \
          patch("app.natalia.get_chat_history", return_value=[]), \
          patch.object(NataliaBrain, "_generate_thought", new_callable=AsyncMock) as mock_thought:
         
@@ -48,8 +45,7 @@ async def test_intent_classification_microblading(brain):
 
 @pytest.mark.asyncio
 async def test_error_handling(brain):
-    with patch("app.natalia.get_or_create_lead", return_value=(4, False)), \
-         patch("app.natalia.log_interaction"), \
+    with patch("app.natalia.ingest_inbound_message", return_value=(4, False)), \
          patch("app.natalia.get_chat_history", side_effect=Exception("Database down")):
         
         # When an exception happens in process_message, it should return a fallback message
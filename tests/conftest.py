@@ -18,3 +18,44 @@ def client():
     """
     with TestClient(app) as test_client:
         yield test_client
+
+
+@pytest.fixture
+def local_db(tmp_path, monkeypatch):
+    """
+    app.database apuntando a un SQLite temporal ya migrado.
+    Aísla las pruebas de operaciones del archivo local_fallback.db.
+    """
+    from app import database, migrator
+    from app.sqlite_backend import SQLiteBackend
+
+    backend = SQLiteBackend(str(tmp_path / "test.db"))
+    monkeypatch.setattr(database, "BACKEND", "sqlite")
+    monkeypatch.setattr(database, "_sqlite", backend)
+    migrator.migrate(database.get_cursor, "sqlite")
+    yield database
+    backend.close_all()
+
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch):
+    """
+    Como local_db, pero migrado solo hasta 0007 (messages + interactions).
+    La prueba completa la migración con migrator.migrate(...).
+    """
+    import shutil
+    from app import database, migrator
+    from app.sqlite_backend import SQLiteBackend
+
+    legacy_dir = tmp_path / "migrations"
+    legacy_dir.mkdir()
+    for name in os.listdir(migrator.MIGRATIONS_DIR):
+        if name.endswith(".sql") and name[:4] <= "0007":
+            shutil.copy(os.path.join(migrator.MIGRATIONS_DIR, name), legacy_dir)
+
+    backend = SQLiteBackend(str(tmp_path / "legacy.db"))
+    monkeypatch.setattr(database, "BACKEND", "sqlite")
+    monkeypatch.setattr(database, "_sqlite", backend)
+    migrator.migrate(database.get_cursor, "sqlite", str(legacy_dir))
+    yield database
+    backend.close_all()
@@ -0,0 +1,40 @@
+from app.cache import ref_tag_meta
+from app.config import settings
+
+
+def test_ref_tag_resolves_latest_visit(local_db, monkeypatch):
+    monkeypatch.setattr(settings, "VISITOR_WRITE_BUFFER", False)
+    ref_tag_meta.clear()
+    external_id = "abcd1234" + "0" * 24
+
+    local_db.save_visitor(external_id, None, "1.1.1.1", "UA-1", utm_data={"utm_source": "ig"})
+    with local_db.get_cursor() as cur:
+        cur.execute("UPDATE visitors SET timestamp = '2020-01-01 00:00:00'")
+    local_db.save_visitor(external_id, "fb.click", "2.2.2.2", "UA-2", utm_data={"utm_source": "facebook"})
+
+    meta = local_db.get_meta_data_by_ref("abcd1234")
+    assert meta["fbclid"] == "fb.click"
+    assert meta["utm_source"] == "facebook"
+    assert ref_tag_meta.get("abcd1234") == meta
+
+    assert local_db.get_meta_data_by_ref("zzzz9999") is None
+    assert local_db.get_meta_data_by_ref("abc") is None
+    ref_tag_meta.clear()
+
+
+def test_pre_0003_visits_resolve_by_prefix_until_backfilled(local_db, monkeypatch):
+    from app.retention import backfill_ref_tags
+
+    ref_tag_meta.clear()
+    with local_db.get_cursor() as cur:
+        # Visitas escritas antes de la columna ref_tag
+        cur.execute("INSERT INTO visitors (external_id, fbclid, source) VALUES (%s, 'fb.old', 'pagina')", ("beef0001" + "0" * 24,))
+        cur.execute("INSERT INTO visitors (external_id, source) VALUES (NULL, 'pagina')")
+
+    assert local_db.get_meta_data_by_ref("beef0001")["fbclid"] == "fb.old"
+
+    assert backfill_ref_tags(batch_size=1) == {"scanned_rows": 2, "updated_rows": 1}
+    ref_tag_meta.clear()
+    monkeypatch.setattr(settings, "REF_TAG_PREFIX_FALLBACK", False)
+    assert local_db.get_meta_data_by_ref("beef0001")["fbclid"] == "fb.old"
+    ref_tag_meta.clear()
@@ -0,0 +1,52 @@
+import pytest
+
+from app import bulk_io
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(bulk_io, "CHUNK_ROWS", 3)
+
+
+def _seed(db):
+    db.save_message("59170000050", "user", 'hola "Natalia", ¿precio?')
+    db.save_message("59170000050", "assistant", None)
+    with db.get_cursor() as cur:
+        for i in range(7):
+            cur.execute("INSERT INTO visitors (external_id, source) VALUES (%s, 'pageview')", (f"ext{i}",))
+
+
+@pytest.mark.parametrize("ext", ["csv", "jsonl"])
+def test_round_trip_restores_rows_and_is_idempotent(local_db, tmp_path, small_chunks, ext):
+    _seed(local_db)
+    files = {t: str(tmp_path / f"{t}.{ext}") for t in ("contacts", "visitors", "messages")}
+    assert bulk_io.export_table("visitors", files["visitors"]) == 7
+    bulk_io.export_table("contacts", files["contacts"])
+    assert bulk_io.export_table("messages", files["messages"]) == 2
+
+    with local_db.get_cursor() as cur:
+        cur.execute("DELETE FROM visitors")
+        cur.execute("DELETE FROM conversation_events")
+        cur.execute("DELETE FROM contacts")
+
+    assert bulk_io.import_table("visitors", files["visitors"]) == 7
+    assert bulk_io.import_table("visitors", files["visitors"]) == 0  # Re-import: sin duplicados
+    bulk_io.import_table("contacts", files["contacts"])
+    assert bulk_io.import_table("messages", files["messages"]) == 2
+
+    assert local_db.get_chat_history("59170000050", limit=5) == [
+        {"role": "user", "content": 'hola "Natalia", ¿precio?'},
+        {"role": "assistant", "content": None},
+    ]
+    # La secuencia del contacto continúa después de lo importado
+    local_db.save_message("59170000050", "user", "gracias")
+    with local_db.get_cursor() as cur:
+        cur.execute("SELECT MAX(seq) FROM conversation_events")
+        assert cur.fetchone()[0] == 3
+
+
+def test_unknown_columns_are_rejected(local_db, tmp_path):
+    path = tmp_path / "bad.csv"
+    path.write_text("external_id,not_a_column\nx,y\n")
+    with pytest.raises(ValueError):
+        bulk_io.import_table("visitors", str(path))
@@ -0,0 +1,37 @@
+import time
+
+from app.cache import TTLCache, contact_ids
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" pasa a ser la más reciente
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = TTLCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_save_message_caches_contact_id(local_db):
+    contact_ids.clear()
+    local_db.save_message("59170000002", "user", "hola")
+    contact_id = contact_ids.get("59170000002")
+    assert contact_id
+
+    local_db.save_message("59170000002", "assistant", "¡Hola! ¿En qué te ayudo?")
+    with local_db.get_cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM contacts WHERE whatsapp_number = %s", ("59170000002",))
+        assert cur.fetchone()[0] == 1
+        cur.execute("SELECT COUNT(*) FROM messages WHERE contact_id = %s", (contact_id,))
+        assert cur.fetchone()[0] == 2
+    contact_ids.clear()
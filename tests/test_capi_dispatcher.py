@@ -0,0 +1,75 @@
+import json
+
+import httpx
+import pytest
+
+from app import capi_dispatcher
+from app.capi_dispatcher import FAILED, SENT, CapiDispatcher
+
+
+class FakeGraphApi:
+    """Rechaza el lote entero (400, code 100) si trae un evento inválido, como Meta"""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, request):
+        events = json.loads(request.content)["data"]
+        self.batches.append([e["event_id"] for e in events])
+        if any(e["event_name"] == "Invalid" for e in events):
+            return httpx.Response(400, json={"error": {"code": 100, "message": "Invalid parameter"}})
+        return httpx.Response(200, json={"events_received": len(events)})
+
+
+@pytest.fixture
+def graph_api():
+    return FakeGraphApi()
+
+
+def _dispatcher(graph_api, **kwargs):
+    return CapiDispatcher(
+        lambda events: {"data": events}, transport=httpx.MockTransport(graph_api), **kwargs
+    )
+
+
+def _event(i, name="PageView"):
+    return {"event_name": name, "event_id": str(i)}
+
+
+def test_events_are_sent_in_batches(graph_api):
+    dispatcher = _dispatcher(graph_api, max_events=3, max_latency=5.0)
+    futures = [dispatcher.submit(_event(i)) for i in range(7)]
+
+    assert [f.result(timeout=5) for f in futures[:6]] == [SENT] * 6
+    dispatcher.close()  # El lote incompleto sale al cerrar, sin esperar el deadline
+    assert futures[6].result(timeout=5) == SENT
+    assert graph_api.batches == [["0", "1", "2"], ["3", "4", "5"], ["6"]]
+
+
+def test_rejected_batch_is_bisected_to_the_invalid_event(graph_api):
+    dispatcher = _dispatcher(graph_api, max_events=4, max_latency=5.0)
+    futures = [dispatcher.submit(_event(i, "Invalid" if i == 1 else "Lead")) for i in range(4)]
+
+    assert [f.result(timeout=5) for f in futures] == [SENT, FAILED, SENT, SENT]
+    assert graph_api.batches == [["0", "1", "2", "3"], ["0", "1"], ["0"], ["1"], ["2", "3"]]
+    dispatcher.close()
+
+
+def test_full_queue_drops_instead_of_growing(graph_api):
+    dispatcher = _dispatcher(graph_api, max_latency=5.0, max_pending=2)
+    futures = [dispatcher.submit(_event(i)) for i in range(3)]
+
+    assert futures[2].result(timeout=1) == FAILED
+    dispatcher.close()
+    assert [f.result(timeout=5) for f in futures[:2]] == [SENT, SENT]
+
+
+def test_startup_failure_fails_the_event_instead_of_hanging(graph_api, monkeypatch):
+    def broken_client(*args, **kwargs):
+        raise ImportError("Using http2=True, but the 'h2' package is not installed")
+
+    monkeypatch.setattr(capi_dispatcher.httpx, "AsyncClient", broken_client)
+    dispatcher = _dispatcher(graph_api)
+
+    assert dispatcher.submit(_event(1)).result(timeout=5) == FAILED
+    assert dispatcher.stats() == {"pending": 0, "running": False}
@@ -0,0 +1,72 @@
+import pytest
+
+from app.cache import RollingHistory, chat_histories
+
+
+def _turns(n):
+    return [{"role": "user", "content": str(i)} for i in range(n)]
+
+
+def test_short_conversation_is_complete_and_served_from_memory():
+    history = RollingHistory(turns=5)
+    history.hydrate("a", _turns(2), history.load_token())
+
+    assert [t["content"] for t in history.get("a", 5)] == ["0", "1"]
+    token = history.begin_write("a")
+    history.append("a", "assistant", "2", token)
+    assert [t["content"] for t in history.get("a", 2)] == ["1", "2"]
+
+
+def test_ring_buffer_keeps_last_turns_and_misses_beyond_capacity():
+    history = RollingHistory(turns=3)
+    history.hydrate("a", _turns(3), history.load_token())
+    for i in range(3, 6):
+        history.append("a", "user", str(i), history.begin_write("a"))
+
+    assert [t["content"] for t in history.get("a", 3)] == ["3", "4", "5"]
+    assert history.get("a", 4) is None  # Más de lo que guarda el buffer: BD
+
+
+def test_idle_contacts_are_evicted_lru():
+    history = RollingHistory(turns=3, max_contacts=2)
+    for key in ("a", "b"):
+        history.hydrate(key, _turns(1), history.load_token())
+    history.get("a", 1)  # "b" pasa a ser el menos usado
+    history.hydrate("c", _turns(1), history.load_token())
+
+    assert history.get("b", 1) is None
+    assert history.get("a", 1) is not None
+    assert history.stats()["evictions"] == 1
+
+
+def test_load_racing_a_write_is_discarded():
+    history = RollingHistory(turns=3)
+    token = history.load_token()
+    history.begin_write("a")  # Un save_message empezó durante la lectura
+    assert history.hydrate("a", _turns(1), token) is False
+    assert history.get("a", 1) is None
+
+    # Cargada después de que la escritura empezó: el append no debe duplicar
+    write = history.begin_write("a")
+    history.hydrate("a", _turns(2), history.load_token())
+    history.append("a", "user", "1", write)
+    assert history.get("a", 1) is None
+
+
+@pytest.fixture
+def db(local_db):
+    chat_histories.clear()
+    yield local_db
+    chat_histories.clear()
+
+
+def test_active_conversation_costs_no_queries(db, monkeypatch):
+    db.save_message("59170000010", "user", "hola")
+    assert db.get_chat_history("59170000010", limit=15) == [{"role": "user", "content": "hola"}]
+
+    def no_db():
+        raise AssertionError("get_chat_history no debería tocar la BD")
+
+    db.save_message("59170000010", "assistant", "¡Hola!")
+    monkeypatch.setattr(db, "get_cursor", no_db)
+    assert [t["content"] for t in db.get_chat_history("59170000010", limit=15)] == ["hola", "¡Hola!"]
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import pytest
+
+from app.circuit_breaker import (
+    CLOSED, HALF_OPEN, OPEN,
+    CircuitBreaker, CircuitOpenError, backoff_delay, on_event_loop_thread,
+)
+
+
+def test_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as exc:
+        breaker.before_call()
+    assert exc.value.retry_after > 0
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_allows_single_probe_then_closes():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == HALF_OPEN
+
+    breaker.before_call()  # la prueba
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # el resto sigue en fail-fast
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_for_longer():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.01, max_reset_timeout=10)
+    breaker.record_failure()
+    time.sleep(0.02)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()["trips"] == 2
+
+
+def test_backoff_is_jittered_and_capped():
+    delays = [backoff_delay(attempt, base=0.1, cap=0.5) for attempt in range(10) for _ in range(20)]
+    assert all(0 <= d <= 0.5 for d in delays)
+    assert len(set(delays)) > 1
+
+
+def test_event_loop_detection():
+    assert on_event_loop_thread() is False
+
+    async def inside():
+        return on_event_loop_thread()
+
+    assert asyncio.run(inside()) is True
@@ -0,0 +1,77 @@
+import pytest
+
+from app.cache import chat_histories
+
+
+@pytest.fixture
+def db(local_db):
+    chat_histories.clear()
+    yield local_db
+    chat_histories.clear()
+
+
+def _events(db, phone):
+    with db.get_cursor() as cur:
+        cur.execute(
+            "SELECT e.seq, e.role, e.content FROM conversation_events e "
+            "JOIN contacts c ON c.id = e.contact_id WHERE c.whatsapp_number = %s ORDER BY e.seq",
+            (phone,)
+        )
+        return cur.fetchall()
+
+
+def test_one_row_per_turn_with_monotonic_seq(db):
+    phone = "59170000030"
+    lead_id, is_new = db.ingest_inbound_message(phone, "hola", {"message_ids": ["wamid.1", "wamid.2"]})
+    db.save_message(phone, "assistant", "¡Hola!")
+    assert db.log_interaction(lead_id, "user", "precio?")
+
+    assert is_new
+    assert _events(db, phone) == [(1, "user", "hola"), (2, "assistant", "¡Hola!"), (3, "user", "precio?")]
+    assert db.get_chat_history(phone, limit=2) == [
+        {"role": "assistant", "content": "¡Hola!"},
+        {"role": "user", "content": "precio?"},
+    ]
+    assert db.log_interaction("no-existe", "user", "x") is False
+
+
+def test_webhook_retry_does_not_duplicate_turn(db):
+    phone = "59170000031"
+    db.ingest_inbound_message(phone, "hola", {"message_id": "wamid.9"})
+    db.get_chat_history(phone, limit=15)
+    db.ingest_inbound_message(phone, "hola", {"message_id": "wamid.9"})
+
+    assert [row[2] for row in _events(db, phone)] == ["hola"]
+    assert db.get_chat_history(phone, limit=15) == [{"role": "user", "content": "hola"}]
+    assert db.get_user_message_count(phone) == 1
+
+
+def test_legacy_tables_migrate_into_the_log(legacy_db):
+    from app import migrator
+
+    phone = "59170000032"
+    with legacy_db.get_cursor() as cur:
+        cur.execute("INSERT INTO contacts (id, whatsapp_number) VALUES ('c1', %s)", (phone,))
+        cur.execute("INSERT INTO leads (id, whatsapp_phone) VALUES ('l1', %s)", (phone,))
+        cur.execute("INSERT INTO interactions (lead_id, role, content, timestamp) VALUES ('l1', 'user', 'hola', '2025-01-01 10:00:00')")
+        # La respuesta se escribía en ambas tablas: debe quedar una sola vez
+        cur.execute("INSERT INTO interactions (lead_id, role, content, timestamp) VALUES ('l1', 'assistant', '¡Hola!', '2025-01-01 10:00:01')")
+        cur.execute("INSERT INTO messages (id, contact_id, role, content, created_at) VALUES ('m1', 'c1', 'assistant', '¡Hola!', '2025-01-01 10:00:01')")
+        # El mismo texto en otro turno (fuera de la ventana) no es un duplicado
+        cur.execute("INSERT INTO interactions (lead_id, role, content, timestamp) VALUES ('l1', 'assistant', '¡Hola!', '2025-01-02 09:00:00')")
+    migrator.migrate(legacy_db.get_cursor, "sqlite")
+
+    assert _events(legacy_db, phone) == [(1, "user", "hola"), (2, "assistant", "¡Hola!"), (3, "assistant", "¡Hola!")]
+    with legacy_db.get_cursor() as cur:
+        # Las tablas viejas quedan como vistas de solo lectura; los datos originales, apartados
+        cur.execute("SELECT role FROM interactions WHERE lead_id = 'l1' ORDER BY id")
+        assert [row[0] for row in cur.fetchall()] == ["user", "assistant", "assistant"]
+        cur.execute("SELECT COUNT(*) FROM interactions_legacy")
+        assert cur.fetchone()[0] == 3
+        cur.execute("SELECT COUNT(*) FROM messages_legacy")
+        assert cur.fetchone()[0] == 1
+        cur.execute("SELECT last_event_seq FROM contacts WHERE id = 'c1'")
+        assert cur.fetchone()[0] == 3
+
+    legacy_db.save_message(phone, "user", "precio?")
+    assert _events(legacy_db, phone)[-1] == (4, "user", "precio?")
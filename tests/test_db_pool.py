@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from app.db_pool import ThreadedPool, PoolTimeoutError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.conn.pings += 1
+        if self.conn.dead:
+            raise Exception("server closed the connection unexpectedly")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+        self.pings = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+def test_prewarm_opens_min_connections():
+    pool = ThreadedPool(FakeConnection, minconn=3, maxconn=5)
+    assert pool.prewarm() == 3
+    stats = pool.stats()
+    assert stats["size"] == 3
+    assert stats["idle"] == 3
+
+
+def test_recent_connection_is_not_pinged():
+    """Sin SELECT 1 en cada checkout: solo se valida lo que estuvo ocioso"""
+    pool = ThreadedPool(FakeConnection, minconn=1, maxconn=2, validate_after=60)
+    pool.prewarm()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn = pool.getconn()
+    assert conn.pings == 0
+    assert pool.stats()["validations"] == 0
+
+
+def test_stale_connection_is_replaced():
+    pool = ThreadedPool(FakeConnection, minconn=1, maxconn=1, validate_after=0)
+    pool.prewarm()
+    conn = pool.getconn()
+    conn.dead = True
+    pool.putconn(conn)
+
+    fresh = pool.getconn()
+    assert fresh is not conn
+    assert conn.closed == 1
+    stats = pool.stats()
+    assert stats["discarded"] == 1
+    assert stats["size"] == 1
+
+
+def test_exhausted_pool_times_out():
+    pool = ThreadedPool(FakeConnection, minconn=0, maxconn=1, acquire_timeout=0.05)
+    pool.getconn()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_waiter_gets_released_connection():
+    pool = ThreadedPool(FakeConnection, minconn=0, maxconn=1, acquire_timeout=2)
+    conn = pool.getconn()
+
+    def release():
+        time.sleep(0.05)
+        pool.putconn(conn)
+
+    threading.Thread(target=release).start()
+    assert pool.getconn() is conn
+    stats = pool.stats()
+    assert stats["waits"] == 1
+    assert stats["max_wait_ms"] > 0
+
+
+def test_concurrent_checkouts_never_exceed_max():
+    pool = ThreadedPool(FakeConnection, minconn=0, maxconn=4, acquire_timeout=5)
+    peak = []
+
+    def worker():
+        for _ in range(50):
+            conn = pool.getconn()
+            peak.append(pool.stats()["in_use"])
+            pool.putconn(conn)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert max(peak) <= 4
+    assert pool.stats()["checkouts"] == 400
@@ -0,0 +1,90 @@
+import time
+
+import httpx
+
+from app import tracking
+
+from app.capi_dispatcher import QUEUED, CapiDispatcher
+from app.delivery_queue import DeliveryQueue, DeliveryWorker, Outcome, RateLimited
+
+
+def _queue(tmp_path, **kwargs):
+    return DeliveryQueue(str(tmp_path / "deliveries.db"), **kwargs)
+
+
+def test_failures_back_off_and_dead_letter(tmp_path):
+    queue = _queue(tmp_path, max_attempts=3, base_delay=10.0)
+    queue.append("n8n", [{"n": 1}], "HTTP 502", delay=0)
+    [entry] = queue.due("n8n", 10)
+
+    assert queue.record_failure(entry, "HTTP 502") is False
+    assert queue.due("n8n", 10) == []  # Backoff: tras el 2º intento espera entre 10 y 20 s
+    assert queue.due("n8n", 10, now=time.time() + 21)[0].attempts == 2
+
+    assert queue.record_failure(queue.due("n8n", 10, now=time.time() + 60)[0], "HTTP 502") is True
+    assert queue.counts() == {"depth": 0, "dead": 1}
+
+
+def test_worker_redelivers_and_pauses_on_rate_limit(tmp_path):
+    queue = _queue(tmp_path)
+    queue.append("meta_capi", [{"event_id": "1"}, {"event_id": "2"}, {"event_id": "bad"}], delay=0)
+    calls = []
+
+    def handler(events):
+        calls.append(len(events))
+        if len(calls) == 1:
+            raise RateLimited(retry_after=30)
+        return [Outcome(e["event_id"] != "bad", "HTTP 400", permanent=True) for e in events]
+
+    worker = DeliveryWorker(queue, {"meta_capi": handler})
+    assert worker.drain_once("meta_capi") == 0
+    assert worker.paused_for("meta_capi") > 25
+    assert worker.drain_once("meta_capi") == 0 and calls == [3]  # En pausa: ni lo intenta
+
+    worker._paused_until.clear()
+    assert worker.drain_once("meta_capi") == 3
+    assert queue.counts() == {"depth": 0, "dead": 1}
+    assert worker.stats()["delivered"] == 2
+
+
+def test_rate_limit_mid_batch_keeps_what_was_already_delivered(tmp_path, monkeypatch):
+    queue = _queue(tmp_path)
+    queue.append("n8n", [{"n": 1}, {"n": 2}, {"n": 3}], delay=0)
+    posted = []
+
+    def n8n(request):
+        posted.append(request)
+        return httpx.Response(200 if len(posted) == 1 else 429, headers={"Retry-After": "60"})
+
+    monkeypatch.setattr(tracking.settings, "N8N_WEBHOOK_URL", "https://n8n.test/webhook")
+    monkeypatch.setattr(tracking, "sync_client", httpx.Client(transport=httpx.MockTransport(n8n)))
+    worker = DeliveryWorker(queue, {"n8n": tracking._redeliver_n8n})
+
+    assert worker.drain_once("n8n") == 1
+    assert worker.paused_for("n8n") > 50
+    # El webhook entregado no vuelve a salir tras la pausa (n8n no deduplica)
+    worker._paused_until.clear()
+    assert [e.payload["n"] for e in queue.due("n8n", 10)] == [2, 3]
+    assert [e.attempts for e in queue.due("n8n", 10)] == [1, 1]
+
+
+def test_dispatcher_hands_transient_failures_to_the_retry_queue():
+    posts, retried = [], []
+
+    def graph_api(request):
+        posts.append(request)
+        return httpx.Response(429, headers={"Retry-After": "120"}, json={"error": {"code": 4}})
+
+    dispatcher = CapiDispatcher(
+        lambda events: {"data": events}, max_events=1, max_latency=0.01,
+        transport=httpx.MockTransport(graph_api),
+        on_retry=lambda events, error, delay: retried.append((len(events), delay)) or True,
+    )
+    futures = [dispatcher.submit({"event_name": "Lead", "event_id": str(i)}) for i in range(3)]
+    assert [f.result(timeout=5) for f in futures] == [QUEUED] * 3
+    dispatcher.close()
+
+    # Tras el primer 429 la Graph API no vuelve a recibir nada hasta que pase la pausa
+    assert len(posts) == 1
+    assert retried[0] == (1, 120.0)
+    assert [n for n, _ in retried] == [1, 1, 1] and all(d > 100 for _, d in retried)
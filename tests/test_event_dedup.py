@@ -0,0 +1,94 @@
+from concurrent.futures import Future
+
+import httpx
+import pytest
+
+from app import tracking
+from app.capi_dispatcher import FAILED, SENT, CapiDispatcher
+from app.event_dedup import EventDeduplicator
+
+
+class FakeRedis:
+    """SET NX EX compartido entre 'workers' (dos deduplicadores)"""
+
+    def __init__(self):
+        self.keys = {}
+        self.down = False
+
+    def set(self, key, value, nx=False, ex=None):
+        if self.down:
+            raise ConnectionError("redis down")
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = value
+        return True
+
+    def delete(self, key):
+        self.keys.pop(key, None)
+
+
+def test_duplicates_are_detected_across_workers():
+    shared = FakeRedis()
+    worker_a, worker_b = EventDeduplicator(), EventDeduplicator()
+    worker_a._redis = worker_b._redis = shared
+
+    assert worker_a.claim("Lead", "e1") is True
+    assert worker_a.claim("Lead", "e1") is False  # Caché local, sin ir a Redis
+    assert worker_b.claim("Lead", "e1") is False  # Otro worker: lo ve Redis
+    assert worker_b.claim("PageView", "e1") is True
+    assert worker_b.stats()["shared_duplicates"] == 1
+
+    shared.down = True
+    assert worker_a.claim("Lead", "e2") is True  # Redis caído: solo dedup local
+    assert worker_a.stats()["shared_up"] == 0
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    results = []
+
+    def submit(event):
+        future = Future()
+        future.set_result(results.pop(0))
+        return future
+
+    monkeypatch.setattr(tracking.settings, "META_SANDBOX_MODE", False)
+    monkeypatch.setattr(tracking, "event_dedup", EventDeduplicator())
+    monkeypatch.setattr(tracking.capi_dispatcher, "submit", submit)
+    return results
+
+
+def test_send_event_short_circuits_duplicates(dispatched, monkeypatch):
+    dispatched.extend([FAILED, SENT])
+    send = lambda: tracking.send_event("Lead", "https://x", "1.1.1.1", "ua", "evt-1")
+
+    assert send() is False  # Falló: la clave se libera
+    assert send() is True
+    assert send() is True and dispatched == []  # Tercera copia: no llega al dispatcher
+    assert tracking.event_dedup.stats()["hit_rate"] == pytest.approx(1 / 3, abs=0.001)
+
+
+def test_queued_event_is_not_resent_on_celery_retry(monkeypatch):
+    posts, queued = [], []
+
+    def graph_api(request):
+        posts.append(request)
+        return httpx.Response(503, json={"error": {"message": "Service unavailable"}})
+
+    dispatcher = CapiDispatcher(
+        lambda events: {"data": events}, max_events=1, max_latency=0.01,
+        transport=httpx.MockTransport(graph_api),
+        on_retry=lambda events, error, delay: queued.extend(events) or True,
+    )
+    monkeypatch.setattr(tracking.settings, "META_SANDBOX_MODE", False)
+    monkeypatch.setattr(tracking, "event_dedup", EventDeduplicator())
+    monkeypatch.setattr(tracking, "capi_dispatcher", dispatcher)
+    send = lambda: tracking.send_event("Lead", "https://x", "1.1.1.1", "ua", "evt-503")
+
+    # 5xx: el evento queda en la cola de reintentos; para Celery es un éxito
+    assert send() is True
+    # Un reintento de Celery (o cualquier otra copia) no vuelve a hacer el POST
+    assert send() is True
+    dispatcher.close()
+    assert len(posts) == 1
+    assert [e["event_id"] for e in queued] == ["evt-503"]
@@ -0,0 +1,40 @@
+import hashlib
+
+from app import tracking
+from app.hashing import PII_KEY, generate_external_id, hash_events, hash_value, normalize_phone
+
+
+def _sha(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def test_identifiers_follow_meta_normalization():
+    assert normalize_phone("+591 700-00050") == "59170000050"
+    assert normalize_phone("70000050") == "59170000050"  # Local: región por defecto (BO)
+    assert normalize_phone("0059170000050") == "59170000050"
+    assert hash_value(" Cliente@Mail.COM ", "em") == _sha("cliente@mail.com")
+    assert hash_value("70000050", "ph") == _sha("59170000050")
+    assert hash_value("", "em") is None
+
+
+def test_batch_hashing_moves_pii_into_user_data_once():
+    events = [
+        tracking._build_event("Lead", "https://x", "1.1.1.1", "ua", str(i), phone="70000050", email="A@b.com")
+        for i in range(3)
+    ]
+    assert "ph" not in events[0]["user_data"] and events[0][PII_KEY]["ph"] == "70000050"
+
+    before = hash_value.cache_info().hits
+    hash_events(events)
+    assert all(PII_KEY not in e and e["user_data"]["ph"] == _sha("59170000050") for e in events)
+    assert hash_value.cache_info().hits - before >= 4  # Mismo visitante: 2 hashes, 4 aciertos
+
+    assert hash_events(events)[0]["user_data"]["em"] == _sha("a@b.com")  # Reintento: sin doble hash
+
+
+def test_single_event_payload_is_hashed_and_external_id_memoized():
+    payload = tracking._build_payload("Lead", "https://x", "1.1.1.1", "ua", "e1", external_id="Visitor-1")
+    assert payload["data"][0]["user_data"]["external_id"] == _sha("visitor-1")
+
+    assert generate_external_id("1.1.1.1", "ua") == _sha("1.1.1.1_ua")[:32]
+    assert generate_external_id("1.1.1.1", "ua") is generate_external_id("1.1.1.1", "ua")
@@ -16,3 +16,10 @@ def test_health_check(client):
     assert data["status"] == "healthy"
     assert "database" in data
     # No fallamos si la DB no está configurada en CI, pero verificamos que la key exista
+
+def test_metrics_endpoint(client):
+    """Exposición en formato texto Prometheus"""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE db_query_duration_seconds histogram" in response.text
@@ -0,0 +1,65 @@
+import pytest
+
+from app.cache import VersionWatermark, knowledge, knowledge_version, invalidate_knowledge
+
+
+@pytest.fixture
+def db(local_db):
+    invalidate_knowledge()
+    yield local_db
+    invalidate_knowledge()
+
+
+def _query_count(monkeypatch, db):
+    calls = []
+    original = db.get_cursor
+
+    def counting_cursor():
+        calls.append(1)
+        return original()
+
+    monkeypatch.setattr(db, "get_cursor", counting_cursor)
+    return calls
+
+
+def test_watermark_reports_changes_only_after_first_read():
+    watermark = VersionWatermark(interval=60)
+    assert watermark.due()
+    assert watermark.observe(("1:a", "0:")) is False
+    assert not watermark.due()
+    assert watermark.observe(("1:a", "0:")) is False
+    assert watermark.observe(("2:b", "0:")) is True
+    watermark.expire()
+    assert watermark.due()
+
+
+def test_repeated_reads_hit_the_cache(db, monkeypatch):
+    db.save_knowledge_fact("precio_botox", "pricing", "Botox desde 1500 Bs")
+    assert db.get_knowledge_base()[0]["slug"] == "precio_botox"
+
+    calls = _query_count(monkeypatch, db)
+    for _ in range(5):
+        assert len(db.get_knowledge_base()) == 1
+    assert calls == []
+    assert knowledge.stats()["hits"] >= 5
+
+
+def test_save_invalidates_immediately(db):
+    db.save_knowledge_fact("horario", "policy", "Lunes a viernes")
+    assert db.get_knowledge_base("policy")[0]["content"] == "Lunes a viernes"
+
+    db.save_knowledge_fact("horario", "policy", "Lunes a sábado")
+    assert db.get_knowledge_base("policy")[0]["content"] == "Lunes a sábado"
+
+
+def test_external_change_detected_by_watermark(db):
+    db.save_knowledge_fact("bio", "bio", "Cirujano plástico")
+    assert len(db.get_knowledge_base()) == 1
+
+    # Otro worker escribe directo en la BD (sin pasar por este proceso)
+    with db.get_cursor() as cur:
+        cur.execute("INSERT INTO business_knowledge (slug, category, content) VALUES ('nuevo', 'bio', 'x')")
+    assert len(db.get_knowledge_base()) == 1  # Dentro del intervalo: caché
+
+    knowledge_version.expire()  # Simula que venció KNOWLEDGE_VERSION_CHECK_SECONDS
+    assert len(db.get_knowledge_base()) == 2
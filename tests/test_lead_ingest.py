@@ -0,0 +1,13 @@
+def test_ingest_creates_lead_then_reuses_it(local_db):
+    lead_id, is_new = local_db.ingest_inbound_message("59170000001", "hola", {"name": "Ana"})
+    assert lead_id and is_new
+
+    same_id, is_new = local_db.ingest_inbound_message("59170000001", "precio?", {"email": "ana@mail.com"})
+    assert same_id == lead_id
+    assert is_new is False
+
+    with local_db.get_cursor() as cur:
+        cur.execute("SELECT name, email FROM leads WHERE id = %s", (lead_id,))
+        assert cur.fetchone() == ("Ana", "ana@mail.com")
+        cur.execute("SELECT role, content FROM interactions WHERE lead_id = %s ORDER BY id", (lead_id,))
+        assert cur.fetchall() == [("user", "hola"), ("user", "precio?")]
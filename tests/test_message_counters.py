@@ -0,0 +1,31 @@
+def test_counters_follow_inserts_and_deletes(local_db):
+    phone = "59170000020"
+    assert local_db.get_user_message_count(phone) == 0
+
+    local_db.save_message(phone, "user", "hola")
+    local_db.save_message(phone, "assistant", "¡Hola!")
+    local_db.save_message(phone, "user", "precio?")
+    local_db.save_message(phone, "system", "nota interna")
+
+    counters = local_db.get_message_counters(phone)
+    assert counters["user"] == 2
+    assert counters["assistant"] == 1
+    assert counters["last_user_message_at"] is not None
+
+    with local_db.get_cursor() as cur:
+        cur.execute("DELETE FROM conversation_events WHERE content = %s", ("precio?",))
+    assert local_db.get_user_message_count(phone) == 1
+
+
+def test_migration_backfills_existing_messages(legacy_db):
+    from app import migrator
+
+    phone = "59170000021"
+    with legacy_db.get_cursor() as cur:
+        # Estado previo: mensajes guardados antes de los contadores
+        cur.execute("INSERT INTO contacts (id, whatsapp_number) VALUES ('c1', %s)", (phone,))
+        cur.execute("INSERT INTO messages (id, contact_id, role, content) VALUES ('m1', 'c1', 'user', 'hola')")
+        cur.execute("UPDATE contacts SET user_message_count = 0 WHERE id = 'c1'")
+    migrator.migrate(legacy_db.get_cursor, "sqlite")
+
+    assert legacy_db.get_user_message_count(phone) == 1
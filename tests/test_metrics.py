@@ -0,0 +1,29 @@
+from app import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    hist = metrics.Histogram("test_latency_seconds", "test", ["query"], buckets=(0.1, 1.0))
+    hist.observe(0.05, query="A")
+    hist.observe(0.5, query="A")
+    hist.observe(5, query="A")
+    lines = hist.collect()
+    assert 'test_latency_seconds_bucket{query="A",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{query="A",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{query="A",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{query="A"} 3' in lines
+
+
+def test_query_label_uses_sql_queries_constant_name():
+    import app.sql_queries as queries
+    assert metrics.query_label(queries.SELECT_CHAT_HISTORY) == "SELECT_CHAT_HISTORY"
+    assert metrics.query_label("SELECT 1") == "adhoc"
+
+
+def test_operations_record_query_and_operation_latency(local_db):
+    queries_before = metrics.DB_QUERY_SECONDS.snapshot(query="SELECT_CHAT_HISTORY", backend="sqlite")["count"]
+    ops_before = metrics.DB_OPERATION_SECONDS.snapshot(operation="get_chat_history")["count"]
+
+    local_db.get_chat_history("59170000004")
+
+    assert metrics.DB_QUERY_SECONDS.snapshot(query="SELECT_CHAT_HISTORY", backend="sqlite")["count"] == queries_before + 1
+    assert metrics.DB_OPERATION_SECONDS.snapshot(operation="get_chat_history")["count"] == ops_before + 1
@@ -0,0 +1,93 @@
+import filecmp
+import os
+from contextlib import contextmanager
+
+import pytest
+
+from app import migrator
+from app.sqlite_backend import SQLiteBackend, SQLiteCursorWrapper
+
+
+class CountingDB:
+    def __init__(self, path):
+        self.backend = SQLiteBackend(path)
+        self.statements = 0
+
+    @contextmanager
+    def get_cursor(self):
+        conn = self.backend.connection()
+        cur = SQLiteCursorWrapper(conn.cursor())
+        original = cur.execute
+
+        def execute(sql, params=None):
+            self.statements += 1
+            return original(sql, params)
+
+        cur.execute = execute
+        try:
+            yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+    def columns(self, table):
+        rows = self.backend.connection().execute(f"PRAGMA table_info({table})").fetchall()
+        return {r[1] for r in rows}
+
+
+def test_fresh_database_is_migrated_then_fast_path(tmp_path):
+    db = CountingDB(str(tmp_path / "local.db"))
+    target = migrator.latest_version("sqlite")
+
+    assert migrator.migrate(db.get_cursor, "sqlite") == target
+    assert {"id", "whatsapp_number", "lead_score"} <= db.columns("contacts")
+    assert "contact_id" in db.columns("messages")
+
+    # Segundo arranque: una sola consulta a schema_version
+    db.statements = 0
+    assert migrator.migrate(db.get_cursor, "sqlite") == target
+    assert db.statements == 1
+    db.backend.close_all()
+
+
+def test_legacy_contacts_table_gains_columns(tmp_path):
+    db = CountingDB(str(tmp_path / "local.db"))
+    with db.get_cursor() as cur:
+        cur.execute("CREATE TABLE contacts (id TEXT PRIMARY KEY, whatsapp_number TEXT UNIQUE, status TEXT)")
+
+    migrator.migrate(db.get_cursor, "sqlite")
+    assert {"status", "onboarding_step", "is_admin"} <= db.columns("contacts")
+    db.backend.close_all()
+
+
+def test_split_sqlite_statements_keeps_triggers_whole():
+    sql = """
+    -- comentario
+    CREATE TABLE a (x INTEGER);
+    CREATE TRIGGER t AFTER INSERT ON a BEGIN
+        UPDATE a SET x = x + 1;
+    END;
+    """
+    statements = migrator.split_sqlite_statements(sql)
+    assert len(statements) == 2
+    assert statements[1].endswith("END;")
+
+
+def test_missing_or_empty_migrations_fail_loudly(tmp_path):
+    with pytest.raises(migrator.MigrationsNotFoundError):
+        migrator.load_migrations("sqlite", str(tmp_path / "missing"))
+    with pytest.raises(migrator.MigrationsNotFoundError):
+        migrator.load_migrations("sqlite", str(tmp_path))
+
+
+def test_natalia_brain_bundles_the_same_migrations():
+    # Render despliega natalia-brain con rootDir propio: lleva su copia de migrations/
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    shared, bundled = os.path.join(root, "migrations"), os.path.join(root, "natalia-brain", "migrations")
+    names = sorted(os.listdir(shared))
+    assert sorted(os.listdir(bundled)) == names
+    _, mismatch, errors = filecmp.cmpfiles(shared, bundled, names, shallow=False)
+    assert mismatch == [] and errors == []
@@ -0,0 +1,84 @@
+import pytest
+
+from app.outbox import LocalOutbox, OutboxReplayer
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    box = LocalOutbox(str(tmp_path / "outbox.db"), max_attempts=2)
+    yield box
+    box.close()
+
+
+@pytest.fixture
+def target(local_db):
+    """SQLite migrado + tablas que en PostgreSQL crean las migraciones"""
+    with local_db.get_cursor() as cur:
+        cur.execute("CREATE TABLE outbox_applied (idempotency_key TEXT PRIMARY KEY)")
+        cur.execute("CREATE TABLE replayed (value TEXT)")
+    return local_db
+
+
+def _insert(cur, payload):
+    if payload["value"] == "bad":
+        raise ValueError("fila inválida")
+    cur.execute("INSERT INTO replayed (value) VALUES (%s)", (payload["value"],))
+
+
+def _replayed(db):
+    with db.get_cursor() as cur:
+        cur.execute("SELECT value FROM replayed ORDER BY value")
+        return [row[0] for row in cur.fetchall()]
+
+
+def test_append_is_durable_and_idempotent(outbox, tmp_path):
+    outbox.append("op", {"value": "a"}, key="k1")
+    outbox.append("op", {"value": "a"}, key="k1")
+    outbox.append("op", {"value": "b"})
+    outbox.close()
+
+    reopened = LocalOutbox(str(tmp_path / "outbox.db"))
+    entries = reopened.pending(10)
+    assert [e.payload["value"] for e in entries] == ["a", "b"]
+    assert entries[0].key == "k1"
+    reopened.close()
+
+
+def test_replay_applies_batch_and_isolates_bad_entries(outbox, target):
+    for value in ("a", "bad", "b"):
+        outbox.append("insert", {"value": value})
+    replayer = OutboxReplayer(outbox, target.get_cursor, {"insert": _insert}, lambda: True)
+
+    assert replayer.drain_once() == 2
+    assert _replayed(target) == ["a", "b"]
+    assert outbox.counts() == {"depth": 1, "dead": 0}
+
+    # Tras max_attempts la entrada queda "dead" y deja de reintentarse
+    replayer.drain_once()
+    assert outbox.counts() == {"depth": 0, "dead": 1}
+    assert replayer.drain_once() == 0
+    assert replayer.stats()["failures"] == 2
+
+
+def test_replay_skips_keys_already_applied(outbox, target):
+    outbox.append("insert", {"value": "a"}, key="same")
+    replayer = OutboxReplayer(outbox, target.get_cursor, {"insert": _insert}, lambda: True)
+    replayer.drain_once()
+
+    # Crash entre el COMMIT y el borrado local: la entrada reaparece
+    outbox.append("insert", {"value": "a"}, key="same")
+    assert replayer.drain_once() == 1
+    assert _replayed(target) == ["a"]
+    assert replayer.stats()["duplicates"] == 1
+
+
+def test_outbox_only_takes_transient_errors(local_db, monkeypatch):
+    from app.circuit_breaker import CircuitOpenError
+
+    monkeypatch.setattr(local_db.settings, "OUTBOX_ENABLED", True)
+    assert local_db.outbox_write("log_interaction", {}, CircuitOpenError("postgres", 1)) is False  # SQLite
+
+    monkeypatch.setattr(local_db, "BACKEND", "postgres")
+    assert local_db.is_transient_db_error(CircuitOpenError("postgres", 1))
+    assert not local_db.is_transient_db_error(ValueError("query"))
+    assert local_db.outbox_write("log_interaction", {}, ValueError("query")) is False
@@ -0,0 +1,42 @@
+"""
+Regresiones de índices: las consultas calientes deben resolverse desde un
+índice (sin escaneo completo ni sort temporal). Usa EXPLAIN QUERY PLAN de SQLite.
+"""
+import app.sql_queries as queries
+from app.sqlite_backend import translate_sql
+
+
+def query_plan(db, sql, params):
+    with db.get_cursor() as cur:
+        cur.execute("EXPLAIN QUERY PLAN " + translate_sql(sql), params)
+        return " | ".join(row[-1] for row in cur.fetchall())
+
+
+def test_fbclid_lookup_uses_covering_partial_index(local_db):
+    plan = query_plan(local_db, queries.SELECT_FBCLID_BY_EXTERNAL_ID, ("ext-1",))
+    assert "COVERING INDEX idx_visitors_external_fbclid" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_recent_visitors_read_in_index_order(local_db):
+    plan = query_plan(local_db, queries.SELECT_RECENT_VISITORS, (50,))
+    assert "COVERING INDEX idx_visitors_timestamp" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_chat_history_sorted_by_index(local_db):
+    plan = query_plan(local_db, queries.SELECT_CHAT_HISTORY, ("59170000003", 15))
+    assert "idx_conversation_events_contact_seq" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_user_message_count_is_single_row_lookup(local_db):
+    plan = query_plan(local_db, queries.SELECT_MESSAGE_COUNTERS, ("59170000003",))
+    assert "USING INDEX" in plan and "(whatsapp_number=?)" in plan
+    assert "messages" not in plan
+
+
+def test_ref_tag_lookup_is_exact_index_match(local_db):
+    plan = query_plan(local_db, queries.SELECT_META_DATA_BY_REF, ("abcd1234",))
+    assert "idx_visitors_ref_tag (ref_tag=?)" in plan
+    assert "TEMP B-TREE" not in plan
@@ -0,0 +1,76 @@
+from contextlib import contextmanager
+
+import pytest
+
+from app import database
+from app.cache import TTLCache
+from app.circuit_breaker import CircuitBreaker
+
+
+class FakeConnection:
+    closed = 0
+
+    def cursor(self):
+        return "replica"
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.checkouts = 0
+
+    def getconn(self):
+        self.checkouts += 1
+        if self.fail:
+            raise OSError("replica down")
+        return FakeConnection()
+
+    def putconn(self, conn, close=False):
+        pass
+
+
+@pytest.fixture
+def routed(monkeypatch):
+    @contextmanager
+    def primary_cursor():
+        yield "primary"
+
+    def read(key=None):
+        with database.get_read_cursor(key) as cur:
+            return getattr(cur, "raw", cur)
+
+    pool = FakePool()
+    monkeypatch.setattr(database, "BACKEND", "postgres")
+    monkeypatch.setattr(database, "_read_pool", pool)
+    monkeypatch.setattr(database, "_read_breaker", CircuitBreaker("test_read", failure_threshold=1))
+    monkeypatch.setattr(database, "_recent_writes", TTLCache(16, 60))
+    monkeypatch.setattr(database, "get_cursor", primary_cursor)
+    return pool, read
+
+
+def test_reads_go_to_read_pool_except_recently_written_keys(routed):
+    pool, read = routed
+    assert read() == "replica"
+    assert read("knowledge") == "replica"
+
+    database.mark_written("knowledge")
+    assert read("knowledge") == "primary"
+    assert read("59170000040") == "replica"
+    assert pool.checkouts == 3
+
+
+def test_replica_outage_falls_back_to_primary(routed):
+    pool, read = routed
+    pool.fail = True
+    assert read() == "primary"
+
+    # Breaker abierto: ya ni se intenta la réplica
+    assert read() == "primary"
+    assert pool.checkouts == 1
+
+
+def test_sqlite_reads_use_the_local_connection(local_db):
+    assert local_db.get_all_visitors() == []
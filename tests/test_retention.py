@@ -0,0 +1,39 @@
+from datetime import date
+
+from app.config import settings
+from app.retention import _partition_end, retention_cutoff, run_retention
+
+
+def test_cutoff_keeps_only_whole_days():
+    cutoff = retention_cutoff(30, today=date(2024, 3, 31))
+    assert cutoff.isoformat() == "2024-03-01T00:00:00"
+
+
+def test_partition_end_is_first_day_of_next_month():
+    assert _partition_end("visitors_p202412") == date(2025, 1, 1)
+    assert _partition_end("visitors_p202402") == date(2024, 3, 1)
+    assert _partition_end("visitors_default") is None
+
+
+def test_sqlite_rollup_then_prune(local_db, monkeypatch):
+    monkeypatch.setattr(settings, "VISITOR_WRITE_BUFFER", False)
+    for ext, fbclid, campaign in [("a", "fb1", "promo"), ("a", None, "promo"), ("b", None, None)]:
+        local_db.save_visitor(ext, fbclid, "1.1.1.1", "UA", utm_data={"utm_campaign": campaign})
+    with local_db.get_cursor() as cur:
+        cur.execute("UPDATE visitors SET timestamp = '2020-01-15 10:00:00'")
+    local_db.save_visitor("c", None, "1.1.1.1", "UA")
+
+    report = run_retention(retention_days=30)
+    assert report["deleted_rows"] == 3
+
+    with local_db.get_cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM visitors")
+        assert cur.fetchone()[0] == 1
+        cur.execute("SELECT day, source, utm_campaign, visits, unique_visitors, fbclid_visits FROM visitor_daily_stats ORDER BY utm_campaign")
+        assert cur.fetchall() == [
+            ("2020-01-15", "pageview", "", 1, 1, 0),
+            ("2020-01-15", "pageview", "promo", 2, 1, 1),
+        ]
+
+    # Segunda corrida: nada que hacer, el rollup no duplica
+    assert run_retention(retention_days=30)["deleted_rows"] == 0
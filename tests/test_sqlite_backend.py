@@ -0,0 +1,41 @@
+import threading
+
+from app.sqlite_backend import SQLiteBackend, SQLiteCursorWrapper, translate_sql
+
+
+def test_translate_sql_is_cached():
+    translate_sql.cache_clear()
+    sql = "SELECT id FROM contacts WHERE whatsapp_number = %s AND status = %s"
+    assert translate_sql(sql) == "SELECT id FROM contacts WHERE whatsapp_number = ? AND status = ?"
+    translate_sql(sql)
+    assert translate_sql.cache_info().hits == 1
+
+
+def test_connection_is_reused_per_thread(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "local.db"))
+    assert backend.connection() is backend.connection()
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(backend.connection()))
+    t.start()
+    t.join()
+    assert other[0] is not backend.connection()
+    backend.close_all()
+
+
+def test_wal_mode_enabled(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "local.db"))
+    mode = backend.connection().execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+    backend.close_all()
+
+
+def test_cursor_wrapper_translates_placeholders(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "local.db"))
+    conn = backend.connection()
+    cur = SQLiteCursorWrapper(conn.cursor())
+    cur.execute("CREATE TABLE visitors (external_id TEXT, source TEXT)")
+    cur.executemany("INSERT INTO visitors VALUES (%s, %s)", [("a", "pageview"), ("b", "Lead")])
+    cur.execute("SELECT source FROM visitors WHERE external_id = %s", ("b",))
+    assert cur.fetchone() == ("Lead",)
+    backend.close_all()
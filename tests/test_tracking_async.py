@@ -0,0 +1,35 @@
+import asyncio
+import inspect
+
+import httpx
+
+from app import tracking
+from app.routes import pages, tracking_routes
+
+
+def test_background_senders_run_on_the_event_loop():
+    # Starlette corre las corrutinas en el loop; las funciones sync van al threadpool
+    for task in (pages.bg_send_pageview, tracking_routes.bg_send_meta_event, tracking_routes.bg_send_webhook):
+        assert inspect.iscoroutinefunction(task)
+
+
+def test_n8n_fan_out_is_bounded(monkeypatch):
+    in_flight = {"now": 0, "max": 0}
+
+    async def slow_n8n(request):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        return httpx.Response(200)
+
+    async def fan_out():
+        monkeypatch.setattr(tracking, "async_client", httpx.AsyncClient(transport=httpx.MockTransport(slow_n8n)))
+        monkeypatch.setattr(tracking, "_send_slots", asyncio.Semaphore(2))
+        results = await asyncio.gather(*(tracking.send_n8n_webhook_async({"n": i}) for i in range(6)))
+        await tracking.async_client.aclose()
+        return results
+
+    monkeypatch.setattr(tracking.settings, "N8N_WEBHOOK_URL", "http://n8n.test/webhook")
+    assert asyncio.run(fan_out()) == [True] * 6
+    assert in_flight["max"] == 2
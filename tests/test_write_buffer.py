@@ -0,0 +1,60 @@
+import threading
+import time
+
+from app.write_buffer import WriteBehindBuffer
+
+
+class Sink:
+    def __init__(self):
+        self.batches = []
+        self.event = threading.Event()
+
+    def __call__(self, rows):
+        self.batches.append(list(rows))
+        self.event.set()
+
+
+def test_flush_when_batch_is_full():
+    sink = Sink()
+    buffer = WriteBehindBuffer("test", sink, max_rows=3, flush_interval=60)
+    for i in range(3):
+        buffer.add((i,))
+    assert sink.event.wait(2)
+    assert sink.batches == [[(0,), (1,), (2,)]]
+    buffer.close()
+
+
+def test_flush_after_interval():
+    sink = Sink()
+    buffer = WriteBehindBuffer("test", sink, max_rows=100, flush_interval=0.05)
+    buffer.add(("a",))
+    buffer.add(("b",))
+    assert sink.event.wait(2)
+    assert sink.batches == [[("a",), ("b",)]]
+    buffer.close()
+
+
+def test_close_flushes_pending_rows():
+    sink = Sink()
+    buffer = WriteBehindBuffer("test", sink, max_rows=100, flush_interval=60)
+    buffer.add(("pending",))
+    buffer.close()
+    assert sink.batches == [[("pending",)]]
+
+    # Después del shutdown se escribe directo
+    buffer.add(("late",))
+    assert sink.batches[-1] == [("late",)]
+    assert buffer.stats()["flushed"] == 2
+
+
+def test_failed_flush_is_counted():
+    def boom(rows):
+        raise RuntimeError("db down")
+
+    buffer = WriteBehindBuffer("test", boom, max_rows=100, flush_interval=60)
+    buffer.add((1,))
+    buffer.add((2,))
+    buffer.close()
+    stats = buffer.stats()
+    assert stats["failed"] == 2
+    assert stats["flushed"] == 0
@@ -9,6 +9,21 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+# Serverless: sin lifespan no hay flush al apagar, así que el write-behind
+# de visitantes se desactiva (cada visita se inserta directamente)
+os.environ.setdefault("VISITOR_WRITE_BUFFER", "false")
+
+# El filesystem de Vercel es efímero: una outbox local se perdería con la instancia
+os.environ.setdefault("OUTBOX_ENABLED", "false")
+
+# Idem para la cola de reintentos (deliveries.db); además su hilo worker no
+# corre con la función congelada
+os.environ.setdefault("DELIVERY_RETRY_ENABLED", "false")
+
+# La instancia se congela al responder: el dispatcher CAPI no espera a juntar
+# un lote (cada request espera el POST de sus eventos antes de terminar)
+os.environ.setdefault("CAPI_BATCH_FLUSH_MS", "0")
+
 from mangum import Mangum
 from main import app
 
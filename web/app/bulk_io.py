@@ -0,0 +1,293 @@
+# =================================================================
+# BULK_IO.PY - Importación / Exportación Masiva del CRM
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# Mueve tablas completas (contacts, leads, visitors, conversation_events)
+# entre la BD y archivos CSV / JSONL con memoria constante:
+# - PostgreSQL: COPY ... TO STDOUT / COPY ... FROM STDIN. La importación
+#   pasa por una tabla temporal y termina en INSERT ... ON CONFLICT DO NOTHING
+#   (re-importar el mismo archivo no duplica ni aborta)
+# - SQLite: fetchmany / executemany por bloques en una sola transacción
+# Las columnas salen del encabezado del archivo (deben existir en la tabla;
+# las que falten toman su DEFAULT): se puede mover datos entre SQLite y PostgreSQL.
+# CSV: campo vacío sin comillas = NULL (convención de COPY).
+#
+# Uso:
+#   python -m app.bulk_io export visitors visitors.csv
+#   python -m app.bulk_io import contacts contacts.jsonl
+# Orden de importación: contacts y leads antes que conversation_events.
+# =================================================================
+import argparse
+import csv
+import io
+import json
+import logging
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from app import database
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 5000
+
+# Tabla -> SQL de ajuste tras importar (secuencias / contadores derivados)
+TABLES: Dict[str, Optional[str]] = {
+    "contacts": None,
+    "leads": None,
+    "visitors": None,
+    "conversation_events": """
+        UPDATE contacts SET last_event_seq = m.max_seq
+        FROM (
+            SELECT contact_id, MAX(seq) AS max_seq FROM conversation_events GROUP BY contact_id
+        ) m
+        WHERE m.contact_id = contacts.id AND m.max_seq > contacts.last_event_seq
+    """,
+}
+
+# messages es una vista de solo lectura sobre conversation_events (0008)
+ALIASES = {"messages": "conversation_events"}
+
+
+def _resolve_table(table: str) -> str:
+    table = ALIASES.get(table, table)
+    if table not in TABLES:
+        raise ValueError(f"Tabla no soportada: {table} (opciones: {', '.join(TABLES)})")
+    return table
+
+
+def _format(path: str, fmt: Optional[str]) -> str:
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Formato no soportado: {fmt}")
+    return fmt
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _table_columns(cur, table: str) -> List[str]:
+    if database.BACKEND == "postgres":
+        cur.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position",
+            (table,)
+        )
+        return [row[0] for row in cur.fetchall()]
+    cur.execute(f"PRAGMA table_info({_quote(table)})")
+    return [row[1] for row in cur.fetchall()]
+
+
+# --- Serialización (misma convención que COPY ... CSV) ---
+
+def _csv_field(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _csv_line(values) -> str:
+    return ",".join(_csv_field(v) for v in values) + "\n"
+
+
+class _JsonlAsCsv(io.TextIOBase):
+    """Adapta un JSONL a un stream CSV para COPY FROM STDIN (lee bajo demanda)"""
+
+    def __init__(self, lines: Iterator[str], columns: List[str]):
+        self._lines = lines
+        self._columns = columns
+        self._buffer = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            if line.strip():
+                row = json.loads(line)
+                self._buffer += _csv_line(row.get(c) for c in self._columns)
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def _peek_columns(handle, fmt: str) -> List[str]:
+    """Encabezado del CSV o claves del primer objeto JSONL (el archivo se rebobina)"""
+    if fmt == "csv":
+        header = next(csv.reader([handle.readline()]), [])
+    else:
+        first = ""
+        while not first.strip():
+            first = handle.readline()
+            if not first:
+                break
+        header = list(json.loads(first)) if first.strip() else []
+    handle.seek(0)
+    return header
+
+
+# =================================================================
+# EXPORT
+# =================================================================
+
+def export_table(table: str, path: str, fmt: Optional[str] = None) -> int:
+    """Vuelca la tabla completa al archivo. Retorna filas exportadas."""
+    table = _resolve_table(table)
+    fmt = _format(path, fmt)
+    started = time.perf_counter()
+
+    with database.get_read_cursor() as cur, open(path, "w", encoding="utf-8", newline="") as out:
+        if database.BACKEND == "postgres" and fmt == "csv":
+            # Un solo snapshot para el COPY y su COUNT(*) (primera sentencia de la transacción)
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        columns = _table_columns(cur, table)
+        select = f"SELECT {', '.join(map(_quote, columns))} FROM {_quote(table)}"
+
+        if database.BACKEND == "postgres" and fmt == "csv":
+            cur.copy_expert(f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER true)", out)
+            # rowcount del COPY depende de la versión de psycopg2 / servidor (-1 en las viejas)
+            count = cur.rowcount
+            if count < 0:
+                cur.execute(f"SELECT COUNT(*) FROM {_quote(table)}")
+                count = cur.fetchone()[0]
+        elif database.BACKEND == "postgres":
+            # Cursor con nombre (server-side): el resultado no se materializa en el cliente
+            named = cur.connection.cursor(name=f"bulk_export_{table}")
+            named.itersize = CHUNK_ROWS
+            named.execute(select)
+            count = _write_rows(named, columns, fmt, out)
+            named.close()
+        else:
+            cur.execute(select)
+            count = _write_rows(cur, columns, fmt, out)
+
+    logger.info(f"📤 Export {table}: {count} filas -> {path} ({time.perf_counter() - started:.1f}s)")
+    return count
+
+
+def _write_rows(cur, columns: List[str], fmt: str, out) -> int:
+    count = 0
+    if fmt == "csv":
+        out.write(",".join(columns) + "\n")
+    while True:
+        rows = cur.fetchmany(CHUNK_ROWS)
+        if not rows:
+            return count
+        for row in rows:
+            if fmt == "csv":
+                out.write(_csv_line(row))
+            else:
+                # default=str: timestamps, UUID y Decimal como texto que ambas BD aceptan
+                out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + "\n")
+        count += len(rows)
+
+
+# =================================================================
+# IMPORT
+# =================================================================
+
+def import_table(table: str, path: str, fmt: Optional[str] = None) -> int:
+    """Carga el archivo en la tabla (filas ya existentes se omiten). Retorna filas insertadas."""
+    table = _resolve_table(table)
+    fmt = _format(path, fmt)
+    started = time.perf_counter()
+
+    with open(path, encoding="utf-8", newline="") as handle, database.get_cursor() as cur:
+        existing = set(_table_columns(cur, table))
+        header = _peek_columns(handle, fmt)
+        unknown = [c for c in header if c not in existing]
+        if unknown:
+            raise ValueError(f"Columnas desconocidas para {table}: {', '.join(unknown)}")
+        if not header:
+            return 0
+
+        if database.BACKEND == "postgres":
+            count = _copy_in(cur, table, header, handle, fmt)
+        else:
+            count = _insert_chunks(cur, table, header, handle, fmt)
+
+        if TABLES[table]:
+            cur.execute(TABLES[table])
+
+    logger.info(f"📥 Import {table}: {count} filas <- {path} ({time.perf_counter() - started:.1f}s)")
+    return count
+
+
+def _copy_in(cur, table: str, columns: List[str], handle, fmt: str) -> int:
+    cols = ", ".join(map(_quote, columns))
+    cur.execute(f"CREATE TEMP TABLE bulk_stage (LIKE {_quote(table)} INCLUDING DEFAULTS) ON COMMIT DROP")
+    if fmt == "csv":
+        cur.copy_expert(f"COPY bulk_stage ({cols}) FROM STDIN WITH (FORMAT csv, HEADER true)", handle)
+    else:
+        cur.copy_expert(f"COPY bulk_stage ({cols}) FROM STDIN WITH (FORMAT csv)", _JsonlAsCsv(iter(handle), columns))
+
+    cur.execute(f"INSERT INTO {_quote(table)} ({cols}) SELECT {cols} FROM bulk_stage ON CONFLICT DO NOTHING")
+    count = max(cur.rowcount, 0)
+    if "id" in columns:
+        # ids explícitos: la secuencia (si la hay) sigue después del mayor importado
+        cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+        sequence = cur.fetchone()[0]
+        if sequence:
+            cur.execute(f"SELECT setval(%s, MAX(id)) FROM {_quote(table)} HAVING MAX(id) IS NOT NULL", (sequence,))
+    return count
+
+
+def _insert_chunks(cur, table: str, columns: List[str], handle, fmt: str) -> int:
+    sql = (
+        f"INSERT INTO {_quote(table)} ({', '.join(map(_quote, columns))}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) ON CONFLICT DO NOTHING"
+    )
+    if fmt == "csv":
+        reader = csv.reader(handle)
+        next(reader, None)
+        rows = ([value if value != "" else None for value in row] for row in reader)
+    else:
+        rows = (
+            [_sqlite_value(record.get(c)) for c in columns]
+            for record in map(json.loads, filter(str.strip, handle))
+        )
+
+    count = 0
+    chunk: List[list] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_ROWS:
+            count += _flush(cur, sql, chunk)
+            chunk = []
+    if chunk:
+        count += _flush(cur, sql, chunk)
+    return count
+
+
+def _sqlite_value(value: Any) -> Any:
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+
+
+def _flush(cur, sql: str, chunk: List[list]) -> int:
+    cur.executemany(sql, chunk)
+    return max(cur.rowcount, 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import/export masivo del CRM (CSV / JSONL)")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("table", help=f"{', '.join(TABLES)} (alias: messages)")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Por defecto según la extensión")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    database.initialize()
+    try:
+        run = export_table if args.action == "export" else import_table
+        print(run(args.table, args.path, args.format))
+    finally:
+        database.shutdown()
@@ -0,0 +1,272 @@
+# =================================================================
+# CACHE.PY - Caché en Proceso (LRU + TTL)
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# Caché pequeño y thread-safe para datos de lectura frecuente que casi
+# nunca cambian (ej. whatsapp_number -> contact_id).
+# - LRU: al superar `maxsize` se expulsa la entrada menos usada
+# - TTL: una entrada vencida cuenta como miss y se descarta
+# Las escrituras que cambian el dato deben llamar a invalidate().
+# VersionWatermark: para datos compartidos entre workers, un valor de
+# "versión" leído de la BD cada N segundos (si cambió, se vacía el caché).
+# RollingHistory: últimos N turnos por contacto activo (ring buffer).
+# =================================================================
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Hashable, List, Optional
+
+from app.config import settings
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU con expiración por entrada"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Estadísticas
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self._misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._data),
+                "max": self.maxsize,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class VersionWatermark:
+    """Último valor de versión visto en la BD; se consulta como mucho cada `interval`s"""
+
+    def __init__(self, interval: float = 30.0):
+        self.interval = interval
+        self._value: Any = _MISSING
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        self._changes = 0
+
+    def due(self) -> bool:
+        with self._lock:
+            return time.monotonic() - self._checked_at >= self.interval
+
+    def observe(self, value: Any) -> bool:
+        """Registra la versión leída. True si cambió respecto de la anterior."""
+        with self._lock:
+            changed = self._value is not _MISSING and value != self._value
+            self._value = value
+            self._checked_at = time.monotonic()
+            if changed:
+                self._changes += 1
+            return changed
+
+    def expire(self):
+        """Fuerza la consulta de versión en la próxima lectura"""
+        with self._lock:
+            self._checked_at = float("-inf")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"changes": self._changes}
+
+
+class _Conversation:
+    __slots__ = ("turns", "complete", "expires_at", "loaded_at")
+
+    def __init__(self, turns: deque, complete: bool, expires_at: float, loaded_at: int):
+        self.turns = turns
+        self.complete = complete  # True si la BD no tiene turnos más viejos que estos
+        self.expires_at = expires_at
+        self.loaded_at = loaded_at
+
+
+class RollingHistory:
+    """
+    Ring buffer (deque) con los últimos `turns` mensajes de cada contacto activo.
+    - Arranque en frío: hydrate() con una sola consulta de `turns` filas
+    - Cada mensaje guardado: begin_write() antes del INSERT y append() tras el COMMIT
+      (solo actualiza conversaciones ya en memoria)
+    - Contactos ociosos: expiran por `ttl`; con más de `max_contacts`, sale el LRU
+    Los tokens ordenan lecturas y escrituras: una carga que se cruzó con una
+    escritura se descarta en vez de perder (o duplicar) ese mensaje.
+    """
+
+    def __init__(self, turns: int = 30, max_contacts: int = 2000, ttl: float = 1800.0):
+        self.turns = max(1, turns)
+        self.max_contacts = max(1, max_contacts)
+        self.ttl = ttl
+        self._data: "OrderedDict[str, _Conversation]" = OrderedDict()
+        self._last_write: "OrderedDict[str, int]" = OrderedDict()
+        self._seq = 0
+        self._lock = threading.Lock()
+
+        # Estadísticas
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Últimos `limit` turnos en orden cronológico, o None si hay que ir a la BD"""
+        with self._lock:
+            conv = self._data.get(key)
+            if conv is not None and conv.expires_at <= time.monotonic():
+                del self._data[key]
+                conv = None
+            if conv is None or limit > self.turns or (len(conv.turns) < limit and not conv.complete):
+                self._misses += 1
+                return None
+            conv.expires_at = time.monotonic() + self.ttl
+            self._data.move_to_end(key)
+            self._hits += 1
+            turns = list(conv.turns)
+        return turns[-limit:] if limit > 0 else []
+
+    def load_token(self) -> int:
+        """Marca el inicio de una lectura a la BD (ver hydrate)"""
+        with self._lock:
+            return self._seq
+
+    def begin_write(self, key: str) -> int:
+        """Marca el inicio de una escritura a la BD (ver append)"""
+        with self._lock:
+            token = self._seq
+            self._seq += 1
+            self._last_write[key] = token
+            self._last_write.move_to_end(key)
+            while len(self._last_write) > self.max_contacts * 2:
+                self._last_write.popitem(last=False)
+            return token
+
+    def hydrate(self, key: str, turns: List[Dict[str, Any]], token: int) -> bool:
+        """Carga la conversación leída de la BD (cronológica, a lo sumo `turns` filas)"""
+        with self._lock:
+            if self._last_write.get(key, -1) >= token:
+                return False  # Un append llegó durante la lectura: la carga ya es vieja
+            conv = _Conversation(
+                deque(turns[-self.turns:], maxlen=self.turns),
+                complete=len(turns) < self.turns,
+                expires_at=time.monotonic() + self.ttl,
+                loaded_at=token,
+            )
+            self._data[key] = conv
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_contacts:
+                self._data.popitem(last=False)
+                self._evictions += 1
+            return True
+
+    def append(self, key: str, role: str, content: Any, token: int):
+        """Agrega un mensaje ya confirmado; `token` es el de su begin_write()"""
+        with self._lock:
+            conv = self._data.get(key)
+            if conv is None:
+                return
+            if conv.loaded_at > token:
+                # Cargada mientras se escribía: puede que ya incluya el mensaje
+                del self._data[key]
+                return
+            conv.turns.append({"role": role, "content": content})
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "contacts": len(self._data),
+                "max": self.max_contacts,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# =================================================================
+# CACHÉS COMPARTIDOS (capa sync y async)
+# =================================================================
+
+# whatsapp_number -> contacts.id (el id no cambia tras crearse el contacto)
+contact_ids = TTLCache(settings.CONTACT_ID_CACHE_SIZE, settings.CONTACT_ID_CACHE_TTL)
+
+# [Ref Tag] -> datos de atribución de la visita (fbclid, UA, IP, UTMs)
+ref_tag_meta = TTLCache(settings.REF_TAG_CACHE_SIZE, settings.REF_TAG_CACHE_TTL)
+
+# Conocimiento de Natalia: ("facts", category) -> hechos, ("prompt", role_id) -> system prompt
+knowledge = TTLCache(256, settings.KNOWLEDGE_CACHE_TTL)
+knowledge_version = VersionWatermark(settings.KNOWLEDGE_VERSION_CHECK_SECONDS)
+
+# whatsapp_number -> últimos turnos de conversation_events (get_chat_history)
+chat_histories = RollingHistory(
+    settings.CHAT_HISTORY_CACHE_TURNS,
+    settings.CHAT_HISTORY_CACHE_CONTACTS,
+    settings.CHAT_HISTORY_CACHE_TTL,
+)
+
+
+def invalidate_contact_id(whatsapp_number: Optional[str] = None):
+    """Hook para borrados/merges de contactos. Sin argumento vacía todo el caché."""
+    if whatsapp_number is None:
+        contact_ids.clear()
+    else:
+        contact_ids.invalidate(whatsapp_number)
+
+
+def invalidate_knowledge():
+    """save_knowledge_fact / NOTIFY knowledge_changed: vacía el caché y re-lee la versión"""
+    knowledge.clear()
+    knowledge_version.expire()
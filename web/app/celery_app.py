@@ -54,7 +54,13 @@ celery_app.conf.update(
     enable_utc=True,
     broker_connection_retry_on_startup=True,
     task_acks_late=True,
-    task_always_eager=FORCE_EAGER
+    task_always_eager=FORCE_EAGER,
+    beat_schedule={
+        "visitor-retention": {
+            "task": "visitor_retention_task",
+            "schedule": settings.VISITOR_RETENTION_INTERVAL_HOURS * 3600,
+        },
+    }
 )
 
 if FORCE_EAGER:
@@ -0,0 +1,183 @@
+# =================================================================
+# CIRCUIT_BREAKER.PY - Circuit Breaker + Backoff para la BD
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# Estados:
+#   CLOSED    -> normal; N fallos de conexión seguidos lo abren
+#   OPEN      -> fail-fast (CircuitOpenError) sin tocar la red
+#   HALF_OPEN -> pasado el tiempo de espera, deja pasar una prueba:
+#                éxito = CLOSED, fallo = OPEN otra vez (espera creciente)
+#
+# El tiempo en OPEN crece exponencialmente con cada reapertura (con jitter)
+# para no martillar a Supabase durante una caída larga.
+# backoff_delay() da esperas con "full jitter" para los reintentos; quien
+# esté en el hilo del event loop nunca debe dormir (ver on_event_loop_thread).
+# =================================================================
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """El breaker está abierto: la operación se rechazó sin intentar"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' abierto (reintentar en {retry_after:.1f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt: int, base: float = 0.1, cap: float = 2.0) -> float:
+    """Exponencial con full jitter: uniforme en [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def on_event_loop_thread() -> bool:
+    """True si el código corre dentro de un event loop asyncio (no se puede dormir)"""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class CircuitBreaker:
+    """Breaker thread-safe; compartido por la capa sync y la async"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        max_reset_timeout: float = 300.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max(reset_timeout, max_reset_timeout)
+        self.half_open_max_calls = max(1, half_open_max_calls)
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._open_for = reset_timeout
+        self._reopens = 0  # Reaperturas seguidas (sin un éxito en medio)
+        self._probes = 0
+        self._probe_started = 0.0
+
+        # Estadísticas
+        self._trips = 0
+        self._rejected = 0
+
+    # --- Estado ---
+
+    def _current_state(self) -> str:
+        now = time.monotonic()
+        if self._state == OPEN and now - self._opened_at >= self._open_for:
+            self._state = HALF_OPEN
+            self._probes = 0
+        elif self._state == HALF_OPEN and self._probes and now - self._probe_started >= self.reset_timeout:
+            # Una prueba que nunca reportó resultado no puede bloquear para siempre
+            self._probes = 0
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    @property
+    def is_open(self) -> bool:
+        """Consulta sin consumir la prueba de HALF_OPEN (para degradar antes de llamar)"""
+        return self.state == OPEN
+
+    # --- Protocolo de llamada ---
+
+    def before_call(self):
+        """Lanza CircuitOpenError si la llamada no debe intentarse"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                self._probe_started = time.monotonic()
+                return
+            self._rejected += 1
+            retry_after = max(0.0, self._opened_at + self._open_for - time.monotonic())
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"✅ Circuit '{self.name}' cerrado: backend recuperado")
+            self._state = CLOSED
+            self._failures = 0
+            self._reopens = 0
+            self._probes = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            state = self._current_state()
+            if state == HALF_OPEN or (state == CLOSED and self._failures >= self.failure_threshold):
+                self._trip()
+
+    def _trip(self):
+        # Espera creciente por reapertura, con jitter para desincronizar workers
+        base = min(self.max_reset_timeout, self.reset_timeout * (2 ** self._reopens))
+        self._open_for = base * random.uniform(0.8, 1.2)
+        self._opened_at = time.monotonic()
+        self._state = OPEN
+        self._probes = 0
+        self._reopens += 1
+        self._trips += 1
+        logger.error(
+            f"🔌 Circuit '{self.name}' ABIERTO tras {self._failures} fallos "
+            f"(fail-fast por {self._open_for:.0f}s)"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "state_code": _STATE_CODES[state],
+                "consecutive_failures": self._failures,
+                "trips": self._trips,
+                "rejected": self._rejected,
+            }
+
+
+# Breaker de PostgreSQL: lo comparten app.database y app.async_database
+db_breaker = CircuitBreaker(
+    "postgres",
+    failure_threshold=settings.DB_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.DB_BREAKER_RESET_SECONDS,
+    max_reset_timeout=settings.DB_BREAKER_MAX_RESET_SECONDS,
+)
+
+# Breaker de la réplica de lectura (DATABASE_READ_URL): si cae, las lecturas
+# vuelven al primario sin abrir el breaker de las escrituras
+replica_breaker = CircuitBreaker(
+    "postgres_read",
+    failure_threshold=settings.DB_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.DB_BREAKER_RESET_SECONDS,
+    max_reset_timeout=settings.DB_BREAKER_MAX_RESET_SECONDS,
+)
@@ -36,6 +36,21 @@ class Settings(BaseSettings):
     META_API_VERSION: str = "v21.0"
     TEST_EVENT_CODE: Optional[str] = None
     META_SANDBOX_MODE: bool = False # 🛡️ True = No enviar eventos reales a Meta
+    CAPI_BATCH_MAX_EVENTS: int = 1000  # Eventos por POST a la Graph API (tope de Meta: 1000)...
+    CAPI_BATCH_FLUSH_MS: int = 500  # ...o cuando el más antiguo espera M ms
+    CAPI_QUEUE_MAX_EVENTS: int = 10000  # Eventos en espera por proceso; más allá se descartan
+    CAPI_DEDUP_CACHE_SIZE: int = 50000  # (event_name, event_id) recordados por proceso (LRU)
+    CAPI_DEDUP_TTL_SECONDS: float = 172800.0  # 48 h: la ventana de deduplicación de Meta
+    CAPI_DEDUP_REDIS_URL: Optional[str] = None  # Dedup compartido entre workers (SET NX EX); sin él, solo local
+    CAPI_HASH_CACHE_SIZE: int = 20000  # LRU de identificadores normalizados -> SHA-256 (y de external_id por IP+UA)
+    CAPI_DEFAULT_PHONE_REGION: str = "BO"  # Región asumida para teléfonos sin código de país (E.164)
+    TRACKING_MAX_CONCURRENT_SENDS: int = 20  # Webhooks async en vuelo por proceso (n8n)
+    DELIVERY_RETRY_ENABLED: bool = True  # CAPI / n8n fallidos -> cola local de reintentos (deliveries.db)
+    DELIVERY_MAX_ATTEMPTS: int = 8  # Luego la entrega queda como "dead" para revisión manual
+    DELIVERY_BACKOFF_BASE_SECONDS: float = 30.0  # Backoff exponencial con jitter...
+    DELIVERY_BACKOFF_MAX_SECONDS: float = 3600.0  # ...con tope por intento
+    DELIVERY_RETRY_INTERVAL_SECONDS: float = 5.0
+    DELIVERY_BATCH_SIZE: int = 500  # Entregas reenviadas por lote (un POST a Meta)
     
     # AI Brain (Gemini)
     GOOGLE_API_KEY: Optional[str] = None
@@ -51,6 +66,42 @@ class Settings(BaseSettings):
     
     # Database (Supabase PostgreSQL)
     DATABASE_URL: Optional[str] = None
+    DB_POOL_MIN_SIZE: int = 2  # Conexiones pre-calentadas en initialize()
+    DB_POOL_MAX_SIZE: int = 10
+    DB_POOL_VALIDATE_IDLE_SECONDS: float = 30.0  # Ping solo si estuvo ociosa más que esto
+    DB_POOL_ACQUIRE_TIMEOUT: float = 5.0  # Espera máxima por una conexión libre
+    DB_CONNECT_TIMEOUT: int = 5  # Segundos para abrir una conexión nueva
+    DB_BREAKER_FAILURE_THRESHOLD: int = 5  # Fallos de conexión seguidos que abren el circuito
+    DB_BREAKER_RESET_SECONDS: float = 30.0  # Espera en OPEN antes de la prueba (crece por reapertura)
+    DB_BREAKER_MAX_RESET_SECONDS: float = 300.0
+    DATABASE_READ_URL: Optional[str] = None  # Réplica de lectura (sin ella, las lecturas van al primario)
+    DB_READ_POOL_MAX_SIZE: int = 3  # Pool aparte para lecturas admin/agente (0 = comparten el de escrituras)
+    DB_READ_YOUR_WRITES_SECONDS: float = 5.0  # Tras escribir una clave, sus lecturas van al primario
+    SQL_TOOL_MAX_ROWS: int = 10  # run_readonly_sql: filas devueltas al modelo (LIMIT empujado al servidor)
+    SQL_TOOL_TIMEOUT_MS: int = 3000  # statement_timeout de la consulta (PostgreSQL)
+    SQL_TOOL_MAX_BYTES: int = 4000  # Tope de la tabla markdown renderizada
+    SQL_TOOL_MAX_CELL_CHARS: int = 200
+    OUTBOX_ENABLED: bool = True  # Escrituras fallidas por caída de PostgreSQL -> outbox SQLite local
+    OUTBOX_BATCH_SIZE: int = 100  # Entradas reaplicadas por transacción
+    OUTBOX_REPLAY_INTERVAL_SECONDS: float = 5.0
+    OUTBOX_MAX_ATTEMPTS: int = 10  # Luego la entrada queda como "dead" para revisión manual
+    OUTBOX_APPLIED_RETENTION_DAYS: int = 7  # Claves de idempotencia conservadas en outbox_applied
+    VISITOR_WRITE_BUFFER: bool = True  # Inserción de visitantes por lotes (write-behind)
+    VISITOR_BUFFER_MAX_ROWS: int = 200  # Flush al juntar N filas...
+    VISITOR_BUFFER_FLUSH_MS: int = 500  # ...o cuando la más antigua espera M ms
+    VISITOR_RETENTION_DAYS: int = 0  # > 0: filas más viejas pasan a visitor_daily_stats (0 = desactivada)
+    VISITOR_PARTITION_MONTHS_AHEAD: int = 3  # Particiones mensuales creadas por adelantado (PostgreSQL)
+    VISITOR_RETENTION_INTERVAL_HOURS: float = 24.0
+    CONTACT_ID_CACHE_SIZE: int = 5000  # Caché LRU whatsapp_number -> contact_id
+    CONTACT_ID_CACHE_TTL: float = 3600.0
+    REF_TAG_CACHE_SIZE: int = 1000  # Caché de atribución por [Ref Tag]
+    REF_TAG_CACHE_TTL: float = 300.0
+    REF_TAG_PREFIX_FALLBACK: bool = True  # Sin acierto exacto, busca por prefijo de external_id (hasta correr backfill-ref-tags)
+    KNOWLEDGE_CACHE_TTL: float = 600.0  # Caché de business_knowledge / agent_prompts
+    KNOWLEDGE_VERSION_CHECK_SECONDS: float = 30.0  # Poll del watermark updated_at (coherencia entre workers)
+    CHAT_HISTORY_CACHE_TURNS: int = 30  # Últimos turnos en memoria por contacto activo
+    CHAT_HISTORY_CACHE_CONTACTS: int = 2000  # Conversaciones en memoria (LRU)
+    CHAT_HISTORY_CACHE_TTL: float = 1800.0  # Una conversación ociosa sale de memoria
     
     # Celery & Redis
     CELERY_BROKER_URL: str = os.getenv("CELERY_BROKER_URL", "redis://redis_evolution:6379/1")
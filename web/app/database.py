@@ -3,30 +3,77 @@
 # Jorge Aguirre Flores Web
 # =================================================================
 import logging
-import sqlite3
+import threading
+import time
 from typing import Optional, List, Dict, Any
 from contextlib import contextmanager
 import uuid
 
 from app.config import settings
 import app.sql_queries as queries  # Importamos el repo de queries
+from app import migrator, metrics
 
 # Intentar importar psycopg2 (PostgreSQL)
 try:
     import psycopg2
-    from psycopg2 import pool
     HAS_POSTGRES = True
 except ImportError:
     HAS_POSTGRES = False
 
+from app.db_pool import ThreadedPool, PoolTimeoutError
+from app.sqlite_backend import SQLiteBackend, SQLiteCursorWrapper
+from app.write_buffer import WriteBehindBuffer
+from app.circuit_breaker import db_breaker, replica_breaker, backoff_delay, on_event_loop_thread, CircuitOpenError
+from app.cache import (
+    TTLCache, contact_ids, invalidate_contact_id, ref_tag_meta,
+    knowledge, knowledge_version, invalidate_knowledge, chat_histories,
+)
+from app.outbox import LocalOutbox, OutboxReplayer
+
 logger = logging.getLogger(__name__)
 
-# Pool Global
-_pg_pool: Optional[Any] = None
+# Pool Global (Thread-Safe)
+_pg_pool: Optional[ThreadedPool] = None
+
+# Backend Local (conexiones SQLite persistentes por hilo)
+_sqlite: Optional[SQLiteBackend] = None
+
+# Write-Behind de visitantes (un INSERT multi-fila por lote)
+_visitor_buffer: Optional[WriteBehindBuffer] = None
+
+# Outbox local: escrituras que fallaron por caída de PostgreSQL (ver app/outbox.py)
+_outbox: Optional[LocalOutbox] = None
+_replayer: Optional[OutboxReplayer] = None
+_outbox_lock = threading.Lock()
+
+# [Ref Tag] del mensaje de WhatsApp = prefijo del external_id (ver tracking.js)
+REF_TAG_LENGTH = 8
+
+# Pool de lecturas (réplica o primario): consultas admin/agente fuera del pool de escrituras
+_read_pool: Optional[ThreadedPool] = None
+_read_breaker = db_breaker
+
+# Claves escritas hace poco: sus lecturas van al primario (read-your-writes)
+_recent_writes = TTLCache(4096, settings.DB_READ_YOUR_WRITES_SECONDS)
 
 # Tipo de Backend Activo
 BACKEND = "sqlite"  # 'postgres' o 'sqlite'
 
+def _connect_pg(dsn: str, readonly: bool = False):
+    conn = psycopg2.connect(
+        dsn=dsn,
+        # Senior Hardening: TCP Keepalives to prevent silent drops
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=5,
+        connect_timeout=settings.DB_CONNECT_TIMEOUT
+    )
+    if readonly:
+        # Pool de lecturas: el servidor rechaza cualquier escritura
+        conn.set_session(readonly=True)
+    return conn
+
 def init_pool() -> bool:
     """Inicializa la conexión a BD (Nube o Local)"""
     global _pg_pool, BACKEND
@@ -34,18 +81,20 @@ def init_pool() -> bool:
     # 1. Intentar PostgreSQL (Producción)
     if settings.DATABASE_URL and HAS_POSTGRES:
         try:
-            _pg_pool = psycopg2.pool.SimpleConnectionPool(
-                minconn=1,
-                maxconn=10,
-                dsn=settings.DATABASE_URL,
-                # Senior Hardening: TCP Keepalives to prevent silent drops
-                keepalives=1,
-                keepalives_idle=30,
-                keepalives_interval=10,
-                keepalives_count=5
+            pg_pool = ThreadedPool(
+                lambda: _connect_pg(settings.DATABASE_URL),
+                minconn=settings.DB_POOL_MIN_SIZE,
+                maxconn=settings.DB_POOL_MAX_SIZE,
+                validate_after=settings.DB_POOL_VALIDATE_IDLE_SECONDS,
+                acquire_timeout=settings.DB_POOL_ACQUIRE_TIMEOUT
             )
+            # Pre-warm: las primeras escrituras no pagan el handshake TLS
+            warmed = pg_pool.prewarm()
+            _pg_pool = pg_pool
             BACKEND = "postgres"
-            logger.info("✅ Conexión PostgreSQL (Cloud) ESTABLECIDA")
+            logger.info(f"✅ Conexión PostgreSQL (Cloud) ESTABLECIDA ({warmed} conexiones pre-calentadas)")
+            replica = settings.DATABASE_READ_URL
+            _init_read_pool(replica or settings.DATABASE_URL, bool(replica))
             return True
         except Exception as e:
             logger.error(f"❌ Falló conexión PostgreSQL: {e}")
@@ -58,252 +107,449 @@ def init_pool() -> bool:
     logger.info("⚠️ Usando SQLite (Local Fallback)")
     return True
 
-@contextmanager
-def get_cursor():
+def _init_read_pool(dsn: str, is_replica: bool):
     """
-    Obtiene un cursor con:
-    1. Auto-Reconnect: Si la conexión está muerta, pide otra.
-    2. Health Check: Ejecuta 'SELECT 1' antes de entregarla.
-    3. Retry Logic: Reintenta hasta 3 veces si falla.
+    Pool aparte para lecturas admin/agente: nunca compiten por las conexiones
+    de las escrituras (tracking, chat). Sin réplica apunta al primario.
+    Las conexiones se abren a demanda (sin pre-warm).
     """
-    conn = None
-    max_retries = 3
-    is_postgres = (BACKEND == "postgres")
-    
+    global _read_pool, _read_breaker
+    if settings.DB_READ_POOL_MAX_SIZE <= 0:
+        return
+    _read_pool = ThreadedPool(
+        lambda: _connect_pg(dsn, readonly=True),
+        minconn=0,
+        maxconn=settings.DB_READ_POOL_MAX_SIZE,
+        validate_after=settings.DB_POOL_VALIDATE_IDLE_SECONDS,
+        acquire_timeout=settings.DB_POOL_ACQUIRE_TIMEOUT
+    )
+    _read_breaker = replica_breaker if is_replica else db_breaker
+    target = "réplica" if is_replica else "primario"
+    logger.info(f"📖 Pool de lecturas listo ({target}, máx {settings.DB_READ_POOL_MAX_SIZE} conexiones)")
+
+def close_pool():
+    """Cierra las conexiones del pool (shutdown)"""
+    global _pg_pool, _read_pool, _sqlite
+    if _pg_pool is not None:
+        _pg_pool.closeall()
+        _pg_pool = None
+    if _read_pool is not None:
+        _read_pool.closeall()
+        _read_pool = None
+    if _sqlite is not None:
+        _sqlite.close_all()
+        _sqlite = None
+
+def shutdown():
+    """Shutdown ordenado: vacía los buffers pendientes y cierra conexiones"""
+    global _visitor_buffer, _outbox, _replayer
+    if _visitor_buffer is not None:
+        _visitor_buffer.close()
+        _visitor_buffer = None
+    with _outbox_lock:
+        replayer, outbox = _replayer, _outbox
+        _replayer, _outbox = None, None
+    if replayer is not None:
+        replayer.stop()
+    if outbox is not None:
+        outbox.close()
+    close_pool()
+
+def _get_sqlite() -> SQLiteBackend:
+    global _sqlite
+    if _sqlite is None:
+        _sqlite = SQLiteBackend(get_sqlite_path())
+    return _sqlite
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Estadísticas del pool: checkouts, tiempos de espera, validaciones"""
+    if BACKEND == "postgres" and _pg_pool is not None:
+        return {"backend": BACKEND, **_pg_pool.stats()}
+    return {"backend": BACKEND}
+
+def get_read_pool_stats() -> Dict[str, Any]:
+    if _read_pool is None:
+        return {}
+    return _read_pool.stats()
+
+def _acquire_pg_connection():
+    """
+    Obtiene una conexión del pool (el pool solo hace ping a las ociosas).
+    - Circuit breaker abierto: CircuitOpenError inmediato, sin tocar la red
+    - Fuera del event loop: hasta 3 intentos con backoff exponencial + jitter
+    - En el hilo del event loop: un solo intento (dormir congelaría todas las requests)
+    """
+    if _pg_pool is None:
+        raise Exception("Postgres Pool not initialized")
+    db_breaker.before_call()
+
+    max_retries = 1 if on_event_loop_thread() else 3
     last_error = None
 
-    # RETRY LOOP
     for attempt in range(max_retries):
         try:
-            if is_postgres:
-                if _pg_pool is None:
-                    if not init_pool():
-                        raise Exception("Postgres Pool not initialized")
-
-                # 1. Get Connection
-                conn = _pg_pool.getconn()
-                
-                # 2. Health Check (Ping)
-                is_healthy = False
-                if conn.closed == 0:
-                    try:
-                        with conn.cursor() as test_cur:
-                            test_cur.execute("SELECT 1")
-                        is_healthy = True
-                    except Exception:
-                        pass # Ping failed
-                
-                if not is_healthy:
-                    # Connection dead, discard and retry
-                    logger.warning(f"⚠️ DB Connection dead (Attempt {attempt+1}/{max_retries}). Discarding...")
-                    try:
-                        _pg_pool.putconn(conn, close=True)
-                    except: pass
-                    conn = None
-                    continue # Try next attempt (will get new conn from pool)
-
-                # 3. Yield to Caller
-                yield conn.cursor()
-                conn.commit()
-                return # Success!
-                
-            else:
-                # SQLite Mode (Simple fallback)
-                import os
-                db_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "database")
-                os.makedirs(db_dir, exist_ok=True)
-                db_path = os.path.join(db_dir, "local_fallback.db")
-                conn = sqlite3.connect(db_path)
-                yield SQLiteCursorWrapper(conn.cursor())
-                conn.commit()
-                return # Success
-
+            return _pg_pool.getconn()
+        except PoolTimeoutError as e:
+            # Pool saturado: reintentar solo alarga la cola
+            logger.error(f"❌ DB Pool agotado: {e}")
+            raise
         except Exception as e:
             last_error = e
             logger.error(f"❌ Error DB (Attempt {attempt+1}/{max_retries}): {e}")
-            if conn:
-                try:
-                    conn.rollback()
-                except Exception: pass
-                
-                # Return/Close bad connection
-                if is_postgres and _pg_pool:
-                    try:
-                        _pg_pool.putconn(conn, close=True) 
-                    except: pass
-                elif not is_postgres:
-                    try:
-                        conn.close()
-                    except: pass
-                conn = None
-            
+
             # Don't sleep on last attempt
             if attempt < max_retries - 1:
-                import time
-                time.sleep(0.5)
-    
+                metrics.DB_CHECKOUT_RETRIES.inc()
+                time.sleep(backoff_delay(attempt))
+
     # If we got here, all retries failed
+    db_breaker.record_failure()
     logger.critical("🔥 CRITICAL: Database unreachable after retries.")
     raise last_error
 
-class SQLiteCursorWrapper:
-    """Adapta sintaxis Postgres (%s) a SQLite (?)"""
-    def __init__(self, cursor):
-        self.cursor = cursor
-        
-    def execute(self, sql, params=None):
-        # Traducción simple de query params
-        if params:
-            # Reemplazar %s por ?
-            sql = sql.replace("%s", "?")
-            return self.cursor.execute(sql, params)
-        return self.cursor.execute(sql)
-        
-    def fetchone(self):
-        return self.cursor.fetchone()
-        
-    def fetchall(self):
-        return self.cursor.fetchall()
-        
-    def close(self):
-        self.cursor.close()
+def _is_connection_error(conn, error: Exception) -> bool:
+    """Fallo de red/servidor (cuenta para el breaker) vs error de la query"""
+    if conn.closed != 0 or isinstance(error, psycopg2.InterfaceError):
+        return True
+    return (
+        isinstance(error, psycopg2.OperationalError)
+        and not isinstance(error, psycopg2.extensions.QueryCanceledError)
+    )
 
-def init_tables():
-    """Crea tablas si no existen, sincronizado con init_crm_master_clean.sql v2.0"""
+@contextmanager
+def get_cursor():
+    """
+    Obtiene un cursor transaccional:
+    1. Pool Thread-Safe: compartido por BackgroundTasks y asyncio.to_thread.
+    2. Validación perezosa: sin 'SELECT 1' por checkout.
+    3. Commit al salir, Rollback si el bloque falla.
+    """
+    if BACKEND == "postgres":
+        requested = time.perf_counter()
+        conn = _acquire_pg_connection()
+        started = time.perf_counter()
+        metrics.DB_POOL_WAIT_SECONDS.observe(started - requested, backend="postgres")
+        broken = False
+        outcome = "commit"
+        try:
+            yield metrics.InstrumentedCursor(conn.cursor(), "postgres")
+            conn.commit()
+            db_breaker.record_success()
+        except Exception as e:
+            outcome = "rollback"
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            if broken or _is_connection_error(conn, e):
+                db_breaker.record_failure()
+            else:
+                db_breaker.record_success()  # La BD respondió (error de la query)
+            raise
+        finally:
+            # Devolver al pool (descartar si la conexión murió)
+            _pg_pool.putconn(conn, close=broken or conn.closed != 0)
+            metrics.DB_TRANSACTION_SECONDS.observe(
+                time.perf_counter() - started, backend="postgres", outcome=outcome
+            )
+        return
+
+    # SQLite Mode (conexión persistente del hilo, WAL)
+    conn = _get_sqlite().connection()
+    cur = conn.cursor()
+    started = time.perf_counter()
+    outcome = "commit"
+    try:
+        yield metrics.InstrumentedCursor(SQLiteCursorWrapper(cur), "sqlite")
+        conn.commit()
+    except Exception as e:
+        outcome = "rollback"
+        logger.error(f"❌ Error DB (SQLite): {e}")
+        try:
+            conn.rollback()
+        except Exception: pass
+        raise
+    finally:
+        cur.close()
+        metrics.DB_TRANSACTION_SECONDS.observe(
+            time.perf_counter() - started, backend="sqlite", outcome=outcome
+        )
+
+def mark_written(key: str):
+    """Registra una escritura: lecturas con esta consistency_key van al primario por un rato"""
+    if key and _read_pool is not None:
+        _recent_writes.set(key, True)
+
+def _acquire_read_connection():
+    """Un solo intento (sin backoff): si la réplica no responde, se lee del primario"""
+    _read_breaker.before_call()
     try:
+        return _read_pool.getconn()
+    except PoolTimeoutError:
+        raise
+    except Exception:
+        _read_breaker.record_failure()
+        raise
+
+@contextmanager
+def get_read_cursor(consistency_key: Optional[str] = None):
+    """
+    Cursor de solo lectura para consultas admin/analíticas/agente.
+    Usa el pool de lecturas (réplica si hay DATABASE_READ_URL) y cae a get_cursor():
+    - SQLite o sin pool de lecturas (DB_READ_POOL_MAX_SIZE = 0)
+    - consistency_key escrita hace menos de DB_READ_YOUR_WRITES_SECONDS (read-your-writes)
+    - Réplica caída (breaker abierto o fallo al conectar)
+    Pool de lecturas saturado: PoolTimeoutError (las lecturas no toman conexiones de escritura).
+    """
+    conn = None
+    if BACKEND == "postgres" and _read_pool is not None and (
+        consistency_key is None or _recent_writes.get(consistency_key) is None
+    ):
+        requested = time.perf_counter()
+        try:
+            conn = _acquire_read_connection()
+            metrics.DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - requested, backend="postgres_read")
+        except PoolTimeoutError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Pool de lecturas no disponible, leyendo del primario: {e}")
+
+    if conn is None:
         with get_cursor() as cur:
-            if not cur: return False
-            
-            # --- Configuración de Tipos y Defaults ---
-            if BACKEND == "postgres":
-                id_type_uuid = "UUID PRIMARY KEY DEFAULT gen_random_uuid()"
-                id_type_serial = "SERIAL PRIMARY KEY"
-                timestamp_default = "CURRENT_TIMESTAMP"
-                status_type = "lead_status DEFAULT 'new'"
-                lead_id_type = "UUID"
-                id_type_pk = id_type_uuid
-                
-                # Crear Enum en Postgres si no existe
-                cur.execute("""
-                    DO $$ BEGIN
-                        CREATE TYPE lead_status AS ENUM (
-                            'new', 'interested', 'nurturing', 'ghost', 'booked', 
-                            'client_active', 'client_loyal', 'archived'
-                        );
-                    EXCEPTION WHEN duplicate_object THEN null; END $$;
-                """)
-            else:
-                id_type_uuid = "TEXT PRIMARY KEY"
-                id_type_serial = "INTEGER PRIMARY KEY AUTOINCREMENT"
-                timestamp_default = "CURRENT_TIMESTAMP"
-                status_type = "TEXT DEFAULT 'new'"
-                lead_id_type = "TEXT"
-                id_type_pk = id_type_uuid
-
-            # Formatear y Ejecutar DDLs
-            cur.execute(queries.CREATE_TABLE_BUSINESS_KNOWLEDGE.format(
-                id_type_serial=id_type_serial, timestamp_default=timestamp_default
-            ))
-            cur.execute(queries.CREATE_INDEX_KNOWLEDGE_SLUG)
-
-            cur.execute(queries.CREATE_TABLE_VISITORS.format(
-                id_type_serial=id_type_serial, timestamp_default=timestamp_default
-            ))
-            cur.execute(queries.CREATE_INDEX_VISITORS_EXTERNAL_ID)
-
-            cur.execute(queries.CREATE_TABLE_CONTACTS.format(
-                id_type_primary_key=id_type_pk, 
-                status_type=status_type,
-                timestamp_default=timestamp_default
-            ))
-
-            # --- Migración de Columnas (Si ya existe la tabla) ---
-            # Este bloque se mantiene igual por ser lógica condicional compleja, no SQL puro
-            new_columns = [
-                ("profile_pic_url", "TEXT"),
-                ("fb_browser_id", "TEXT"),
-                ("utm_term", "TEXT"),
-                ("utm_content", "TEXT"),
-                ("status", status_type),
-                ("lead_score", "INTEGER DEFAULT 50"),
-                ("pain_point", "TEXT"),
-                ("service_interest", "TEXT"),
-                ("service_booked_date", "TIMESTAMP"),
-                ("appointment_count", "INTEGER DEFAULT 0"),
-                ("updated_at", "TIMESTAMP"),
-                ("onboarding_step", "TEXT"), 
-                ("is_admin", "BOOLEAN DEFAULT FALSE")
-            ]
-            
-            for col_name, col_type in new_columns:
-                try:
-                    if BACKEND == "postgres":
-                        cur.execute(f"ALTER TABLE contacts ADD COLUMN IF NOT EXISTS {col_name} {col_type};")
-                    else:
-                        cur.execute(f"PRAGMA table_info(contacts);")
-                        cols = [c[1] for c in cur.fetchall()]
-                        if col_name not in cols:
-                            cur.execute(f"ALTER TABLE contacts ADD COLUMN {col_name} {col_type};")
-                except Exception as e:
-                    logger.warning(f"⚠️ Nota: Al intentar añadir {col_name}: {e}")
-
-            cur.execute(queries.CREATE_INDEX_CONTACTS_WHATSAPP)
-            cur.execute(queries.CREATE_INDEX_CONTACTS_STATUS)
-
-            cur.execute(queries.CREATE_TABLE_MESSAGES.format(
-                id_type_primary_key=id_type_pk, timestamp_default=timestamp_default
-            ))
-            cur.execute(queries.CREATE_INDEX_MESSAGES_CONTACT_ID)
-
-            cur.execute(queries.CREATE_TABLE_APPOINTMENTS.format(
-                id_type_serial=id_type_serial, timestamp_default=timestamp_default
-            ))
-
-            cur.execute(queries.CREATE_TABLE_LEADS.format(
-                id_type_primary_key=id_type_pk, timestamp_default=timestamp_default
-            ))
-            cur.execute(queries.CREATE_INDEX_LEADS_PHONE)
-            cur.execute(queries.CREATE_INDEX_LEADS_META_ID)
-
-            cur.execute(queries.CREATE_TABLE_INTERACTIONS.format(
-                id_type_serial=id_type_serial, lead_id_type=lead_id_type, timestamp_default=timestamp_default
-            ))
-            cur.execute(queries.CREATE_INDEX_INTERACTIONS_LEAD_ID)
-            
-        logger.info(f"✅ Tablas sincronizadas con Schema Natalia v2.0 ({BACKEND})")
+            yield cur
+        return
+
+    started = time.perf_counter()
+    broken = False
+    outcome = "commit"
+    try:
+        yield metrics.InstrumentedCursor(conn.cursor(), "postgres_read")
+        conn.rollback()  # Solo lectura: nada que confirmar
+        _read_breaker.record_success()
+    except Exception as e:
+        outcome = "rollback"
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+        if broken or _is_connection_error(conn, e):
+            _read_breaker.record_failure()
+        else:
+            _read_breaker.record_success()  # La BD respondió (error de la query)
+        raise
+    finally:
+        _read_pool.putconn(conn, close=broken or conn.closed != 0)
+        metrics.DB_TRANSACTION_SECONDS.observe(
+            time.perf_counter() - started, backend="postgres_read", outcome=outcome
+        )
+
+def get_sqlite_path() -> str:
+    """Ruta del archivo SQLite local (compartido con el layer async)"""
+    import os
+    db_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "database")
+    os.makedirs(db_dir, exist_ok=True)
+    return os.path.join(db_dir, "local_fallback.db")
+
+def get_outbox_path() -> str:
+    """Archivo de la outbox local (junto a local_fallback.db)"""
+    import os
+    return os.path.join(os.path.dirname(get_sqlite_path()), "outbox.db")
+
+def get_deliveries_path() -> str:
+    """Cola de reintentos de CAPI / n8n (ver app/delivery_queue.py)"""
+    import os
+    return os.path.join(os.path.dirname(get_sqlite_path()), "deliveries.db")
+
+def init_tables():
+    """
+    Aplica las migraciones pendientes (migrations/NNNN_*.sql).
+    Si el schema está al día solo cuesta una consulta de versión.
+    Sin archivos de migración lanza MigrationsNotFoundError (el arranque falla).
+    """
+    try:
+        version = migrator.migrate(get_cursor, BACKEND)
+        logger.info(f"✅ Schema en versión {version} ({BACKEND})")
         return True
+    except migrator.MigrationsNotFoundError as e:
+        logger.critical(f"🚨 {e}")
+        raise
     except Exception as e:
-        logger.error(f"❌ Error sincronizando tablas: {e}")
+        logger.error(f"❌ Error aplicando migraciones: {e}")
         import traceback
         logger.error(traceback.format_exc())
         return False
 
+# =================================================================
+# OUTBOX (store & forward durante caídas de PostgreSQL)
+# =================================================================
+
+def is_transient_db_error(error: Exception) -> bool:
+    """Caída/red/pool de PostgreSQL (la escritura puede reintentarse luego)"""
+    if isinstance(error, (CircuitOpenError, PoolTimeoutError)):
+        return True
+    if not HAS_POSTGRES:
+        return False
+    if isinstance(error, psycopg2.InterfaceError):
+        return True
+    return (
+        isinstance(error, psycopg2.OperationalError)
+        and not isinstance(error, psycopg2.extensions.QueryCanceledError)
+    )
+
+def _outbox_available() -> bool:
+    return BACKEND == "postgres" and not db_breaker.is_open
+
+def _get_replayer() -> OutboxReplayer:
+    global _outbox, _replayer
+    with _outbox_lock:
+        if _replayer is None:
+            _outbox = LocalOutbox(get_outbox_path(), max_attempts=settings.OUTBOX_MAX_ATTEMPTS)
+            _replayer = OutboxReplayer(
+                _outbox,
+                get_cursor,
+                _REPLAY_HANDLERS,
+                _outbox_available,
+                batch_size=settings.OUTBOX_BATCH_SIZE,
+                interval=settings.OUTBOX_REPLAY_INTERVAL_SECONDS
+            )
+        return _replayer
+
+def enqueue_outbox(operation: str, payload: Any) -> bool:
+    """Anota la escritura en la outbox local; el replayer la aplicará a PostgreSQL"""
+    if not settings.OUTBOX_ENABLED or BACKEND != "postgres":
+        return False
+    try:
+        replayer = _get_replayer()
+        replayer.outbox.append(operation, payload)
+        replayer.wake()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Outbox local no disponible ({operation}): {e}")
+        return False
+
+def outbox_write(operation: str, payload: Any, error: Exception) -> bool:
+    """True si la escritura fallida quedó en la outbox (solo errores transitorios)"""
+    if not is_transient_db_error(error) or not enqueue_outbox(operation, payload):
+        return False
+    logger.warning(f"📮 PostgreSQL no disponible: '{operation}' guardado en outbox local ({error})")
+    return True
+
+def _replay_insert_visitors(cur, rows):
+    from psycopg2.extras import execute_values
+    rows = [tuple(row) for row in rows]
+    with metrics.time_query("INSERT_VISITORS_BATCH", "postgres", len(rows)):
+        execute_values(cur.raw, queries.INSERT_VISITORS_BATCH, rows, page_size=len(rows))
+
+def _replay_upsert_contact(cur, contact_data):
+    cur.execute(queries.UPSERT_CONTACT_POSTGRES, _contact_params(contact_data))
+
+def _replay_log_interaction(cur, payload):
+    cur.execute(queries.APPEND_EVENT_BY_LEAD_POSTGRES, (payload["lead_id"], payload["role"], payload["content"]))
+
+def _replay_save_message(cur, payload):
+    cur.execute(queries.APPEND_EVENT_BY_PHONE_POSTGRES, (payload["whatsapp_number"], payload["role"], payload["content"]))
+
+def _replay_ingest_inbound(cur, payload):
+    meta_data = payload.get("meta_data")
+    cur.execute(queries.INGEST_INBOUND_POSTGRES, (
+        payload["whatsapp_phone"], *lead_meta_columns(meta_data), "user", payload["text"], external_message_id(meta_data)
+    ))
+
+# operación -> fn(cursor, payload); la capa async usa las mismas operaciones
+_REPLAY_HANDLERS = {
+    "insert_visitors": _replay_insert_visitors,
+    "upsert_contact": _replay_upsert_contact,
+    "log_interaction": _replay_log_interaction,
+    "save_message": _replay_save_message,
+    "ingest_inbound_message": _replay_ingest_inbound,
+}
+
 # =================================================================
 # OPERATIONS
 # =================================================================
 
+@metrics.timed_operation
 def save_visitor(external_id, fbclid, ip_address, user_agent, source="pageview", utm_data=None):
+    """
+    Registra una visita. Con VISITOR_WRITE_BUFFER activo solo encola la fila;
+    el buffer la inserta junto a otras en un único INSERT multi-fila.
+    """
     if utm_data is None:
         utm_data = {}
-        
-    with get_cursor() as cur:
-        if cur:
-            cur.execute(
-                queries.INSERT_VISITOR,
-                (
-                    external_id, 
-                    fbclid, 
-                    ip_address, 
-                    user_agent[:500] if user_agent else None, 
-                    source,
-                    utm_data.get('utm_source'),
-                    utm_data.get('utm_medium'),
-                    utm_data.get('utm_campaign'),
-                    utm_data.get('utm_term'),
-                    utm_data.get('utm_content')
-                )
-            )
 
+    row = (
+        external_id, 
+        fbclid, 
+        ip_address, 
+        user_agent[:500] if user_agent else None, 
+        source,
+        utm_data.get('utm_source'),
+        utm_data.get('utm_medium'),
+        utm_data.get('utm_campaign'),
+        utm_data.get('utm_term'),
+        utm_data.get('utm_content'),
+        external_id[:REF_TAG_LENGTH] if external_id else None
+    )
+
+    if settings.VISITOR_WRITE_BUFFER:
+        _get_visitor_buffer().add(row)
+    else:
+        _insert_visitors([row])
+
+def _get_visitor_buffer() -> WriteBehindBuffer:
+    global _visitor_buffer
+    if _visitor_buffer is None:
+        _visitor_buffer = WriteBehindBuffer(
+            "visitors",
+            _insert_visitors,
+            max_rows=settings.VISITOR_BUFFER_MAX_ROWS,
+            flush_interval=settings.VISITOR_BUFFER_FLUSH_MS / 1000.0
+        )
+    return _visitor_buffer
+
+@metrics.timed_operation
+def _insert_visitors(rows):
+    """Inserta un lote de visitantes en una sola transacción"""
+    try:
+        with get_cursor() as cur:
+            if BACKEND == "postgres":
+                _replay_insert_visitors(cur, rows)
+            else:
+                cur.executemany(queries.INSERT_VISITOR, rows)
+    except Exception as e:
+        if not outbox_write("insert_visitors", rows, e):
+            raise
+
+def flush_visitors():
+    """Fuerza el flush del buffer de visitantes"""
+    if _visitor_buffer is not None:
+        _visitor_buffer.flush()
+
+def get_visitor_buffer_stats() -> Dict[str, Any]:
+    if _visitor_buffer is None:
+        return {"pending": 0}
+    return _visitor_buffer.stats()
+
+def _collect_gauges() -> Dict[str, Any]:
+    """Gauges para GET /metrics: pool, buffer de visitantes y cachés"""
+    gauges = {f"db_pool_{k}": v for k, v in get_pool_stats().items()}
+    gauges.update({f"db_read_pool_{k}": v for k, v in get_read_pool_stats().items()})
+    gauges.update({f"visitor_buffer_{k}": v for k, v in get_visitor_buffer_stats().items()})
+    gauges.update({f"contact_id_cache_{k}": v for k, v in contact_ids.stats().items()})
+    gauges.update({f"ref_tag_cache_{k}": v for k, v in ref_tag_meta.stats().items()})
+    gauges.update({f"knowledge_cache_{k}": v for k, v in knowledge.stats().items()})
+    gauges.update({f"chat_history_cache_{k}": v for k, v in chat_histories.stats().items()})
+    gauges["knowledge_cache_version_changes"] = knowledge_version.stats()["changes"]
+    gauges.update({f"db_breaker_{k}": v for k, v in db_breaker.stats().items()})
+    if _read_breaker is replica_breaker:
+        gauges.update({f"db_replica_breaker_{k}": v for k, v in replica_breaker.stats().items()})
+    if _replayer is not None:
+        gauges.update({f"outbox_{k}": v for k, v in _replayer.stats().items()})
+    return gauges
+
+metrics.register_gauges(_collect_gauges)
+
+@metrics.timed_operation
 def upsert_contact_advanced(contact_data: Dict[str, Any]):
     """
     Upsert avanzado estilo CRM Natalia. Sincroniza marketing y ventas.
@@ -320,7 +566,20 @@ def upsert_contact_advanced(contact_data: Dict[str, Any]):
                 ))
         return
 
-    params = (
+    try:
+        with get_cursor() as cur:
+            if cur:
+                cur.execute(queries.UPSERT_CONTACT_POSTGRES, _contact_params(contact_data))
+                mark_written(contact_data.get('phone'))
+                logger.info(f"🚀 Natalia Sync Success: {contact_data.get('phone')}")
+    except Exception as e:
+        if outbox_write("upsert_contact", contact_data, e):
+            return
+        logger.error(f"❌ Natalia Sync Error: {e}")
+
+def _contact_params(contact_data: Dict[str, Any]) -> tuple:
+    """Parámetros de UPSERT_CONTACT_POSTGRES (compartido con el replay de la outbox)"""
+    return (
         contact_data.get('phone'),
         contact_data.get('name'),
         contact_data.get('profile_pic_url'),
@@ -337,55 +596,100 @@ def upsert_contact_advanced(contact_data: Dict[str, Any]):
         contact_data.get('service_interest')
     )
 
-    try:
-        with get_cursor() as cur:
-            if cur:
-                cur.execute(queries.UPSERT_CONTACT_POSTGRES, params)
-                logger.info(f"🚀 Natalia Sync Success: {contact_data.get('phone')}")
-    except Exception as e:
-        logger.error(f"❌ Natalia Sync Error: {e}")
-
 # Backward compatibility alias
 upsert_contact = upsert_contact_advanced
 
+def _append_event_sqlite(cur, whatsapp_number: str, role: str, content: str, external_id: Optional[str] = None) -> tuple:
+    """
+    SQLite: reserva el siguiente seq del contacto (upsert) e inserta el turno.
+    Retorna (contact_id, appended); appended=False si external_id ya estaba registrado.
+    """
+    cur.execute(queries.UPSERT_CONTACT_SEQ_SQLITE, (str(uuid.uuid4()), whatsapp_number))
+    contact_id, seq = cur.fetchone()
+    cur.execute(queries.INSERT_CONVERSATION_EVENT, (contact_id, seq, role, content, external_id))
+    return (contact_id, cur.rowcount > 0)
+
+def _append_event_by_contact(cur, contact_id: str, role: str, content: str) -> bool:
+    """Turno para un contact_id conocido. False si el contacto ya no existe."""
+    if BACKEND == "postgres":
+        cur.execute(queries.APPEND_EVENT_BY_CONTACT_POSTGRES, (contact_id, role, content))
+        return cur.fetchone() is not None
+    cur.execute(queries.NEXT_EVENT_SEQ_SQLITE, (contact_id,))
+    row = cur.fetchone()
+    if row is None:
+        return False
+    cur.execute(queries.INSERT_CONVERSATION_EVENT, (contact_id, row[1], role, content, None))
+    return True
+
+@metrics.timed_operation
 def save_message(whatsapp_number: str, role: str, content: str):
-    """Guarda un mensaje en el historial para memoria de Natalia"""
+    """
+    Agrega un turno al log de conversación (memoria de Natalia).
+    Con el contact_id en caché es una sola sentencia; si no, un upsert del
+    contacto que reserva el seq e inserta el turno (sin conexiones anidadas).
+    Tras el COMMIT el turno se agrega al historial en memoria del contacto.
+    """
+    token = chat_histories.begin_write(whatsapp_number)
     try:
+        contact_id = contact_ids.get(whatsapp_number)
+        if contact_id is not None:
+            with get_cursor() as cur:
+                if not cur: return
+                appended = _append_event_by_contact(cur, contact_id, role, content)
+            if appended:
+                chat_histories.append(whatsapp_number, role, content, token)
+                return
+            # El contacto fue borrado: el id y la conversación en caché ya no sirven
+            invalidate_contact_id(whatsapp_number)
+            chat_histories.invalidate(whatsapp_number)
+
         with get_cursor() as cur:
             if not cur: return
-            
-            # 1. Obtener contact_id
-            cur.execute(queries.SELECT_CONTACT_ID_BY_PHONE, (whatsapp_number,))
-            row = cur.fetchone()
-            if not row:
-                # Si no existe, lo creamos mínimo
-                upsert_contact_advanced({'phone': whatsapp_number, 'status': 'new'})
-                cur.execute(queries.SELECT_CONTACT_ID_BY_PHONE, (whatsapp_number,))
-                row = cur.fetchone()
-            
-            contact_id = row[0]
-            
-            # 2. Insertar mensaje
-            cur.execute(queries.INSERT_MESSAGE, (contact_id, role, content))
+            if BACKEND == "postgres":
+                cur.execute(queries.APPEND_EVENT_BY_PHONE_POSTGRES, (whatsapp_number, role, content))
+                contact_id = cur.fetchone()[0]
+            else:
+                contact_id, _ = _append_event_sqlite(cur, whatsapp_number, role, content)
+
+        chat_histories.append(whatsapp_number, role, content, token)
+        if contact_id is not None:
+            contact_ids.set(whatsapp_number, str(contact_id))
     except Exception as e:
+        payload = {"whatsapp_number": whatsapp_number, "role": role, "content": content}
+        if outbox_write("save_message", payload, e):
+            return
         logger.error(f"❌ Error guardando mensaje: {e}")
 
+@metrics.timed_operation
 def get_chat_history(whatsapp_number: str, limit: int = 10):
-    """Obtiene los últimos N mensajes para contexto de la IA"""
+    """
+    Obtiene los últimos N mensajes para contexto de la IA.
+    Conversación activa: sale del ring buffer en memoria, sin tocar la BD.
+    Arranque en frío: una consulta de CHAT_HISTORY_CACHE_TURNS filas la hidrata.
+    """
+    cached = chat_histories.get(whatsapp_number, limit)
+    if cached is not None:
+        return cached
+
     history = []
+    token = chat_histories.load_token()
     try:
         with get_cursor() as cur:
             if not cur: return []
-            cur.execute(queries.SELECT_CHAT_HISTORY, (whatsapp_number, limit))
+            cur.execute(queries.SELECT_CHAT_HISTORY, (whatsapp_number, max(limit, chat_histories.turns)))
             rows = cur.fetchall()
             # Invertir para que sea cronológico
             for row in reversed(rows):
                 history.append({"role": row[0], "content": row[1]})
     except Exception as e:
         logger.error(f"❌ Error obteniendo historial: {e}")
-    return history
+        return history
 
+    chat_histories.hydrate(whatsapp_number, history, token)
+    return history[-limit:] if limit > 0 else []
 
+
+@metrics.timed_operation
 def get_visitor_fbclid(external_id):
     with get_cursor() as cur:
         if cur:
@@ -397,14 +701,18 @@ def get_visitor_fbclid(external_id):
 def initialize():
     if init_pool():
         init_tables()
+        if BACKEND == "postgres" and settings.OUTBOX_ENABLED:
+            # Drena lo que haya quedado de una caída anterior
+            _get_replayer().start()
         return True
     return False
 
+@metrics.timed_operation
 def get_all_visitors(limit: int = 50) -> List[Dict[str, Any]]:
     """Obtiene los últimos visitantes para el dashboard"""
     visitors = []
     try:
-        with get_cursor() as cur:
+        with get_read_cursor() as cur:
             if cur:
                 cur.execute(queries.SELECT_RECENT_VISITORS, (limit,))
                 rows = cur.fetchall()
@@ -420,10 +728,11 @@ def get_all_visitors(limit: int = 50) -> List[Dict[str, Any]]:
         logger.error(f"❌ Error obteniendo visitors: {e}")
     return visitors
 
+@metrics.timed_operation
 def get_visitor_by_id(visitor_id: int) -> Optional[Dict[str, Any]]:
     """Obtiene un visitante por ID"""
     try:
-        with get_cursor() as cur:
+        with get_read_cursor() as cur:
             if cur:
                 cur.execute(queries.SELECT_VISITOR_BY_ID, (visitor_id,))
                 row = cur.fetchone()
@@ -443,6 +752,7 @@ def get_visitor_by_id(visitor_id: int) -> Optional[Dict[str, Any]]:
 # W-003 TRACKING OPERATIONS (Tracking Rescue)
 # =================================================================
 
+@metrics.timed_operation
 def mark_lead_sent(whatsapp_number: str) -> bool:
     """Marca a un usuario como ya enviado a Meta para evitar duplicados (Senior Guard)"""
     try:
@@ -454,18 +764,30 @@ def mark_lead_sent(whatsapp_number: str) -> bool:
         logger.error(f"❌ Error marcando lead enviado: {e}")
         return False
 
-def get_user_message_count(whatsapp_number: str) -> int:
-    """Cuenta cuántos mensajes ha enviado el USUARIO para el filtro de calidad"""
+@metrics.timed_operation
+def get_message_counters(whatsapp_number: str) -> Dict[str, Any]:
+    """
+    Contadores de mensajes del contacto (filtro de calidad, lead scoring).
+    Columnas mantenidas por trigger: una lectura por PK, sin COUNT(*).
+    """
+    counters = {"user": 0, "assistant": 0, "last_user_message_at": None}
     try:
         with get_cursor() as cur:
-            if not cur: return 0
-            cur.execute(queries.COUNT_USER_MESSAGES, (whatsapp_number,))
+            if not cur: return counters
+            cur.execute(queries.SELECT_MESSAGE_COUNTERS, (whatsapp_number,))
             row = cur.fetchone()
-            return row[0] if row else 0
+            if row:
+                counters = {"user": row[0] or 0, "assistant": row[1] or 0, "last_user_message_at": row[2]}
     except Exception as e:
-        logger.error(f"❌ Error contando mensajes: {e}")
-        return 0
+        logger.error(f"❌ Error leyendo contadores de mensajes: {e}")
+    return counters
 
+@metrics.timed_operation
+def get_user_message_count(whatsapp_number: str) -> int:
+    """Cuenta cuántos mensajes ha enviado el USUARIO para el filtro de calidad"""
+    return get_message_counters(whatsapp_number)["user"]
+
+@metrics.timed_operation
 def check_if_lead_sent(whatsapp_number: str) -> bool:
     """Verifica si ya pagamos a Meta por este Lead (Financial Shield)"""
     try:
@@ -478,15 +800,32 @@ def check_if_lead_sent(whatsapp_number: str) -> bool:
         logger.error(f"❌ Error verificando lead enviado: {e}")
         return False
 
+@metrics.timed_operation
 def get_meta_data_by_ref(ref_tag: str) -> Optional[Dict[str, Any]]:
-    """Recupera cookies fbc/fbp usando el [Ref Tag] del mensaje de WA"""
+    """
+    Recupera cookies fbc/fbp usando el [Ref Tag] del mensaje de WA.
+    Búsqueda exacta sobre idx_visitors_ref_tag, con caché caliente delante.
+    Sin acierto y con REF_TAG_PREFIX_FALLBACK: prefijo de external_id (backfill pendiente).
+    """
+    ref_tag = (ref_tag or "").strip()
+    if len(ref_tag) != REF_TAG_LENGTH:
+        return None
+
+    cached = ref_tag_meta.get(ref_tag)
+    if cached is not None:
+        return dict(cached)
+
     try:
         with get_cursor() as cur:
             if not cur: return None
-            cur.execute(queries.SELECT_META_DATA_BY_REF, (f"{ref_tag}%",))
+            cur.execute(queries.SELECT_META_DATA_BY_REF, (ref_tag,))
             row = cur.fetchone()
+            if not row and settings.REF_TAG_PREFIX_FALLBACK:
+                # Visitas anteriores a 0003 que el backfill aún no completó
+                cur.execute(queries.SELECT_META_DATA_BY_REF_PREFIX, (ref_tag + "%",))
+                row = cur.fetchone()
             if row:
-                return {
+                meta = {
                     "fbclid": row[0],
                     "user_agent": row[1],
                     "ip_address": row[2],
@@ -494,10 +833,14 @@ def get_meta_data_by_ref(ref_tag: str) -> Optional[Dict[str, Any]]:
                     "utm_medium": row[4],
                     "utm_campaign": row[5]
                 }
+                # Solo aciertos: la visita puede seguir en el buffer write-behind
+                ref_tag_meta.set(ref_tag, meta)
+                return dict(meta)
     except Exception as e:
         logger.error(f"❌ Error buscando meta data por ref: {e}")
     return None
 
+@metrics.timed_operation
 def get_or_create_lead(whatsapp_phone: str, meta_data: Optional[dict] = None) -> tuple[Optional[str], bool]:
     """
     Obtiene o crea un Lead basado en el teléfono.
@@ -557,17 +900,87 @@ def get_or_create_lead(whatsapp_phone: str, meta_data: Optional[dict] = None) ->
         logger.error(f"❌ Error en get_or_create_lead: {e}")
         return (None, False)
 
+@metrics.timed_operation
 def log_interaction(lead_id: str, role: str, content: str) -> bool:
-    """Registra una interacción (mensaje) para el Lead"""
+    """Registra un turno para el Lead en el log de conversación de su teléfono"""
     try:
         with get_cursor() as cur:
             if not cur: return False
-            cur.execute(queries.INSERT_INTERACTION, (lead_id, role, content))
-            return True
+            if BACKEND == "postgres":
+                cur.execute(queries.APPEND_EVENT_BY_LEAD_POSTGRES, (lead_id, role, content))
+                row = cur.fetchone()
+            else:
+                cur.execute(queries.SELECT_LEAD_PHONE, (lead_id,))
+                row = cur.fetchone()
+                if row:
+                    _append_event_sqlite(cur, row[0], role, content)
+        if not row:
+            logger.warning(f"⚠️ log_interaction: lead {lead_id} no existe")
+            return False
+        # El teléfono se conoce recién ahora: la conversación en memoria se recarga
+        chat_histories.begin_write(row[0])
+        chat_histories.invalidate(row[0])
+        return True
     except Exception as e:
+        if outbox_write("log_interaction", {"lead_id": lead_id, "role": role, "content": content}, e):
+            return True
         logger.error(f"❌ Error en log_interaction: {e}")
         return False
 
+@metrics.timed_operation
+def ingest_inbound_message(whatsapp_phone: str, text: str, meta_data: Optional[dict] = None) -> tuple[Optional[str], bool]:
+    """
+    Camino caliente de un mensaje entrante: upsert del Lead + turno 'user'
+    en una sola transacción (PostgreSQL: una sola sentencia CTE).
+    Un reintento con el mismo id de mensaje de Evolution no duplica el turno.
+    Retorna tupla: (lead_id, is_new) como get_or_create_lead.
+    """
+    meta = lead_meta_columns(meta_data)
+    external_id = external_message_id(meta_data)
+    token = chat_histories.begin_write(whatsapp_phone)
+
+    try:
+        with get_cursor() as cur:
+            if not cur: return (None, False)
+
+            if BACKEND == "postgres":
+                cur.execute(queries.INGEST_INBOUND_POSTGRES, (whatsapp_phone, *meta, "user", text, external_id))
+                lead_id, is_new, appended = cur.fetchone()
+            else:
+                new_id = str(uuid.uuid4())
+                cur.execute(queries.UPSERT_LEAD_RETURNING_SQLITE, (new_id, whatsapp_phone, *meta))
+                lead_id = cur.fetchone()[0]
+                is_new = lead_id == new_id
+                _, appended = _append_event_sqlite(cur, whatsapp_phone, "user", text, external_id)
+
+        if appended:
+            chat_histories.append(whatsapp_phone, "user", text, token)
+        if is_new:
+            logger.info(f"✨ Creando Nuevo Lead: {whatsapp_phone}")
+        return (str(lead_id), bool(is_new))
+
+    except Exception as e:
+        # Sin lead_id hasta que la outbox lo reaplique, pero el mensaje no se pierde
+        payload = {"whatsapp_phone": whatsapp_phone, "text": text, "meta_data": meta_data}
+        if not outbox_write("ingest_inbound_message", payload, e):
+            logger.error(f"❌ Error en ingest_inbound_message: {e}")
+        return (None, False)
+
+def lead_meta_columns(meta_data: Optional[dict]) -> tuple:
+    """Columnas de atribución del Lead (orden de INGEST_INBOUND_POSTGRES)"""
+    meta_data = meta_data or {}
+    return (
+        meta_data.get('meta_lead_id'),
+        meta_data.get('click_id'),
+        meta_data.get('email'),
+        meta_data.get('name')
+    )
+
+def external_message_id(meta_data: Optional[dict]) -> Optional[str]:
+    """Id del (primer) mensaje de Evolution del turno: clave de deduplicación"""
+    meta_data = meta_data or {}
+    message_ids = meta_data.get('message_ids') or []
+    return message_ids[0] if message_ids else meta_data.get('message_id')
 
 
 def check_connection() -> bool:
@@ -585,6 +998,7 @@ def check_connection() -> bool:
 # NATALIA KNOWLEDGE BASE
 # =================================================================
 
+@metrics.timed_operation
 def save_knowledge_fact(slug: str, category: str, content: str):
     """Guarda o actualiza un hecho en la base de conocimiento"""
     try:
@@ -597,26 +1011,54 @@ def save_knowledge_fact(slug: str, category: str, content: str):
                 sql = queries.UPSERT_KNOWLEDGE_SQLITE
                 
             cur.execute(sql, (slug, category, content))
-            logger.info(f"🧠 Natalia Learned: {slug} ({category})")
-            return True
+
+        # Después del COMMIT: ninguna lectura puede recachear el valor viejo
+        mark_written("knowledge")
+        invalidate_knowledge()
+        logger.info(f"🧠 Natalia Learned: {slug} ({category})")
+        return True
     except Exception as e:
         logger.error(f"❌ Error guardando conocimiento: {e}")
         return False
 
+def _refresh_knowledge_version():
+    """
+    Poll del watermark (filas + MAX(updated_at)) como mucho cada
+    KNOWLEDGE_VERSION_CHECK_SECONDS: si otro worker cambió el conocimiento,
+    el caché se vacía. Entre polls, las lecturas no tocan la BD.
+    """
+    if not knowledge_version.due():
+        return
+    try:
+        with get_read_cursor("knowledge") as cur:
+            if not cur: return
+            cur.execute(queries.SELECT_KNOWLEDGE_VERSION)
+            version = tuple(cur.fetchone())
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer la versión del conocimiento: {e}")
+        return
+    if knowledge_version.observe(version):
+        knowledge.clear()
+        logger.info("🧠 Conocimiento modificado en BD: caché invalidado")
+
+@metrics.timed_operation
 def get_knowledge_base(category: Optional[str] = None) -> List[Dict[str, Any]]:
-    """Obtiene el conocimiento del negocio, opcionalmente por categoría"""
+    """Obtiene el conocimiento del negocio, opcionalmente por categoría (cacheado)"""
+    _refresh_knowledge_version()
+    key = ("facts", category or None)
+    cached = knowledge.get(key)
+    if cached is not None:
+        return list(cached)
+
     facts = []
     try:
-        with get_cursor() as cur:
+        with get_read_cursor("knowledge") as cur:
             if not cur: return []
-            
-            sql = "SELECT slug, category, content FROM business_knowledge"
-            params = []
+
             if category:
-                sql += " WHERE category = %s"
-                params.append(category)
-                
-            cur.execute(sql, tuple(params))
+                cur.execute(queries.SELECT_KNOWLEDGE_BY_CATEGORY, (category,))
+            else:
+                cur.execute(queries.SELECT_KNOWLEDGE_BASE)
             rows = cur.fetchall()
             for row in rows:
                 facts.append({
@@ -626,4 +1068,7 @@ def get_knowledge_base(category: Optional[str] = None) -> List[Dict[str, Any]]:
                 })
     except Exception as e:
         logger.error(f"❌ Error obteniendo knowledge base: {e}")
+        return facts
+
+    knowledge.set(key, tuple(facts))
     return facts
@@ -0,0 +1,109 @@
+# =================================================================
+# EVENT_DEDUP.PY - Deduplicación de Eventos CAPI por event_id
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# El mismo (event_name, event_id) llega varias veces: navegador vía
+# /track/event, reintentos de Celery, el loop de n8n. Meta deduplica de su
+# lado (48 h), pero cada copia igual cuesta un POST.
+# claim() antes de armar el payload:
+# - Caché local TTLCache (LRU + TTL): duplicados del mismo proceso
+# - Redis opcional (CAPI_DEDUP_REDIS_URL): SET NX EX compartido entre
+#   workers; si Redis falla, el breaker lo saltea y queda solo lo local
+# release() devuelve la clave si el envío falló: otra copia puede reintentar.
+# =================================================================
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from app.cache import TTLCache
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+try:
+    import redis
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "capi:dedup:"
+
+
+class EventDeduplicator:
+    """Registro "ya enviado o en vuelo" por (event_name, event_id)"""
+
+    def __init__(self, maxsize: int = 50000, ttl: float = 172800.0, redis_url: Optional[str] = None):
+        self.ttl = ttl
+        self._local = TTLCache(maxsize, ttl)
+        self._lock = threading.Lock()
+        self._redis = None
+        self._breaker = CircuitBreaker("redis_dedup", failure_threshold=1, reset_timeout=30.0)
+        if redis_url and HAS_REDIS:
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        elif redis_url:
+            logger.warning("⚠️ CAPI_DEDUP_REDIS_URL configurado pero falta el paquete redis: dedup solo local")
+
+        # Estadísticas
+        self._claims = 0
+        self._duplicates = 0
+        self._shared_duplicates = 0
+
+    def claim(self, event_name: str, event_id: Optional[str]) -> bool:
+        """True si el evento es nuevo (hay que enviarlo); False si es un duplicado"""
+        if not event_id:
+            return True
+        key = f"{event_name}:{event_id}"
+        with self._lock:
+            self._claims += 1
+            if self._local.get(key) is not None:
+                self._duplicates += 1
+                return False
+            self._local.set(key, True)
+
+        if self._redis is not None and not self._claim_shared(key):
+            with self._lock:
+                self._duplicates += 1
+                self._shared_duplicates += 1
+            return False
+        return True
+
+    def release(self, event_name: str, event_id: Optional[str]):
+        """El envío falló: la próxima copia del evento vuelve a intentarlo"""
+        if not event_id:
+            return
+        key = f"{event_name}:{event_id}"
+        self._local.invalidate(key)
+        if self._redis is not None and not self._breaker.is_open:
+            try:
+                self._redis.delete(KEY_PREFIX + key)
+            except Exception as e:
+                logger.warning(f"⚠️ Redis dedup: {e}")
+                self._breaker.record_failure()
+
+    def _claim_shared(self, key: str) -> bool:
+        try:
+            self._breaker.before_call()
+            claimed = self._redis.set(KEY_PREFIX + key, 1, nx=True, ex=int(self.ttl))
+            self._breaker.record_success()
+            return bool(claimed)
+        except CircuitOpenError:
+            return True
+        except Exception as e:
+            # Sin Redis se envía igual: un duplicado en Meta es mejor que perder el evento
+            logger.warning(f"⚠️ Redis dedup no disponible, solo caché local: {e}")
+            self._breaker.record_failure()
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            claims, duplicates = self._claims, self._duplicates
+            stats = {
+                "claims": claims,
+                "duplicates": duplicates,
+                "shared_duplicates": self._shared_duplicates,
+                "hit_rate": round(duplicates / claims, 3) if claims else 0.0,
+                "size": len(self._local),
+            }
+        stats["shared_up"] = int(self._redis is not None and not self._breaker.is_open)
+        return stats
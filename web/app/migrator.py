@@ -0,0 +1,166 @@
+# =================================================================
+# MIGRATOR.PY - Migraciones de Schema Versionadas
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# Reemplaza el init_tables() que re-ejecutaba todo el DDL en cada arranque.
+# - Archivos ordenados en migrations/ (compartidos web + natalia-brain):
+#   <servicio>/migrations si existe (natalia-brain en Render, rootDir propio),
+#   si no <repo>/migrations. MIGRATIONS_DIR relativo = relativo al servicio.
+#   Sin migraciones el arranque falla: nunca se corre con un schema viejo.
+#     NNNN_nombre.sql            -> ambos dialectos
+#     NNNN_nombre.postgres.sql   -> solo PostgreSQL
+#     NNNN_nombre.sqlite.sql     -> solo SQLite
+# - Tabla schema_version: una fila por migración aplicada
+# - Fast path: si el schema está al día, una sola consulta y nada más
+# =================================================================
+import logging
+import os
+import re
+import sqlite3
+from functools import lru_cache
+from typing import Callable, List, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+_SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _default_migrations_dir() -> str:
+    bundled = os.path.join(_SERVICE_DIR, "migrations")
+    if os.path.isdir(bundled):
+        return bundled
+    return os.path.join(os.path.dirname(_SERVICE_DIR), "migrations")
+
+
+MIGRATIONS_DIR = os.path.join(_SERVICE_DIR, os.getenv("MIGRATIONS_DIR") or _default_migrations_dir())
+
+# Serializa arranques concurrentes (varios workers) en PostgreSQL
+ADVISORY_LOCK_ID = 0x4A414631  # "JAF1"
+
+CREATE_SCHEMA_VERSION = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+SELECT_SCHEMA_VERSION = "SELECT MAX(version) FROM schema_version"
+
+INSERT_SCHEMA_VERSION = "INSERT INTO schema_version (version, name) VALUES (%s, %s)"
+
+_FILENAME = re.compile(r"^(\d{4})_([a-z0-9_]+?)(?:\.(postgres|sqlite))?\.sql$")
+
+
+class MigrationsNotFoundError(RuntimeError):
+    """El directorio de migraciones falta o está vacío (deploy incompleto)"""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: str
+
+
+@lru_cache(maxsize=4)
+def load_migrations(backend: str, directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """Migraciones aplicables a `backend`, ordenadas por versión"""
+    if not os.path.isdir(directory):
+        raise MigrationsNotFoundError(f"No existe el directorio de migraciones: {directory}")
+    found = {}
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME.match(filename)
+        if not match:
+            continue
+        version, name, dialect = int(match.group(1)), match.group(2), match.group(3)
+        if dialect and dialect != backend:
+            continue
+        if version in found and not dialect:
+            continue  # La variante del dialecto tiene prioridad
+        found[version] = Migration(version, name, os.path.join(directory, filename))
+    if not found:
+        raise MigrationsNotFoundError(f"Sin migraciones para {backend} en {directory}")
+    return [found[v] for v in sorted(found)]
+
+
+def latest_version(backend: str, directory: str = MIGRATIONS_DIR) -> int:
+    return load_migrations(backend, directory)[-1].version
+
+
+def current_version(get_cursor: Callable) -> int:
+    """Versión aplicada (0 si la tabla schema_version aún no existe)"""
+    try:
+        with get_cursor() as cur:
+            cur.execute(SELECT_SCHEMA_VERSION)
+            row = cur.fetchone()
+            return (row[0] or 0) if row else 0
+    except Exception:
+        return 0
+
+
+def migrate(get_cursor: Callable, backend: str, directory: str = MIGRATIONS_DIR) -> int:
+    """
+    Aplica las migraciones pendientes. Retorna la versión final.
+    Cada migración corre en su propia transacción junto con su fila de schema_version.
+    """
+    target = latest_version(backend, directory)
+    version = current_version(get_cursor)
+    if version >= target:
+        return version  # Fast path: schema al día
+
+    with get_cursor() as cur:
+        cur.execute(CREATE_SCHEMA_VERSION)
+
+    for migration in load_migrations(backend, directory):
+        if migration.version <= version:
+            continue
+        with get_cursor() as cur:
+            if backend == "postgres":
+                # Otro worker pudo aplicarla mientras esperábamos el lock
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (ADVISORY_LOCK_ID,))
+                cur.execute(SELECT_SCHEMA_VERSION)
+                row = cur.fetchone()
+                if row and row[0] is not None and row[0] >= migration.version:
+                    version = row[0]
+                    continue
+            _apply(cur, backend, migration)
+            cur.execute(INSERT_SCHEMA_VERSION, (migration.version, migration.name))
+        version = migration.version
+        logger.info(f"🧱 Migración aplicada: {migration.version:04d}_{migration.name} ({backend})")
+
+    return version
+
+
+def _apply(cur, backend: str, migration: Migration):
+    with open(migration.path, encoding="utf-8") as f:
+        sql = f.read()
+
+    if backend == "postgres":
+        # psycopg2 acepta múltiples sentencias (incluidos bloques DO $$) en un execute
+        cur.execute(sql)
+        return
+
+    for statement in split_sqlite_statements(sql):
+        try:
+            cur.execute(statement)
+        except sqlite3.OperationalError as e:
+            # Bases locales antiguas ya tienen columnas que la baseline añade
+            if "duplicate column name" in str(e):
+                continue
+            raise
+
+
+def split_sqlite_statements(sql: str) -> List[str]:
+    """Divide un script en sentencias completas (respeta triggers BEGIN...END)"""
+    statements, buffer = [], ""
+    for line in sql.splitlines(keepends=True):
+        if not buffer and (not line.strip() or line.lstrip().startswith("--")):
+            continue
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ""
+    if buffer.strip():
+        statements.append(buffer.strip())
+    return statements
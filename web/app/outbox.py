@@ -0,0 +1,218 @@
+# =================================================================
+# OUTBOX.PY - Outbox Local Durable (Store & Forward)
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# Si PostgreSQL no responde a mitad de camino, las escrituras importantes
+# (visitas, contactos, leads, interacciones) no se pierden:
+# 1. Se anotan en un SQLite local append-only (WAL) con una clave de
+#    idempotencia por escritura
+# 2. Un hilo replayer las drena por lotes cuando el breaker vuelve a cerrar
+# 3. En PostgreSQL, outbox_applied registra cada clave aplicada en la misma
+#    transacción que la escritura: un replay repetido (crash entre el COMMIT
+#    y el borrado local) no duplica nada
+# Cada entrada corre bajo su propio SAVEPOINT: una fila inválida no frena
+# al lote; tras OUTBOX_MAX_ATTEMPTS queda como "dead" para revisión manual.
+# =================================================================
+import json
+import logging
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from app.sqlite_backend import SQLiteBackend
+
+logger = logging.getLogger(__name__)
+
+CREATE_OUTBOX = """
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idempotency_key TEXT UNIQUE NOT NULL,
+        operation TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# Clave nueva -> la escritura se aplica; clave repetida -> ya estaba aplicada
+CLAIM_OUTBOX_KEY = """
+    INSERT INTO outbox_applied (idempotency_key) VALUES (%s)
+    ON CONFLICT (idempotency_key) DO NOTHING
+    RETURNING idempotency_key
+"""
+
+
+class OutboxEntry(NamedTuple):
+    id: int
+    key: str
+    operation: str
+    payload: Any
+    attempts: int
+
+
+class LocalOutbox:
+    """Cola durable en un archivo SQLite propio (separado de local_fallback.db)"""
+
+    def __init__(self, path: str, max_attempts: int = 10):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._backend = SQLiteBackend(path)
+        self._backend.connection().execute(CREATE_OUTBOX)
+
+    def append(self, operation: str, payload: Any, key: Optional[str] = None) -> str:
+        key = key or uuid.uuid4().hex
+        conn = self._backend.connection()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO outbox (idempotency_key, operation, payload) VALUES (?, ?, ?)",
+                (key, operation, json.dumps(payload, default=str))
+            )
+        return key
+
+    def pending(self, limit: int) -> List[OutboxEntry]:
+        rows = self._backend.connection().execute(
+            "SELECT id, idempotency_key, operation, payload, attempts FROM outbox "
+            "WHERE attempts < ? ORDER BY id LIMIT ?",
+            (self.max_attempts, limit)
+        ).fetchall()
+        return [OutboxEntry(r[0], r[1], r[2], json.loads(r[3]), r[4]) for r in rows]
+
+    def remove(self, ids: List[int]):
+        if not ids:
+            return
+        conn = self._backend.connection()
+        with conn:
+            conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def record_failure(self, entry_id: int, error: str):
+        conn = self._backend.connection()
+        with conn:
+            conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE id = ?",
+                (error[:500], entry_id)
+            )
+
+    def counts(self) -> Dict[str, int]:
+        depth, dead = self._backend.connection().execute(
+            "SELECT COALESCE(SUM(attempts < ?), 0), COALESCE(SUM(attempts >= ?), 0) FROM outbox",
+            (self.max_attempts, self.max_attempts)
+        ).fetchone()
+        return {"depth": depth, "dead": dead}
+
+    def close(self):
+        self._backend.close_all()
+
+
+class OutboxReplayer:
+    """
+    Hilo daemon que drena la outbox hacia PostgreSQL.
+    handlers: operación -> fn(cursor, payload) que repite la escritura.
+    """
+
+    def __init__(
+        self,
+        outbox: LocalOutbox,
+        get_cursor: Callable,
+        handlers: Dict[str, Callable[[Any, Any], None]],
+        is_available: Callable[[], bool],
+        batch_size: int = 100,
+        interval: float = 5.0,
+    ):
+        self.outbox = outbox
+        self._get_cursor = get_cursor
+        self._handlers = handlers
+        self._is_available = is_available
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Estadísticas
+        self._replayed = 0
+        self._duplicates = 0
+        self._failures = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="outbox-replayer", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Hay entradas nuevas: arranca el hilo si hace falta"""
+        self.start()
+        self._wake.set()
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stop.set()
+        self._wake.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                while self._is_available() and self.drain_once() == self.batch_size:
+                    if self._stop.is_set():
+                        return
+            except Exception as e:
+                logger.warning(f"⚠️ Outbox replay pausado: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def drain_once(self) -> int:
+        """Aplica un lote en una transacción. Retorna cuántas entradas salieron de la cola."""
+        entries = self.outbox.pending(self.batch_size)
+        if not entries:
+            return 0
+
+        done: List[int] = []
+        failed: List[tuple] = []
+        duplicates = 0
+        with self._get_cursor() as cur:
+            for entry in entries:
+                cur.execute("SAVEPOINT outbox_entry")
+                try:
+                    cur.execute(CLAIM_OUTBOX_KEY, (entry.key,))
+                    if cur.fetchone():
+                        self._handlers[entry.operation](cur, entry.payload)
+                    else:
+                        duplicates += 1
+                    cur.execute("RELEASE SAVEPOINT outbox_entry")
+                    done.append(entry.id)
+                except Exception as e:
+                    # Si la conexión murió, este ROLLBACK también falla y aborta el lote
+                    cur.execute("ROLLBACK TO SAVEPOINT outbox_entry")
+                    failed.append((entry.id, f"{type(e).__name__}: {e}"))
+
+        # Después del COMMIT: un crash aquí solo causa un replay idempotente
+        self.outbox.remove(done)
+        for entry_id, error in failed:
+            self.outbox.record_failure(entry_id, error)
+
+        with self._lock:
+            self._replayed += len(done) - duplicates
+            self._duplicates += duplicates
+            self._failures += len(failed)
+        if done:
+            logger.info(f"📮 Outbox: {len(done)} escrituras reaplicadas en PostgreSQL")
+        return len(done)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "replayed": self._replayed,
+                "duplicates": self._duplicates,
+                "failures": self._failures,
+            }
+        stats.update(self.outbox.counts())
+        return stats
@@ -6,7 +6,8 @@ from datetime import datetime
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse, PlainTextResponse
 
-from app.database import check_connection
+from app.database import check_connection, get_pool_stats
+from app import metrics
 
 router = APIRouter(tags=["Health"])
 
@@ -28,11 +29,18 @@ async def health_check():
     return JSONResponse({
         "status": "healthy",
         "database": db_status,
+        "pool": get_pool_stats(),
         "timestamp": datetime.now().isoformat(),
         "service": "Jorge Aguirre Flores Web"
     })
 
 
+@router.get("/metrics")
+async def metrics_endpoint():
+    """Latencias por query / operación de BD en formato texto Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @router.get("/ping", response_class=PlainTextResponse)
 async def ping():
     """Ping simple para monitoreo básico"""
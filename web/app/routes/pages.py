@@ -2,6 +2,7 @@
 # PAGES.PY - Rutas de páginas HTML (FastAPI Background Tasks)
 # Jorge Aguirre Flores Web
 # =================================================================
+import asyncio
 import time
 import logging
 import os
@@ -12,7 +13,8 @@ from typing import Optional
 
 from app.config import settings
 from app.database import get_visitor_fbclid, save_visitor
-from app.tracking import generate_external_id, generate_fbc, send_event
+from app.circuit_breaker import db_breaker
+from app.tracking import generate_external_id, generate_fbc, send_event_async
 from app.services import SERVICES_CONFIG, CONTACT_CONFIG
 
 logger = logging.getLogger("BackgroundWorker")
@@ -33,15 +35,18 @@ def bg_save_visitor(external_id, fbclid, client_ip, user_agent, source, utm_data
     """Saves visitor without blocking page render"""
     try:
         save_visitor(external_id, fbclid, client_ip, user_agent, source, utm_data)
-        logger.info(f"✅ [BG] Visitor saved: {external_id[:16]}...")
+        logger.info(f"✅ [BG] Visitor queued: {external_id[:16]}...")
     except Exception as e:
         logger.error(f"❌ [BG] Error saving visitor: {e}")
 
 
-def bg_send_pageview(event_source_url, client_ip, user_agent, event_id, fbclid, fbp, external_id):
-    """Sends PageView to Meta CAPI without blocking"""
+async def bg_send_pageview(event_source_url, client_ip, user_agent, event_id, fbclid, fbp, external_id):
+    """
+    Sends PageView through the batched Meta CAPI dispatcher (on the event loop, no threadpool).
+    Awaits its batch: on serverless the instance may freeze right after the background tasks.
+    """
     try:
-        success = send_event(
+        success = await send_event_async(
             event_name="PageView",
             event_source_url=event_source_url,
             client_ip=client_ip,
@@ -52,8 +57,8 @@ def bg_send_pageview(event_source_url, client_ip, user_agent, event_id, fbclid,
             external_id=external_id,
             custom_data={}
         )
-        if success:
-            logger.info(f"✅ [BG] PageView sent to Meta CAPI")
+        if not success:
+            logger.warning("⚠️ [BG] PageView rejected or dropped")
     except Exception as e:
         logger.error(f"❌ [BG] PageView error: {e}")
 
@@ -108,9 +113,10 @@ async def read_root(
     external_id = generate_external_id(client_ip, user_agent)
     
     # Fallback: Try to recover fbclid from DB if not in URL
-    if not fbclid:
+    # (en un hilo, y se omite si la BD está caída: la página no espera a Supabase)
+    if not fbclid and not db_breaker.is_open:
         try:
-            fbclid = get_visitor_fbclid(external_id)
+            fbclid = await asyncio.to_thread(get_visitor_fbclid, external_id)
         except Exception as e:
             logger.warning(f"⚠️ DB Warning: Could not retrieve fbclid: {e}")
             fbclid = None
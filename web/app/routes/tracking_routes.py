@@ -19,7 +19,7 @@ from app.config import settings
 from app.models import TrackResponse, LeadCreate, InteractionCreate
 
 # Direct imports (bypassing Celery)
-from app.tracking import send_event, send_n8n_webhook
+from app.tracking import send_event_async, send_n8n_webhook_async
 from app.database import save_visitor, upsert_contact_advanced, get_or_create_lead, log_interaction
 import app.database as database
 
@@ -43,16 +43,16 @@ def bg_save_visitor(external_id, fbclid, client_ip, user_agent, source, utm_data
     """Saves visitor to DB without blocking user"""
     try:
         save_visitor(external_id, fbclid, client_ip, user_agent, source, utm_data)
-        logger.info(f"✅ [BG] Visitor saved: {external_id[:16]}...")
+        logger.info(f"✅ [BG] Visitor queued: {external_id[:16]}...")
     except Exception as e:
         logger.error(f"❌ [BG] Error saving visitor: {e}")
 
 
-def bg_send_meta_event(event_name, event_source_url, client_ip, user_agent, event_id, 
-                       fbclid=None, fbp=None, external_id=None, phone=None, email=None, custom_data=None):
-    """Sends to Meta CAPI without blocking"""
+async def bg_send_meta_event(event_name, event_source_url, client_ip, user_agent, event_id, 
+                             fbclid=None, fbp=None, external_id=None, phone=None, email=None, custom_data=None):
+    """Sends to Meta CAPI on the event loop (batched by the dispatcher, no threadpool)"""
     try:
-        success = send_event(
+        success = await send_event_async(
             event_name=event_name,
             event_source_url=event_source_url,
             client_ip=client_ip,
@@ -66,9 +66,9 @@ def bg_send_meta_event(event_name, event_source_url, client_ip, user_agent, even
             custom_data=custom_data
         )
         if success:
-            logger.info(f"✅ [BG] Meta Event sent: {event_name}")
+            logger.info(f"✅ [BG] Meta Event sent (or queued for retry): {event_name}")
         else:
-            logger.warning(f"⚠️ [BG] Meta Event failed (no retry): {event_name}")
+            logger.warning(f"⚠️ [BG] Meta Event rejected or dropped: {event_name}")
     except Exception as e:
         logger.error(f"❌ [BG] Meta send error: {e}")
 
@@ -82,10 +82,10 @@ def bg_upsert_contact(payload):
         logger.error(f"❌ [BG] Contact sync failed: {e}")
 
 
-def bg_send_webhook(payload):
-    """Sends webhook to n8n without blocking"""
+async def bg_send_webhook(payload):
+    """Sends webhook to n8n on the event loop (bounded concurrency, shared HTTP/2 pool)"""
     try:
-        success = send_n8n_webhook(payload)
+        success = await send_n8n_webhook_async(payload)
         if success:
             logger.info(f"✅ [BG] n8n Webhook sent")
     except Exception as e:
@@ -3,135 +3,24 @@
 # Jorge Aguirre Flores Web
 # =================================================================
 
-# --- DDL: Table Initialization ---
-# Note: Designed to work with both PostgreSQL and SQLite (with some python-side logic for types)
-
-CREATE_TABLE_BUSINESS_KNOWLEDGE = """
-    CREATE TABLE IF NOT EXISTS business_knowledge (
-        id {id_type_serial},
-        slug TEXT UNIQUE NOT NULL,
-        category TEXT NOT NULL, -- 'pricing', 'bio', 'location', 'policy'
-        content TEXT NOT NULL,
-        updated_at TIMESTAMP DEFAULT {timestamp_default}
-    );
-"""
-
-CREATE_INDEX_KNOWLEDGE_SLUG = "CREATE INDEX IF NOT EXISTS idx_knowledge_slug ON business_knowledge(slug);"
-
-CREATE_TABLE_VISITORS = """
-    CREATE TABLE IF NOT EXISTS visitors (
-        id {id_type_serial},
-        external_id TEXT,
-        fbclid TEXT,
-        ip_address TEXT,
-        user_agent TEXT,
-        source TEXT,
-        utm_source TEXT,
-        utm_medium TEXT,
-        utm_campaign TEXT,
-        utm_term TEXT,
-        utm_content TEXT,
-        timestamp TIMESTAMP DEFAULT {timestamp_default}
-    );
-"""
-
-CREATE_INDEX_VISITORS_EXTERNAL_ID = "CREATE INDEX IF NOT EXISTS idx_visitors_external_id ON visitors(external_id);"
-
-CREATE_TABLE_CONTACTS = """
-    CREATE TABLE IF NOT EXISTS contacts (
-        id {id_type_primary_key},
-        whatsapp_number TEXT UNIQUE NOT NULL,
-        full_name TEXT,
-        profile_pic_url TEXT,
-        
-        fb_click_id TEXT,
-        fb_browser_id TEXT,
-        utm_source TEXT,
-        utm_medium TEXT,
-        utm_campaign TEXT,
-        utm_term TEXT,
-        utm_content TEXT,
-        web_visit_count INTEGER DEFAULT 1,
-        conversion_sent_to_meta BOOLEAN DEFAULT FALSE,
-        
-        status {status_type},
-        lead_score INTEGER DEFAULT 50,
-        pain_point TEXT,
-        service_interest TEXT,
-        service_booked_date TIMESTAMP,
-        appointment_count INTEGER DEFAULT 0,
-        
-        created_at TIMESTAMP DEFAULT {timestamp_default},
-        updated_at TIMESTAMP,
-        last_interaction TIMESTAMP DEFAULT {timestamp_default}
-    );
-"""
-
-CREATE_INDEX_CONTACTS_WHATSAPP = "CREATE INDEX IF NOT EXISTS idx_contacts_whatsapp ON contacts(whatsapp_number);"
-CREATE_INDEX_CONTACTS_STATUS = "CREATE INDEX IF NOT EXISTS idx_contacts_status ON contacts(status);"
-
-CREATE_TABLE_MESSAGES = """
-    CREATE TABLE IF NOT EXISTS messages (
-        id {id_type_primary_key},
-        contact_id INTEGER,
-        role TEXT CHECK (role IN ('user', 'assistant', 'system', 'tool')),
-        content TEXT,
-        created_at TIMESTAMP DEFAULT {timestamp_default},
-        FOREIGN KEY (contact_id) REFERENCES contacts(id) ON DELETE CASCADE
-    );
-"""
-
-CREATE_INDEX_MESSAGES_CONTACT_ID = "CREATE INDEX IF NOT EXISTS idx_messages_contact_id ON messages(contact_id);"
-
-CREATE_TABLE_APPOINTMENTS = """
-    CREATE TABLE IF NOT EXISTS appointments (
-        id {id_type_serial},
-        contact_id INTEGER,
-        appointment_date TIMESTAMP NOT NULL,
-        service_type TEXT,
-        status TEXT DEFAULT 'pending',
-        created_at TIMESTAMP DEFAULT {timestamp_default},
-        FOREIGN KEY (contact_id) REFERENCES contacts(id)
-    );
-"""
-
-CREATE_TABLE_LEADS = """
-    CREATE TABLE IF NOT EXISTS leads (
-        id {id_type_primary_key},
-        whatsapp_phone TEXT UNIQUE NOT NULL,
-        meta_lead_id TEXT,
-        click_id TEXT, -- fbclid
-        email TEXT,
-        name TEXT,
-        conversion_status TEXT DEFAULT 'NEW',
-        created_at TIMESTAMP DEFAULT {timestamp_default},
-        last_interaction TIMESTAMP DEFAULT {timestamp_default}
-    );
-"""
-
-CREATE_INDEX_LEADS_PHONE = "CREATE INDEX IF NOT EXISTS idx_leads_phone ON leads(whatsapp_phone);"
-CREATE_INDEX_LEADS_META_ID = "CREATE INDEX IF NOT EXISTS idx_leads_meta_id ON leads(meta_lead_id);"
-
-CREATE_TABLE_INTERACTIONS = """
-    CREATE TABLE IF NOT EXISTS interactions (
-        id {id_type_serial},
-        lead_id {lead_id_type},
-        role TEXT NOT NULL, -- 'user', 'system', 'assistant'
-        content TEXT,
-        timestamp TIMESTAMP DEFAULT {timestamp_default},
-        FOREIGN KEY (lead_id) REFERENCES leads(id) ON DELETE CASCADE
-    );
-"""
-
-CREATE_INDEX_INTERACTIONS_LEAD_ID = "CREATE INDEX IF NOT EXISTS idx_interactions_lead_id ON interactions(lead_id);"
+# --- DDL ---
+# El schema vive en migrations/ (ver app/migrator.py)
 
 # --- DML: Operations ---
 
 INSERT_VISITOR = """
     INSERT INTO visitors (
         external_id, fbclid, ip_address, user_agent, source,
-        utm_source, utm_medium, utm_campaign, utm_term, utm_content
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        utm_source, utm_medium, utm_campaign, utm_term, utm_content, ref_tag
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Write-Behind: psycopg2.extras.execute_values expande el VALUES %s
+INSERT_VISITORS_BATCH = """
+    INSERT INTO visitors (
+        external_id, fbclid, ip_address, user_agent, source,
+        utm_source, utm_medium, utm_campaign, utm_term, utm_content, ref_tag
+    ) VALUES %s
 """
 
 UPSERT_CONTACT_SQLITE = """
@@ -168,14 +57,88 @@ UPSERT_CONTACT_POSTGRES = """
 
 SELECT_CONTACT_ID_BY_PHONE = "SELECT id FROM contacts WHERE whatsapp_number = %s"
 
-INSERT_MESSAGE = "INSERT INTO messages (contact_id, role, content) VALUES (%s, %s, %s)"
+# --- Conversation Log (conversation_events: una fila por turno) ---
+# Cada turno reserva el siguiente seq del contacto (contacts.last_event_seq);
+# el lock de fila del contacto serializa los turnos de una misma conversación.
+# seq es monótono pero puede tener huecos (un reintento deduplicado lo consume).
+
+INSERT_CONVERSATION_EVENT = """
+    INSERT INTO conversation_events (contact_id, seq, role, content, external_message_id)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (external_message_id) WHERE external_message_id IS NOT NULL DO NOTHING
+"""
+
+# contact_id en caché: sin filas si el contacto ya no existe
+APPEND_EVENT_BY_CONTACT_POSTGRES = """
+    WITH contact AS (
+        UPDATE contacts SET last_event_seq = last_event_seq + 1, last_interaction = NOW()
+        WHERE id = %s
+        RETURNING id, last_event_seq
+    )
+    INSERT INTO conversation_events (contact_id, seq, role, content)
+    SELECT id, last_event_seq, %s, %s FROM contact
+    RETURNING contact_id
+"""
+
+# Caché de contact_id vacío: crea/toca el contacto y agrega el turno en una sentencia
+APPEND_EVENT_BY_PHONE_POSTGRES = """
+    WITH contact AS (
+        INSERT INTO contacts (whatsapp_number, status, last_event_seq)
+        VALUES (%s, 'new', 1)
+        ON CONFLICT (whatsapp_number) DO UPDATE SET
+            last_event_seq = contacts.last_event_seq + 1,
+            last_interaction = NOW()
+        RETURNING id, last_event_seq
+    ), event AS (
+        INSERT INTO conversation_events (contact_id, seq, role, content)
+        SELECT id, last_event_seq, %s, %s FROM contact
+    )
+    SELECT id FROM contact
+"""
+
+# API por lead (log_interaction): el contacto se resuelve por el teléfono del lead.
+# Retorna el teléfono (para el historial en memoria); sin filas si el lead no existe
+APPEND_EVENT_BY_LEAD_POSTGRES = """
+    WITH contact AS (
+        INSERT INTO contacts (whatsapp_number, status, last_event_seq)
+        SELECT whatsapp_phone, 'new', 1 FROM leads WHERE id = %s
+        ON CONFLICT (whatsapp_number) DO UPDATE SET
+            last_event_seq = contacts.last_event_seq + 1,
+            last_interaction = NOW()
+        RETURNING id, whatsapp_number, last_event_seq
+    ), event AS (
+        INSERT INTO conversation_events (contact_id, seq, role, content)
+        SELECT id, last_event_seq, %s, %s FROM contact
+    )
+    SELECT whatsapp_number FROM contact
+"""
+
+# SQLite (sin CTEs que escriben): reservar seq y luego INSERT_CONVERSATION_EVENT
+NEXT_EVENT_SEQ_SQLITE = """
+    UPDATE contacts SET last_event_seq = last_event_seq + 1, last_interaction = CURRENT_TIMESTAMP
+    WHERE id = %s
+    RETURNING id, last_event_seq
+"""
+
+# SQLite: id generado por la app (repara contactos antiguos creados con id NULL)
+UPSERT_CONTACT_SEQ_SQLITE = """
+    INSERT INTO contacts (id, whatsapp_number, status, last_event_seq)
+    VALUES (%s, %s, 'new', 1)
+    ON CONFLICT(whatsapp_number) DO UPDATE SET
+        id = COALESCE(contacts.id, excluded.id),
+        last_event_seq = contacts.last_event_seq + 1,
+        last_interaction = CURRENT_TIMESTAMP
+    RETURNING id, last_event_seq
+"""
+
+SELECT_LEAD_PHONE = "SELECT whatsapp_phone FROM leads WHERE id = %s"
 
 SELECT_CHAT_HISTORY = """
-    SELECT m.role, m.content 
-    FROM messages m
-    JOIN contacts c ON m.contact_id = c.id
+    SELECT e.role, e.content
+    FROM conversation_events e
+    JOIN contacts c ON e.contact_id = c.id
     WHERE c.whatsapp_number = %s
-    ORDER BY m.created_at DESC
+    ORDER BY e.seq DESC
     LIMIT %s
 """
 
@@ -185,22 +148,144 @@ SELECT_RECENT_VISITORS = "SELECT id, external_id, source, timestamp, ip_address
 
 SELECT_VISITOR_BY_ID = "SELECT id, external_id, fbclid, source, timestamp FROM visitors WHERE id = %s"
 
+# --- Retención de visitantes (app/retention.py) ---
+
+# Resumen diario de las filas que van a expirar (días completos < corte)
+ROLLUP_VISITORS_DAILY = """
+    INSERT INTO visitor_daily_stats (day, source, utm_campaign, visits, unique_visitors, fbclid_visits)
+    SELECT
+        DATE(timestamp), COALESCE(source, ''), COALESCE(utm_campaign, ''),
+        COUNT(*), COUNT(DISTINCT external_id), COUNT(fbclid)
+    FROM visitors
+    WHERE timestamp < %s
+    GROUP BY DATE(timestamp), COALESCE(source, ''), COALESCE(utm_campaign, '')
+    ON CONFLICT (day, source, utm_campaign) DO UPDATE SET
+        visits = visitor_daily_stats.visits + EXCLUDED.visits,
+        unique_visitors = visitor_daily_stats.unique_visitors + EXCLUDED.unique_visitors,
+        fbclid_visits = visitor_daily_stats.fbclid_visits + EXCLUDED.fbclid_visits
+"""
+
+DELETE_VISITORS_BEFORE = "DELETE FROM visitors WHERE timestamp < %s"
+
+PRUNE_OUTBOX_APPLIED = "DELETE FROM outbox_applied WHERE applied_at < %s"
+
+SELECT_VISITOR_PARTITIONS = """
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'visitors'::regclass
+    ORDER BY c.relname
+"""
+
+ENSURE_VISITOR_PARTITIONS = """
+    SELECT ensure_visitor_partitions(
+        CAST(date_trunc('month', CURRENT_TIMESTAMP) AS DATE),
+        CAST(date_trunc('month', CURRENT_TIMESTAMP) + %s * INTERVAL '1 month' AS DATE)
+    )
+"""
+
+# --- Migración de visitors a particiones (python -m app.retention partition-visitors) ---
+
+# (copia pendiente, tabla vieja sin borrar)
+SELECT_VISITOR_MIGRATION_STATE = """
+    SELECT to_regclass('visitors_partitioned') IS NOT NULL, to_regclass('visitors_legacy') IS NOT NULL
+"""
+
+# Las visitas nuevas siguen entrando a visitors: MAX(id) copiado = punto de reanudación
+SELECT_VISITORS_BACKFILL_START = """
+    SELECT
+        (SELECT MIN(timestamp) FROM visitors),
+        (SELECT COALESCE(MAX(id), 0) FROM visitors_partitioned)
+"""
+
+ENSURE_VISITOR_PARTITIONS_SINCE = "SELECT ensure_visitor_partitions(%s, CAST(CURRENT_TIMESTAMP AS DATE))"
+
+# Un lote por rango de ids (índice de la PK, transacción corta)
+BACKFILL_VISITORS_CHUNK = """
+    WITH chunk AS (
+        SELECT
+            id, external_id, fbclid, ip_address, user_agent, source,
+            utm_source, utm_medium, utm_campaign, utm_term, utm_content, ref_tag,
+            COALESCE(timestamp, CURRENT_TIMESTAMP) AS timestamp
+        FROM visitors
+        WHERE id > %s
+        ORDER BY id
+        LIMIT %s
+    ), copied AS (
+        INSERT INTO visitors_partitioned (
+            id, external_id, fbclid, ip_address, user_agent, source,
+            utm_source, utm_medium, utm_campaign, utm_term, utm_content, ref_tag, timestamp
+        )
+        SELECT * FROM chunk
+    )
+    SELECT COUNT(*), MAX(id) FROM chunk
+"""
+
+# Cambio de nombre (con visitors bloqueada): la tabla vieja queda como visitors_legacy
+SWAP_VISITORS_PARTITIONED = """
+    ALTER SEQUENCE visitors_id_seq OWNED BY NONE;
+    ALTER TABLE visitors RENAME TO visitors_legacy;
+    ALTER INDEX IF EXISTS visitors_pkey RENAME TO visitors_legacy_pkey;
+    ALTER INDEX IF EXISTS idx_visitors_external_id RENAME TO idx_visitors_legacy_external_id;
+    ALTER INDEX IF EXISTS idx_visitors_external_fbclid RENAME TO idx_visitors_legacy_external_fbclid;
+    ALTER INDEX IF EXISTS idx_visitors_timestamp RENAME TO idx_visitors_legacy_timestamp;
+    ALTER INDEX IF EXISTS idx_visitors_ref_tag RENAME TO idx_visitors_legacy_ref_tag;
+    ALTER TABLE visitors_partitioned RENAME TO visitors;
+    ALTER INDEX visitors_partitioned_pkey RENAME TO visitors_pkey;
+    ALTER INDEX idx_visitors_part_external_id RENAME TO idx_visitors_external_id;
+    ALTER INDEX idx_visitors_part_external_fbclid RENAME TO idx_visitors_external_fbclid;
+    ALTER INDEX idx_visitors_part_timestamp RENAME TO idx_visitors_timestamp;
+    ALTER INDEX idx_visitors_part_ref_tag RENAME TO idx_visitors_ref_tag;
+    ALTER SEQUENCE visitors_id_seq OWNED BY visitors.id;
+"""
+
+# --- Backfill de visitors.ref_tag (python -m app.retention backfill-ref-tags) ---
+
+SELECT_VISITOR_ID_CHUNK = """
+    SELECT COUNT(*), MAX(id) FROM (
+        SELECT id FROM visitors WHERE id > %s ORDER BY id LIMIT %s
+    ) chunk
+"""
+
+BACKFILL_REF_TAGS = """
+    UPDATE visitors
+    SET ref_tag = substr(external_id, 1, 8)
+    WHERE id > %s AND id <= %s AND ref_tag IS NULL AND external_id IS NOT NULL
+"""
+
+# Filas de visitors_legacy que no llegaron a visitors (NULL = sin corte de retención)
+COUNT_VISITORS_NOT_MIGRATED = """
+    SELECT COUNT(*)
+    FROM visitors_legacy l
+    WHERE (CAST(%s AS TIMESTAMP) IS NULL OR l.timestamp >= CAST(%s AS TIMESTAMP))
+      AND NOT EXISTS (SELECT 1 FROM visitors v WHERE v.id = l.id)
+"""
+
 # --- Operations: Leads (W-003) ---
 
 UPDATE_LEAD_SENT_FLAG = "UPDATE contacts SET conversion_sent_to_meta = TRUE WHERE whatsapp_number = %s"
 
-COUNT_USER_MESSAGES = """
-    SELECT COUNT(*) FROM messages m
-    JOIN contacts c ON m.contact_id = c.id
-    WHERE c.whatsapp_number = %s AND m.role = 'user'
+# Contadores mantenidos por trigger en cada INSERT/DELETE de conversation_events (migración 0008)
+SELECT_MESSAGE_COUNTERS = """
+    SELECT user_message_count, assistant_message_count, last_user_message_at
+    FROM contacts
+    WHERE whatsapp_number = %s
 """
 
 CHECK_LEAD_SENT_FLAG = "SELECT conversion_sent_to_meta FROM contacts WHERE whatsapp_number = %s"
 
 SELECT_META_DATA_BY_REF = """
     SELECT fbclid, user_agent, ip_address, utm_source, utm_medium, utm_campaign
-    FROM visitors 
-    WHERE external_id LIKE %s 
+    FROM visitors
+    WHERE ref_tag = %s
+    ORDER BY timestamp DESC LIMIT 1
+"""
+
+# Visitas previas a 0003 aún sin ref_tag (backfill pendiente): prefijo de external_id
+SELECT_META_DATA_BY_REF_PREFIX = """
+    SELECT fbclid, user_agent, ip_address, utm_source, utm_medium, utm_campaign
+    FROM visitors
+    WHERE ref_tag IS NULL AND external_id LIKE %s
     ORDER BY timestamp DESC LIMIT 1
 """
 
@@ -227,7 +312,48 @@ INSERT_LEAD_SQLITE = """
     VALUES (%s, %s, %s, %s, %s, %s)
 """
 
-INSERT_INTERACTION = "INSERT INTO interactions (lead_id, role, content) VALUES (%s, %s, %s)"
+# Ingesta de mensaje entrante en un solo viaje: upsert del lead + turno del usuario.
+# xmax = 0 solo en filas recién insertadas (en un UPDATE por conflicto es el xid actual).
+# Un reintento del webhook (mismo id de Evolution) no agrega un segundo turno.
+INGEST_INBOUND_POSTGRES = """
+    WITH lead AS (
+        INSERT INTO leads (whatsapp_phone, meta_lead_id, click_id, email, name)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (whatsapp_phone) DO UPDATE SET
+            meta_lead_id = COALESCE(EXCLUDED.meta_lead_id, leads.meta_lead_id),
+            click_id = COALESCE(EXCLUDED.click_id, leads.click_id),
+            email = COALESCE(EXCLUDED.email, leads.email),
+            name = COALESCE(EXCLUDED.name, leads.name),
+            last_interaction = CURRENT_TIMESTAMP
+        RETURNING id, whatsapp_phone, (xmax = 0) AS is_new
+    ), contact AS (
+        INSERT INTO contacts (whatsapp_number, status, last_event_seq)
+        SELECT whatsapp_phone, 'new', 1 FROM lead
+        ON CONFLICT (whatsapp_number) DO UPDATE SET
+            last_event_seq = contacts.last_event_seq + 1,
+            last_interaction = NOW()
+        RETURNING id, last_event_seq
+    ), event AS (
+        INSERT INTO conversation_events (contact_id, seq, role, content, external_message_id)
+        SELECT id, last_event_seq, %s, %s, %s FROM contact
+        ON CONFLICT (external_message_id) WHERE external_message_id IS NOT NULL DO NOTHING
+        RETURNING id
+    )
+    SELECT id, is_new, EXISTS (SELECT 1 FROM event) AS appended FROM lead
+"""
+
+# SQLite: el id lo genera la app; si vuelve otro id, el lead ya existía
+UPSERT_LEAD_RETURNING_SQLITE = """
+    INSERT INTO leads (id, whatsapp_phone, meta_lead_id, click_id, email, name)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT(whatsapp_phone) DO UPDATE SET
+        meta_lead_id = COALESCE(excluded.meta_lead_id, leads.meta_lead_id),
+        click_id = COALESCE(excluded.click_id, leads.click_id),
+        email = COALESCE(excluded.email, leads.email),
+        name = COALESCE(excluded.name, leads.name),
+        last_interaction = CURRENT_TIMESTAMP
+    RETURNING id
+"""
 
 # --- Knowledge Base ---
 
@@ -247,3 +373,16 @@ UPSERT_KNOWLEDGE_SQLITE = """
         content = EXCLUDED.content,
         category = EXCLUDED.category;
 """
+
+SELECT_KNOWLEDGE_BASE = "SELECT slug, category, content FROM business_knowledge"
+
+SELECT_KNOWLEDGE_BY_CATEGORY = "SELECT slug, category, content FROM business_knowledge WHERE category = %s"
+
+SELECT_AGENT_PROMPT = "SELECT system_prompt FROM agent_prompts WHERE role_id = %s AND is_active = TRUE"
+
+# Watermark de los cachés de conocimiento: filas + último updated_at por tabla
+SELECT_KNOWLEDGE_VERSION = """
+    SELECT
+        (SELECT COUNT(*) || ':' || COALESCE(CAST(MAX(updated_at) AS TEXT), '') FROM business_knowledge),
+        (SELECT COUNT(*) || ':' || COALESCE(CAST(MAX(updated_at) AS TEXT), '') FROM agent_prompts)
+"""
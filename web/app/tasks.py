@@ -30,6 +30,12 @@ def save_visitor_task(self, external_id, fbclid, client_ip, user_agent, source,
         logger.error(f"❌ Error saving visitor: {e}")
         raise self.retry(exc=e)
 
+@celery_app.task(name="visitor_retention_task")
+def visitor_retention_task():
+    """Rollup diario + retención de visitors (programado en celery beat)"""
+    from app.retention import run_retention
+    return run_retention()
+
 # =================================================================
 # EXTERNAL API TASKS
 # =================================================================
@@ -2,14 +2,21 @@
 # TRACKING.PY - Meta Conversions API (CAPI) - High Performance
 # Jorge Aguirre Flores Web
 # =================================================================
-import hashlib
 import time
 import httpx
 import asyncio
-from typing import Optional, Dict, Any
+import threading
+from concurrent.futures import Future
+from typing import Optional, Dict, Any, List
 import logging
 
+from app import metrics
+from app.capi_dispatcher import FAILED, SENT, CapiDispatcher, classify_response, is_batch_rejection, retry_after
 from app.config import settings
+from app.delivery_queue import DeliveryQueue, DeliveryWorker, Outcome, RateLimited
+from app.event_dedup import EventDeduplicator
+from app.hashing import PII_KEY, generate_external_id, hash_events, hash_value
+from app.hashing import cache_stats as hash_cache_stats
 
 logger = logging.getLogger(__name__)
 
@@ -20,24 +27,24 @@ logger = logging.getLogger(__name__)
 timeout = httpx.Timeout(10.0, connect=5.0)
 sync_client = httpx.Client(timeout=timeout, http2=True)
 
-# Async client for FastAPI routes (future proofing)
+# Async client for FastAPI routes: one shared HTTP/2 pool for the event loop
 async_client = httpx.AsyncClient(timeout=timeout, http2=True)
 
+# Tope de envíos async en vuelo: un destino lento encola corrutinas, no agota hilos
+_send_slots = asyncio.Semaphore(settings.TRACKING_MAX_CONCURRENT_SENDS)
+
+# Espera máxima de send_event por su lote (deadline del lote + POST con reintento de bisección)
+SEND_RESULT_TIMEOUT = 30.0
+
 # =================================================================
 # HASHING FUNCTIONS
 # =================================================================
 
+# Normalización + SHA-256 memoizados en app/hashing.py (generate_external_id también)
+
 def hash_data(value: str) -> Optional[str]:
     """Hash SHA256 for user data (Meta requirement)"""
-    if not value:
-        return None
-    return hashlib.sha256(value.lower().strip().encode('utf-8')).hexdigest()
-
-
-def generate_external_id(ip: str, user_agent: str) -> str:
-    """Generate deterministic ID based on IP + UA"""
-    combined = f"{ip}_{user_agent}"
-    return hashlib.sha256(combined.encode('utf-8')).hexdigest()[:32]
+    return hash_value(value, "external_id")
 
 
 def generate_fbc(fbclid: str) -> Optional[str]:
@@ -63,7 +70,7 @@ def extract_fbclid_from_fbc(fbc_cookie: str) -> Optional[str]:
 # META CONVERSIONS API (CORE LOGIC)
 # =================================================================
 
-def _build_payload(
+def _build_event(
     event_name: str,
     event_source_url: str,
     client_ip: str,
@@ -76,7 +83,7 @@ def _build_payload(
     email: Optional[str] = None,
     custom_data: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
-    """Constructs the JSON payload for Meta CAPI"""
+    """Constructs one entry of the CAPI `data` array (identifiers hashed later, per batch)"""
     
     # User Data
     user_data = {
@@ -84,17 +91,10 @@ def _build_payload(
         "client_user_agent": user_agent,
     }
     
-    if external_id:
-        user_data["external_id"] = hash_data(external_id)
     if fbclid:
         user_data["fbc"] = generate_fbc(fbclid)
     if fbp:
         user_data["fbp"] = fbp
-    if phone:
-        clean_phone = "".join(filter(str.isdigit, phone))
-        user_data["ph"] = hash_data(clean_phone)
-    if email:
-        user_data["em"] = hash_data(email)
     
     # Event Data
     event_data = {
@@ -109,9 +109,19 @@ def _build_payload(
     if custom_data:
         event_data["custom_data"] = custom_data
     
-    # Wrapper
+    # Crudos: hash_events() los normaliza y hashea en el hilo del dispatcher
+    pii = {"external_id": external_id, "ph": phone, "em": email}
+    pii = {kind: value for kind, value in pii.items() if value}
+    if pii:
+        event_data[PII_KEY] = pii
+    
+    return event_data
+
+
+def _wrap_events(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Request body for a batch of events (max 1000 per POST)"""
     payload = {
-        "data": [event_data],
+        "data": events,
         "access_token": settings.META_ACCESS_TOKEN
     }
     
@@ -120,11 +130,146 @@ def _build_payload(
         
     return payload
 
+
+def _build_payload(*args, **kwargs) -> Dict[str, Any]:
+    """Constructs the JSON payload for Meta CAPI (single event)"""
+    return _wrap_events(hash_events([_build_event(*args, **kwargs)]))
+
+
+# =================================================================
+# BATCH DISPATCHER (Un POST por lote en vez de uno por evento)
+# =================================================================
+
+capi_dispatcher = CapiDispatcher(
+    _wrap_events,
+    max_events=settings.CAPI_BATCH_MAX_EVENTS,
+    max_latency=settings.CAPI_BATCH_FLUSH_MS / 1000,
+    max_pending=settings.CAPI_QUEUE_MAX_EVENTS,
+    on_retry=lambda events, error, delay: schedule_retry("meta_capi", events, error, delay),
+    prepare_fn=hash_events,
+)
+
+# (event_name, event_id) ya enviados o en vuelo: las copias no llegan al dispatcher
+event_dedup = EventDeduplicator(
+    maxsize=settings.CAPI_DEDUP_CACHE_SIZE,
+    ttl=settings.CAPI_DEDUP_TTL_SECONDS,
+    redis_url=settings.CAPI_DEDUP_REDIS_URL,
+)
+
+
+# =================================================================
+# DELIVERY RETRIES (Cola durable local, sin Celery / Redis)
+# =================================================================
+
+_delivery_worker: Optional[DeliveryWorker] = None
+_delivery_lock = threading.Lock()
+
+
+def _redeliver_meta_events(events: List[Dict[str, Any]]) -> List[Outcome]:
+    """Reenvía un lote de eventos CAPI vencidos (hilo del worker)"""
+    response = sync_client.post(settings.meta_api_url, json=_wrap_events(events))
+    verdict = classify_response(response)
+    if verdict == "ok":
+        return [Outcome(True)] * len(events)
+    if verdict == "rate_limited":
+        raise RateLimited(retry_after(response), response.text[:200])
+    if verdict == "invalid" and len(events) > 1 and is_batch_rejection(response):
+        middle = len(events) // 2
+        first = _redeliver_meta_events(events[:middle])
+        try:
+            return first + _redeliver_meta_events(events[middle:])
+        except RateLimited as e:
+            # La primera mitad ya salió: no se pierde su resultado
+            raise RateLimited(e.retry_after, str(e), first + e.outcomes)
+    return [Outcome(False, f"HTTP {response.status_code}: {response.text}", verdict == "invalid")] * len(events)
+
+
+def _redeliver_n8n(payloads: List[Dict[str, Any]]) -> List[Outcome]:
+    outcomes = []
+    for payload in payloads:
+        try:
+            response = sync_client.post(settings.N8N_WEBHOOK_URL, json=payload)
+        except Exception as e:
+            outcomes.append(Outcome(False, f"{type(e).__name__}: {e}"))
+            continue
+        if response.status_code == 429:
+            # n8n no deduplica: lo ya entregado en este lote no debe reenviarse
+            raise RateLimited(retry_after(response), outcomes=outcomes)
+        outcomes.append(Outcome(response.is_success, f"HTTP {response.status_code}"))
+    return outcomes
+
+
+def _get_delivery_worker() -> DeliveryWorker:
+    global _delivery_worker
+    from app.database import get_deliveries_path
+    with _delivery_lock:
+        if _delivery_worker is None:
+            queue = DeliveryQueue(
+                get_deliveries_path(),
+                max_attempts=settings.DELIVERY_MAX_ATTEMPTS,
+                base_delay=settings.DELIVERY_BACKOFF_BASE_SECONDS,
+                max_delay=settings.DELIVERY_BACKOFF_MAX_SECONDS,
+            )
+            _delivery_worker = DeliveryWorker(
+                queue,
+                {"meta_capi": _redeliver_meta_events, "n8n": _redeliver_n8n},
+                batch_size=min(settings.DELIVERY_BATCH_SIZE, 1000),
+                interval=settings.DELIVERY_RETRY_INTERVAL_SECONDS,
+            )
+        _delivery_worker.start()
+        return _delivery_worker
+
+
+def schedule_retry(target: str, payloads: List[Dict[str, Any]], error: str = "", delay: Optional[float] = None) -> bool:
+    """Anota entregas fallidas en la cola durable; el worker las reenvía con backoff"""
+    if not settings.DELIVERY_RETRY_ENABLED:
+        return False
+    try:
+        _get_delivery_worker().queue.append(target, payloads, error, delay)
+    except Exception as e:
+        logger.error(f"❌ Cola de reintentos no disponible ({target}): {e}")
+        return False
+    logger.warning(f"📮 {len(payloads)} entrega(s) '{target}' en cola de reintentos")
+    return True
+
+
+def start_delivery_retries():
+    """Lifespan startup: retoma lo que quedó pendiente en deliveries.db"""
+    if not settings.DELIVERY_RETRY_ENABLED:
+        return
+    try:
+        _get_delivery_worker()
+    except Exception as e:
+        logger.error(f"❌ Cola de reintentos no disponible: {e}")
+
+
+def close_delivery_queue():
+    """Lifespan shutdown: lo pendiente queda en deliveries.db para el próximo arranque"""
+    global _delivery_worker
+    with _delivery_lock:
+        worker, _delivery_worker = _delivery_worker, None
+    if worker is not None:
+        worker.stop()
+        worker.queue.close()
+
+
+def _collect_gauges() -> Dict[str, float]:
+    gauges = {"meta_capi_queue_pending": capi_dispatcher.stats()["pending"]}
+    gauges.update({f"meta_capi_dedup_{k}": v for k, v in event_dedup.stats().items()})
+    gauges.update({f"meta_capi_hash_cache_{k}": v for k, v in hash_cache_stats().items()})
+    if _delivery_worker is not None:
+        gauges.update({f"delivery_queue_{k}": v for k, v in _delivery_worker.stats().items()})
+    return gauges
+
+
+metrics.register_gauges(_collect_gauges)
+
+
 # =================================================================
 # SYNC VS ASYNC SENDERS
 # =================================================================
 
-def send_event(
+def enqueue_event(
     event_name: str,
     event_source_url: str,
     client_ip: str,
@@ -136,66 +281,56 @@ def send_event(
     phone: Optional[str] = None,
     email: Optional[str] = None,
     custom_data: Optional[Dict[str, Any]] = None
-) -> bool:
-    """Synchronous Sender (For Celery Tasks) - Uses Persistent Connection Pooling"""
-    
-    # Sandbox Check
+) -> Future:
+    """Fire-and-forget Sender (Page views / Background Tasks) - Future[SENT | QUEUED | FAILED] per event"""
+
     if settings.META_SANDBOX_MODE:
         logger.info(f"🛡️ [SANDBOX] Intercepted {event_name}")
-        return True
+        future: Future = Future()
+        future.set_result(SENT)
+        return future
+
+    if not event_dedup.claim(event_name, event_id):
+        # Duplicado (navegador + Celery + n8n): ya enviado o en vuelo, sin armar payload
+        logger.debug(f"[META CAPI] ♻️ Duplicate {event_name} {event_id} skipped")
+        future = Future()
+        future.set_result(SENT)
+        return future
 
-    payload = _build_payload(
+    event = _build_event(
         event_name, event_source_url, client_ip, user_agent, event_id,
         fbclid, fbp, external_id, phone, email, custom_data
     )
+    future = capi_dispatcher.submit(event)
+
+    def release_if_failed(done: Future):
+        # QUEUED conserva la clave: la entrega ya es de la cola de reintentos
+        if done.result() == FAILED:
+            event_dedup.release(event_name, event_id)
 
+    future.add_done_callback(release_if_failed)
+    return future
+
+
+def send_event(*args, **kwargs) -> bool:
+    """
+    Synchronous Sender (For Celery Tasks) - Waits for its batch result.
+    True si Meta lo aceptó o quedó en la cola de reintentos (no hay que reenviarlo).
+    """
+    future = enqueue_event(*args, **kwargs)
     try:
-        response = sync_client.post(settings.meta_api_url, json=payload)
-        
-        if response.status_code == 200:
-            logger.info(f"[META CAPI] ✅ {event_name} sent via HTTP/2")
-            return True
-        else:
-            logger.warning(f"[META CAPI] ⚠️ {event_name} Failed: {response.text}")
-            return False
+        return future.result(timeout=SEND_RESULT_TIMEOUT) != FAILED
     except Exception as e:
         logger.error(f"[META CAPI] ❌ Error: {e}")
         return False
 
 
-async def send_event_async(
-    event_name: str,
-    event_source_url: str,
-    client_ip: str,
-    user_agent: str,
-    event_id: str,
-    fbclid: Optional[str] = None,
-    fbp: Optional[str] = None,
-    external_id: Optional[str] = None,
-    phone: Optional[str] = None,
-    email: Optional[str] = None,
-    custom_data: Optional[Dict[str, Any]] = None
-) -> bool:
+async def send_event_async(*args, **kwargs) -> bool:
     """Asynchronous Sender (For FastAPI Routes) - Non-Blocking"""
-
-    if settings.META_SANDBOX_MODE:
-        logger.info(f"🛡️ [SANDBOX ASYNC] Intercepted {event_name}")
-        return True
-
-    payload = _build_payload(
-        event_name, event_source_url, client_ip, user_agent, event_id,
-        fbclid, fbp, external_id, phone, email, custom_data
-    )
-
+    future = enqueue_event(*args, **kwargs)
     try:
-        response = await async_client.post(settings.meta_api_url, json=payload)
-        
-        if response.status_code == 200:
-            logger.info(f"[META CAPI ASYNC] ✅ {event_name} sent via HTTP/2")
-            return True
-        else:
-            logger.warning(f"[META CAPI ASYNC] ⚠️ {event_name} Failed: {response.text}")
-            return False
+        # Solo espera su lote: no ocupa hilo ni conexión (el dispatcher hace el POST)
+        return await asyncio.wait_for(asyncio.wrap_future(future), SEND_RESULT_TIMEOUT) != FAILED
     except Exception as e:
         logger.error(f"[META CAPI ASYNC] ❌ Error: {e}")
         return False
@@ -220,6 +355,26 @@ def send_n8n_webhook(event_data: Dict[str, Any]) -> bool:
     return False
 
 
+async def send_n8n_webhook_async(event_data: Dict[str, Any]) -> bool:
+    """Async Webhook for n8n (FastAPI Background Tasks) - Runs on the event loop"""
+    if not settings.N8N_WEBHOOK_URL:
+        return False
+
+    try:
+        async with _send_slots:
+            response = await async_client.post(settings.N8N_WEBHOOK_URL, json=event_data)
+        if response.status_code == 200:
+            logger.info(f"✅ n8n Webhook sent via HTTP/2")
+            return True
+        error = f"HTTP {response.status_code}"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    logger.warning(f"⚠️ n8n Error: {error}")
+    # El request no espera reintentos: la cola durable los hace en segundo plano
+    await asyncio.to_thread(schedule_retry, "n8n", [event_data], error)
+    return False
+
+
 # =================================================================
 # API SHORTCUTS (Sync by default for now, can add async later)
 # =================================================================
@@ -0,0 +1,124 @@
+# =================================================================
+# WRITE_BUFFER.PY - Buffer Write-Behind (Inserciones por Lotes)
+# Jorge Aguirre Flores Web
+# =================================================================
+#
+# Acumula filas en memoria y las entrega a `flush_fn` en lote:
+# - cuando se juntan `max_rows` filas, o
+# - cuando la fila más antigua lleva `flush_interval` segundos esperando.
+# Un hilo daemon hace el flush; close() vacía lo pendiente (shutdown).
+# =================================================================
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Buffer thread-safe con flush por tamaño o por latencia"""
+
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[List[Sequence[Any]]], None],
+        max_rows: int = 200,
+        flush_interval: float = 0.5,
+    ):
+        self.name = name
+        self._flush_fn = flush_fn
+        self.max_rows = max(1, max_rows)
+        self.flush_interval = flush_interval
+
+        self._cond = threading.Condition()
+        self._rows: List[Sequence[Any]] = []
+        self._oldest_at = 0.0
+        self._thread = None
+        self._closed = False
+
+        # Estadísticas
+        self._enqueued = 0
+        self._flushed = 0
+        self._failed = 0
+        self._batches = 0
+
+    def add(self, row: Sequence[Any]):
+        """Encola una fila (no bloquea por I/O)"""
+        with self._cond:
+            if self._closed:
+                inline = True
+            else:
+                inline = False
+                if not self._rows:
+                    self._oldest_at = time.monotonic()
+                self._rows.append(row)
+                self._enqueued += 1
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name=f"write-behind-{self.name}", daemon=True
+                    )
+                    self._thread.start()
+                if len(self._rows) >= self.max_rows:
+                    self._cond.notify()
+
+        if inline:
+            # Después del shutdown: escritura directa
+            with self._cond:
+                self._enqueued += 1
+            self._flush([row])
+
+    def flush(self):
+        """Vacía el buffer ahora mismo en el hilo que llama"""
+        with self._cond:
+            batch, self._rows = self._rows, []
+        if batch:
+            self._flush(batch)
+
+    def close(self, timeout: float = 5.0):
+        """Detiene el hilo y vacía lo pendiente (lifespan shutdown)"""
+        with self._cond:
+            self._closed = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": len(self._rows),
+                "enqueued": self._enqueued,
+                "flushed": self._flushed,
+                "failed": self._failed,
+                "batches": self._batches,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._rows and not self._closed:
+                    self._cond.wait()
+                while not self._closed and len(self._rows) < self.max_rows:
+                    remaining = self._oldest_at + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._rows = self._rows, []
+                closed = self._closed
+            if batch:
+                self._flush(batch)
+            if closed:
+                return
+
+    def _flush(self, batch: List[Sequence[Any]]):
+        try:
+            self._flush_fn(batch)
+            with self._cond:
+                self._flushed += len(batch)
+                self._batches += 1
+        except Exception as e:
+            with self._cond:
+                self._failed += len(batch)
+            logger.error(f"❌ Write-behind '{self.name}' perdió {len(batch)} filas: {e}")
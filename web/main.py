@@ -17,6 +17,7 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import ORJSONResponse
 from fastapi.middleware.gzip import GZipMiddleware
 import uvicorn
+import asyncio
 import logging
 import gc
 import os
@@ -24,6 +25,7 @@ import os
 # Módulos internos
 from app.config import settings
 from app import database
+from app import tracking
 from app.routes import pages, tracking_routes, admin, health
 
 # Configurar logging
@@ -51,6 +53,7 @@ async def lifespan(app: FastAPI):
     else:
         logger.info("ℹ️ Ejecutando sin base de datos")
     
+    tracking.start_delivery_retries()  # Reintentos CAPI / n8n pendientes del proceso anterior
     logger.info(f"📊 Meta Pixel ID: {settings.META_PIXEL_ID}")
     logger.info(f"🌐 Servidor listo en http://{settings.HOST}:{settings.PORT}")
     
@@ -58,6 +61,11 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("🛑 Deteniendo servidor...")
+    # Llamadas bloqueantes fuera del event loop
+    await asyncio.to_thread(tracking.capi_dispatcher.close)  # Eventos CAPI en cola salen en un último lote
+    await asyncio.to_thread(tracking.close_delivery_queue)  # Reintentos pendientes quedan en deliveries.db
+    await tracking.async_client.aclose()
+    await asyncio.to_thread(database.shutdown)  # Flush del write-behind + cierre del pool
     gc.collect()  # Force garbage collection on shutdown
 
 
@@ -132,7 +140,7 @@ app.include_router(tracking_routes.router)
 # Panel de administración (/admin/*)
 app.include_router(admin.router)
 
-# Health checks (/health, /ping)
+# Health checks (/health, /ping, /metrics)
 app.include_router(health.router)
 
 # Chat routes (Evolution/Natalia) moved to separate microservice